@@ -1,13 +1,14 @@
 DEPS = [
   'infra/gerrit',
   'infra/git',
+  'infra/jiri',
   'recipe_engine/context',
   'recipe_engine/json',
   'recipe_engine/path',
   'recipe_engine/properties',
+  'recipe_engine/python',
   'recipe_engine/raw_io',
   'recipe_engine/step',
-  'recipe_engine/time',
   'recipe_engine/url',
 ]
 
@@ -20,5 +21,8 @@ PROPERTIES = {
                                 help='The total amount of seconds to spend polling before timing out'),
   'poll_interval_secs': Property(kind=Single((float, int)),
                                  default=5*60,
-                                 help='The interval at which to poll in seconds'),
+                                 help='The interval after the first poll in seconds'),
+  'poll_max_interval_secs': Property(kind=Single((float, int)),
+                                     default=15*60,
+                                     help='The longest interval between polls in seconds'),
 }
@@ -4,9 +4,23 @@
 
 from recipe_engine import recipe_api
 
+import collections
+
 
 UPSTREAM_REF = 'master'
 
+# ManifestRoll describes a roll of some <project>s and <import>s in a jiri
+# manifest, which several of can be landed in a single change.
+#
+# Properties:
+#   name (str): A short name for the roll (e.g. the project being rolled).
+#   manifest (str): Path to the manifest to edit, relative to the repository.
+#   projects (seq): The <project>s to roll, as for JiriApi.edit_manifest.
+#   imports (seq): The <import>s to roll, as for JiriApi.edit_manifest.
+#   message (str): The commit message for the roll on its own.
+ManifestRoll = collections.namedtuple(
+    'ManifestRoll', 'name manifest projects imports message')
+
 
 class CQResult(object):
   """Represents the result of waiting for CQ to complete."""
@@ -24,25 +38,39 @@ class CQResult(object):
 class AutoRollerApi(recipe_api.RecipeApi):
   """API for writing auto-roller recipes."""
 
-  def __init__(self, poll_interval_secs, poll_timeout_secs, *args, **kwargs):
-    # poll_interval_secs and poll_timeout_secs are input properties which come
-    # from __init__.PROPERTIES in this directory.
+  ManifestRoll = ManifestRoll
+
+  def __init__(self, poll_interval_secs, poll_max_interval_secs,
+               poll_timeout_secs, *args, **kwargs):
+    # poll_interval_secs, poll_max_interval_secs and poll_timeout_secs are input
+    # properties which come from __init__.PROPERTIES in this directory.
     super(AutoRollerApi, self).__init__(*args, **kwargs)
     # The name of the link to the Gerrit change created for a roll.  This is
     # displayed in the CQ failure error message to help others understand where
     # to look when debugging failed rolls.
     self._gerrit_link_name = 'gerrit link'
     self._poll_interval_secs = poll_interval_secs
+    self._poll_max_interval_secs = poll_max_interval_secs
     self._poll_timeout_secs = poll_timeout_secs
 
   @property
   def poll_interval_secs(self):
-    """Returns how many seconds roll() will wait in between each poll.
+    """Returns how many seconds roll() will wait after the first poll.
+
+    The interval doubles after each poll, up to poll_max_interval_secs.
 
     Defined by the input property with the same name.
     """
     return self._poll_interval_secs
 
+  @property
+  def poll_max_interval_secs(self):
+    """Returns the most seconds roll() will wait in between two polls.
+
+    Defined by the input property with the same name.
+    """
+    return max(self._poll_max_interval_secs, self._poll_interval_secs)
+
   @property
   def poll_timeout_secs(self):
     """Returns how many seconds roll() will poll for.
@@ -161,63 +189,33 @@ class AutoRollerApi(recipe_api.RecipeApi):
   def _wait_for_cq(self, change_id, dry_run):
     """Polls gerrit to see if CQ was successful.
 
+    All of the polls happen within a single step, backing off exponentially
+    with some jitter; the step's log shows the timeline of the polls. See
+    resources/wait_for_cq.py for how the labels of the change are interpreted.
+
     Returns a CQResult representing the status of CQ.
     """
-    # TODO(mknyszek): Figure out a cleaner solution than polling.
-    for i in range(int(self.poll_timeout_secs/self.poll_interval_secs)):
-      # Check the status of the CL.
-      with self.m.context(infra_steps=True):
-        change = self.m.gerrit.change_details('check if done (%d)' % i, change_id)
-
-      # If the CQ label is un-set, then that means either:
-      # * CQ failed (production mode), or
-      # * CQ finished (dry-run mode).
-      #
-      # 'recommended' and 'approved' are objects that appear for a label if
-      # somebody gave the label a positive vote (maximum vote (+2) for approved,
-      # non-maximum (+1) for 'recommended') and contains the information of one
-      # reviewer who gave this vote. There are 4 different states for a label in
-      # this sense: 'rejected', 'approved', 'disliked', and 'recommended'. For a
-      # given label, only one of these will be shown if the label has any votes
-      # in priority order 'rejected' > 'approved' > 'disliked' > 'recommended'.
-      # Unfortunately, this is the absolute simplest way to check this. Gerrit
-      # provides an 'all' field that contains every vote, but iterating over
-      # every vote, or operating under the assumption that there's at least one
-      # causes more error cases.
-      #
-      # Read more at:
-      # https://gerrit-review.googlesource.com/Documentation/rest-self.m-changes.html#get-change-detail
-
-      # In dry-run mode...
-      if dry_run:
-        # If CQ drops the CQ+1 label (i.e. 'recommended' state), then that means
-        # CQ finished trying. CQ will always remove the CQ+1 label when it's
-        # finished, regardless of success or failure.
-        if 'recommended' not in change['labels']['Commit-Queue']:
-          return CQResult.SUCCESS
-
-      # In production mode...
-      else:
-        # If it merged, we're done!
-        if change['status'] == 'MERGED':
-          return CQResult.SUCCESS
-
-        # If CQ drops the CQ+2 label at any point (i.e. 'approved' state), then
-        # that always means CQ has failed. CQ will always remove the CQ+2 label
-        # when it fails, and it will never remove it on success.
-        #
-        # Note: Because CQ won't unset the the CQ+2 label when it merges, there's
-        # no chance that we might see that the CL hasn't merged with the CQ+2
-        # label unset on a successful CQ.
-        if 'approved' not in change['labels']['Commit-Queue']:
-          return CQResult.FAILURE
-
-      # If none of the terminal conditions above were reached (that is, there were
-      # no label changes from what we initially set, and the change has not
-      # merged), then we should wait for |poll_interval_secs| before trying again.
-      self.m.time.sleep(self.poll_interval_secs)
-
-    return CQResult.TIMEOUT
+    args = [
+        '--gerrit', self.m.gerrit.gerrit_path,
+        '--host', self.m.gerrit.host,
+        '--change-id', change_id,
+        '--interval', self.poll_interval_secs,
+        '--max-interval', self.poll_max_interval_secs,
+        '--timeout', self.poll_timeout_secs,
+        '--json-output', self.m.json.output(),
+    ]
+    if dry_run:
+      args.append('--dry-run')
+    with self.m.context(infra_steps=True):
+      step_result = self.m.python(
+          'wait for CQ', self.resource('wait_for_cq.py'), args=args)
+    # The change has moved on since any details the gerrit module fetched.
+    self.m.gerrit.invalidate_change_details(change_id)
+
+    output = step_result.json.output
+    step_result.presentation.step_text = '%s after %d polls' % (
+        output['result'].lower(), output['polls'])
+    return getattr(CQResult, output['result'])
 
   def attempt_roll(self, gerrit_project, repo_dir, commit_message, commit_untracked=False,
                    dry_run=False):
@@ -285,6 +283,84 @@ class AutoRollerApi(recipe_api.RecipeApi):
     elif result == CQResult.TIMEOUT:
       self._abandon_change_and_fail(reason='auto-roller timeout', change_id=change_id)
 
+  def attempt_manifest_rolls(self, gerrit_project, repo_dir, rolls,
+                             dry_run=False):
+    """Attempts to submit several manifest rolls in a single change via the CQ.
+
+    The rolls are all applied with JiriApi.edit_manifest and submitted as by
+    attempt_roll(), so that they cost a single CQ run. If CQ fails, the change
+    is abandoned and the rolls are bisected: each half is attempted on its own,
+    until every roll has either landed or failed by itself. A batch which
+    times out is not bisected.
+
+    It assumes that repo_dir is a clean checkout of the upstream branch.
+
+    Args:
+      gerrit_project (str): The name of the project to roll to in Gerrit, as for
+        attempt_roll().
+      repo_dir (Path): The path to the directory containing a local copy of the
+        git repo containing the manifests.
+      rolls (seq(ManifestRoll)): The rolls to submit.
+      dry_run (bool): Whether to execute this method in dry_run mode.
+    """
+    self.m.gerrit.ensure_gerrit()
+
+    failed = []
+    batches = [list(rolls)]
+    clean = True
+    while batches:
+      batch = batches.pop(0)
+      with self.m.step.nest('roll %s' % ', '.join(r.name for r in batch)):
+        with self.m.context(cwd=repo_dir):
+          if not clean:
+            # Start over from upstream, which may have moved on with the rolls
+            # which landed.
+            self.m.git('fetch', 'origin', UPSTREAM_REF)
+            self.m.git('reset', '--hard', 'FETCH_HEAD')
+          for roll in batch:
+            self.m.jiri.edit_manifest(
+                roll.manifest, projects=roll.projects, imports=roll.imports)
+
+        if not self._repo_has_uncommitted_files(repo_dir, False):
+          self.m.step('no changes to roll', None)
+          continue
+
+        clean = False
+        if len(batch) == 1:
+          message = batch[0].message
+        else:
+          message = '[roll] Roll %s\n\n%s' % (
+              ', '.join(r.name for r in batch),
+              '\n\n'.join(r.message for r in batch))
+        change_id = self._create_and_push_change(
+            gerrit_project=gerrit_project,
+            repo_dir=repo_dir,
+            commit_message=message,
+            commit_untracked=False,
+        )
+        self._trigger_cq(change_id, dry_run)
+        result = self._wait_for_cq(change_id, dry_run)
+
+        if result == CQResult.SUCCESS:
+          if dry_run:
+            self.m.gerrit.abandon('abandon roll: dry run complete', change_id)
+        elif result == CQResult.FAILURE and len(batch) > 1:
+          self.m.gerrit.abandon('abandon roll: bisecting', change_id)
+          half = len(batch) // 2
+          batches[:0] = [batch[:half], batch[half:]]
+        else:
+          reason = 'CQ failed' if result == CQResult.FAILURE else (
+              'auto-roller timeout')
+          self.m.gerrit.abandon('abandon roll: ' + reason, change_id)
+          failed.extend(batch)
+
+    if failed:
+      raise self.m.step.StepFailure(
+          'Failed to roll changes: %s.\n\n'
+          'See the links titled "%s" in the build console to access the '
+          'Gerrit changes, and the failed tryjobs.' % (
+              ', '.join(r.name for r in failed), self._gerrit_link_name))
+
   def _abandon_change_and_fail(self, reason, change_id):
     self.m.gerrit.abandon('abandon roll: ' + reason, change_id)
     gerrit_link = self._gerrit_link(change_id)
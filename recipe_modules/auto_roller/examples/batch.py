@@ -0,0 +1,78 @@
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Example recipe for auto-rolling several manifest rolls at once."""
+
+from recipe_engine.recipe_api import Property
+
+DEPS = [
+  'infra/auto_roller',
+  'infra/git',
+  'infra/jiri',
+  'recipe_engine/path',
+  'recipe_engine/properties',
+  'recipe_engine/raw_io',
+]
+
+PROPERTIES = {
+  'dry_run': Property(kind=bool,
+                      default=False,
+                      help='Whether to dry-run the auto-roller (CQ+1 and abandon the change)'),
+}
+
+REVISION = 'fc4dc762688d2263b254208f444f5c0a4b91bc07'
+
+
+def RunSteps(api, dry_run):
+  api.jiri.ensure_jiri()
+  api.git.checkout('https://fuchsia.googlesource.com/topaz')
+
+  api.auto_roller.attempt_manifest_rolls(
+      gerrit_project='topaz',
+      repo_dir=api.path['start_dir'].join('topaz'),
+      rolls=[
+          api.auto_roller.ManifestRoll(
+              name=name,
+              manifest='manifest/topaz',
+              projects=None,
+              imports=[(name, REVISION)],
+              message='[roll] Roll %s' % name,
+          ) for name in ('garnet', 'peridot', 'zircon')
+      ],
+      dry_run=dry_run,
+  )
+
+
+def GenTests(api):
+  # Test all of the rolls landing in a single change.
+  yield (api.test('batch') +
+         api.step_data('roll garnet, peridot, zircon.wait for CQ',
+                       api.auto_roller.success()))
+
+  # Test a dry-run of the batch.
+  yield (api.test('batch_dry_run') +
+         api.properties(dry_run=True) +
+         api.step_data('roll garnet, peridot, zircon.wait for CQ',
+                       api.auto_roller.dry_run()))
+
+  # Test a batch which fails CQ being bisected, until the roll which fails on
+  # its own is found.
+  yield (api.test('bisect') +
+         api.step_data('roll garnet, peridot, zircon.wait for CQ',
+                       api.auto_roller.failure()) +
+         api.step_data('roll garnet.wait for CQ', api.auto_roller.success()) +
+         api.step_data('roll peridot, zircon.wait for CQ',
+                       api.auto_roller.failure()) +
+         api.step_data('roll peridot.wait for CQ', api.auto_roller.success()) +
+         api.step_data('roll zircon.wait for CQ', api.auto_roller.failure()))
+
+  # Test a batch which times out, which is not bisected.
+  yield (api.test('timeout') +
+         api.step_data('roll garnet, peridot, zircon.wait for CQ',
+                       api.auto_roller.timeout()))
+
+  # Test a batch of rolls which are all up-to-date.
+  yield (api.test('noop') +
+         api.step_data('roll garnet, peridot, zircon.check for no-op commit',
+                       api.raw_io.stream_output('')))
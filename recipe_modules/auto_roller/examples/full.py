@@ -52,14 +52,14 @@ def GenTests(api):
                         remote='https://fuchsia.googlesource.com/garnet',
                         poll_interval_secs=0.001,
                         poll_timeout_secs=0.1) +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
 
   # Test a successful roll of zircon into garnet with the default poll
   # configuration.
   yield (api.test('zircon_default') +
          api.properties(project='garnet',
                         remote='https://fuchsia.googlesource.com/garnet') +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
 
   # Test a successful roll of zircon into garnet with the default poll
   # configuration, and include untracked files.
@@ -67,7 +67,7 @@ def GenTests(api):
          api.properties(project='garnet',
                         remote='https://fuchsia.googlesource.com/garnet',
                         commit_untracked_files=True) +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
 
   # Test a no-op roll of zircon into garnet with the default poll
   # configuration.
@@ -83,7 +83,7 @@ def GenTests(api):
                         remote='https://fuchsia.googlesource.com/garnet',
                         poll_interval_secs=0.001,
                         poll_timeout_secs=0.1) +
-         api.step_data('check if done (0)', api.auto_roller.failure()))
+         api.step_data('wait for CQ', api.auto_roller.failure()))
 
   # Test a dry-run of the auto-roller for rolling zircon into garnet. We
   # substitute in mock data for the first check that the CQ dry-run completed by
@@ -94,7 +94,7 @@ def GenTests(api):
                         dry_run=True,
                         poll_interval_secs=0.001,
                         poll_timeout_secs=0.1) +
-         api.step_data('check if done (0)', api.auto_roller.dry_run()))
+         api.step_data('wait for CQ', api.auto_roller.dry_run()))
 
   # Test a failure to roll zircon because the auto-roller timed out. Sets the
   # poll_timeout to be very close to the poll_interval so only one check is
@@ -105,7 +105,7 @@ def GenTests(api):
                         remote='https://fuchsia.googlesource.com/garnet',
                         poll_interval_secs=0.001,
                         poll_timeout_secs=0.0015) +
-         api.step_data('check if done (0)', api.auto_roller.timeout()))
+         api.step_data('wait for CQ', api.auto_roller.timeout()))
 
   # Test a successful roll of zircon with integral arguments to poll_*_secs.
   # This tests for any regression in supporting integral values for
@@ -115,4 +115,12 @@ def GenTests(api):
                         remote='https://fuchsia.googlesource.com/garnet',
                         poll_interval_secs=1,
                         poll_timeout_secs=1) +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
+
+  # Test a successful roll of zircon with a bound on how far polling backs off.
+  yield (api.test('zircon_max_poll_interval') +
+         api.properties(project='garnet',
+                        remote='https://fuchsia.googlesource.com/garnet',
+                        poll_interval_secs=60,
+                        poll_max_interval_secs=120) +
+         api.step_data('wait for CQ', api.auto_roller.success()))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Waits for the CQ to finish with a Gerrit change.
+
+The change is polled through the Gerrit client with exponential backoff and
+jitter until the CQ succeeds, fails or the timeout expires. Each poll is
+printed as one line of a timeline. Polls which fail, e.g. because Gerrit is
+briefly unavailable, are retried at the next interval unless too many of them
+fail in a row.
+
+The JSON output has the form:
+  {
+    "result": "SUCCESS" | "FAILURE" | "TIMEOUT",
+    "change": <the details of the change at the last poll>,
+    "polls": <the number of polls>
+  }
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# How much each interval may randomly be lengthened by, as a fraction.
+JITTER = 0.1
+
+# How much the interval grows after each poll.
+BACKOFF = 2
+
+# How many polls in a row may fail before giving up.
+MAX_CONSECUTIVE_FAILURES = 5
+
+
+def change_details(gerrit, host, change_id):
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    input_json = os.path.join(tmp_dir, 'input.json')
+    output_json = os.path.join(tmp_dir, 'output.json')
+    with open(input_json, 'w') as f:
+      json.dump({'change_id': change_id}, f)
+    subprocess.check_call([
+        gerrit, 'change-detail', '-host', host,
+        '-input', input_json, '-output', output_json,
+    ])
+    with open(output_json) as f:
+      return json.load(f)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+def cq_result(change, dry_run):
+  """Returns the result of the CQ for a change, or None if it is running."""
+  labels = change['labels']['Commit-Queue']
+  if dry_run:
+    # CQ always removes the CQ+1 label when it finishes a dry run.
+    if 'recommended' not in labels:
+      return 'SUCCESS'
+  else:
+    if change['status'] == 'MERGED':
+      return 'SUCCESS'
+    # CQ only ever removes the CQ+2 label when it fails.
+    if 'approved' not in labels:
+      return 'FAILURE'
+  return None
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--gerrit', required=True, help='The Gerrit client')
+  parser.add_argument('--host', required=True, help='The Gerrit host')
+  parser.add_argument('--change-id', required=True, help='The change to poll')
+  parser.add_argument('--dry-run', action='store_true',
+                      help='Whether the CQ is doing a dry run')
+  parser.add_argument('--interval', type=float, required=True,
+                      help='Seconds to wait before the second poll')
+  parser.add_argument('--max-interval', type=float, required=True,
+                      help='The most seconds to wait between polls')
+  parser.add_argument('--timeout', type=float, required=True,
+                      help='Seconds after which to stop polling')
+  parser.add_argument('--json-output', required=True,
+                      help='Where to write the result')
+  args = parser.parse_args()
+
+  start = time.time()
+  deadline = start + args.timeout
+  interval = args.interval
+  polls = 0
+  failures = 0
+  change = None
+  while True:
+    polls += 1
+    try:
+      change = change_details(args.gerrit, args.host, args.change_id)
+    except (subprocess.CalledProcessError, ValueError) as e:
+      failures += 1
+      now = time.time()
+      print '[+%ds] poll %d failed: %s' % (now - start, polls, e)
+      if failures >= MAX_CONSECUTIVE_FAILURES or (
+          now >= deadline and change is None):
+        raise
+      result = 'TIMEOUT' if now >= deadline else None
+    else:
+      failures = 0
+      result = cq_result(change, args.dry_run)
+      now = time.time()
+      print '[+%ds] poll %d: status %s, Commit-Queue %s' % (
+          now - start, polls, change['status'],
+          ', '.join(sorted(change['labels']['Commit-Queue'])) or 'unset')
+      if result is None and now >= deadline:
+        result = 'TIMEOUT'
+    if result is not None:
+      break
+
+    sleep = min(interval * (1 + random.uniform(0, JITTER)), deadline - now)
+    print '  next poll in %ds' % sleep
+    sys.stdout.flush()
+    time.sleep(sleep)
+    interval = min(interval * BACKOFF, args.max_interval)
+
+  print '[+%ds] %s' % (time.time() - start, result)
+  with open(args.json_output, 'w') as f:
+    json.dump({'result': result, 'change': change, 'polls': polls}, f)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -7,33 +7,29 @@ from recipe_engine import recipe_test_api
 
 class AutoRollerTestApi(recipe_test_api.RecipeTestApi):
 
-  def success(self):
-    """Returns mock data indicating a successful roll."""
+  def _result(self, result, status, labels):
     return self.m.json.output({
-      'status': 'MERGED',
-      'labels': {'Commit-Queue': {'approved':{}}}
+        'result': result,
+        'change': {
+            'status': status,
+            'labels': {'Commit-Queue': labels},
+        },
+        'polls': 1,
     })
 
+  def success(self):
+    """Returns mock data indicating a successful roll."""
+    return self._result('SUCCESS', 'MERGED', {'approved': {}})
+
   def failure(self):
     """Returns mock data indicating a CQ failure."""
-    return self.m.json.output({
-      'status': 'NEW',
-      'labels': {'Commit-Queue': {}}
-    })
+    return self._result('FAILURE', 'NEW', {})
 
   def dry_run(self):
     """Returns mock data indicating a dry run is complete."""
-    # Note, this is the same output we expect on failure (CQ just
-    # un-sets the CQ label).
-    return self.failure()
+    # Note, CQ just un-sets the CQ label, as it does on failure.
+    return self._result('SUCCESS', 'NEW', {})
 
   def timeout(self):
     """Returns mock data indicating a roller timeout."""
-    return self.m.json.output({
-        'status': 'NEW',
-        'labels': {
-            'Commit-Queue': {
-                'approved': {}
-            }
-        }
-    })
+    return self._result('TIMEOUT', 'NEW', {'approved': {}})
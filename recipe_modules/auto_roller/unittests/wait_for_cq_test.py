@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for resources/wait_for_cq.py.
+
+The script is run against a fake Gerrit client which replies to each poll with
+the next of a list of canned responses.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources',
+    'wait_for_cq.py')
+
+# Replies to `change-detail` with the next of the responses in the JSON file
+# next to it: a dict is written as the change's details, 'error' fails the
+# call, and 'garbage' writes output which is not JSON.
+FAKE_GERRIT = """#!/usr/bin/env python
+import json
+import os
+import sys
+
+responses_file = os.path.join(os.path.dirname(__file__), 'responses.json')
+with open(responses_file) as f:
+  responses = json.load(f)
+response = responses.pop(0)
+with open(responses_file, 'w') as f:
+  json.dump(responses, f)
+if response == 'error':
+  sys.exit(1)
+with open(sys.argv[sys.argv.index('-output') + 1], 'w') as f:
+  if response == 'garbage':
+    f.write('<html>')
+  else:
+    json.dump(response, f)
+"""
+
+
+def change(status='NEW', labels=()):
+  return {
+      'status': status,
+      'labels': {'Commit-Queue': {label: {} for label in labels}},
+  }
+
+
+class WaitForCQTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.gerrit = os.path.join(self.tmp_dir, 'gerrit')
+    with open(self.gerrit, 'w') as f:
+      f.write(FAKE_GERRIT)
+    os.chmod(self.gerrit, 0755)
+    self.output = os.path.join(self.tmp_dir, 'output.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def wait(self, responses, dry_run=False, interval=0.01, timeout=60):
+    """Runs the script until the responses are used up, or it gives up.
+
+    Returns:
+      The script's JSON output, or None if it failed.
+    """
+    with open(os.path.join(self.tmp_dir, 'responses.json'), 'w') as f:
+      json.dump(responses, f)
+    cmd = [
+        sys.executable, SCRIPT,
+        '--gerrit', self.gerrit,
+        '--host', 'https://fuchsia-review.googlesource.com',
+        '--change-id', 'abc123',
+        '--interval', str(interval),
+        '--max-interval', str(interval),
+        '--timeout', str(timeout),
+        '--json-output', self.output,
+    ]
+    if dry_run:
+      cmd.append('--dry-run')
+    with open(os.devnull, 'w') as devnull:
+      if subprocess.call(cmd, stdout=devnull, stderr=devnull):
+        return None
+    with open(self.output) as f:
+      return json.load(f)
+
+  def test_success(self):
+    output = self.wait([
+        change(labels=['approved']),
+        change(status='MERGED'),
+    ])
+    self.assertEqual(output['result'], 'SUCCESS')
+    self.assertEqual(output['change']['status'], 'MERGED')
+    self.assertEqual(output['polls'], 2)
+
+  def test_failure(self):
+    # The CQ only removes the CQ+2 label when it fails.
+    output = self.wait([
+        change(labels=['approved']),
+        change(),
+    ])
+    self.assertEqual(output['result'], 'FAILURE')
+    self.assertEqual(output['polls'], 2)
+
+  def test_dry_run(self):
+    # The CQ removes the CQ+1 label whenever it finishes a dry run.
+    output = self.wait([
+        change(labels=['recommended']),
+        change(),
+    ], dry_run=True)
+    self.assertEqual(output['result'], 'SUCCESS')
+    self.assertEqual(output['polls'], 2)
+
+  def test_timeout(self):
+    output = self.wait([change(labels=['approved'])], timeout=0)
+    self.assertEqual(output['result'], 'TIMEOUT')
+    self.assertEqual(output['polls'], 1)
+
+  def test_retries_failed_polls(self):
+    output = self.wait([
+        change(labels=['approved']),
+        'error',
+        'garbage',
+        change(status='MERGED'),
+    ])
+    self.assertEqual(output['result'], 'SUCCESS')
+    self.assertEqual(output['polls'], 4)
+
+  def test_gives_up_after_consecutive_failed_polls(self):
+    self.assertIsNone(self.wait([change(labels=['approved'])] + ['error'] * 5))
+
+  def test_timeout_after_failed_poll(self):
+    # A change which was fetched before the deadline is reported as timed out
+    # even if the last poll, at the deadline, failed.
+    output = self.wait(
+        [change(labels=['approved']), 'error'], interval=1, timeout=0.2)
+    self.assertEqual(output['result'], 'TIMEOUT')
+    self.assertEqual(output['change']['labels']['Commit-Queue'],
+                     {'approved': {}})
+
+  def test_fails_without_any_change(self):
+    self.assertIsNone(self.wait(['error'], timeout=0))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,10 +1,13 @@
 DEPS = [
   'infra/jiri',
   'infra/gerrit',
+  'infra/gitiles',
   'recipe_engine/context',
+  'recipe_engine/file',
   'recipe_engine/json',
   'recipe_engine/path',
   'recipe_engine/properties',
+  'recipe_engine/python',
   'recipe_engine/raw_io',
   'recipe_engine/source_manifest',
   'recipe_engine/step',
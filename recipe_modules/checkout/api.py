@@ -4,7 +4,9 @@
 
 from recipe_engine import recipe_api
 from urlparse import urlparse
+from xml.etree import ElementTree
 import collections
+import posixpath
 
 # PatchInput describes the input to a `jiri patch` command. These are decoded from the
 # list of JSON objects in a .patchfile (see below).
@@ -105,11 +107,18 @@ class CheckoutApi(recipe_api.RecipeApi):
                build_input=None,
                timeout_secs=None,
                run_hooks=True,
-               override=False):
+               override=False,
+               projects=None,
+               packages=None):
     """Initializes and populates a jiri checkout from a remote manifest.
 
     Emits a source manifest for the build.
 
+    If either `projects` or `packages` is given, the checkout is sparse: the
+    manifest is resolved through Gitiles without cloning anything, and only the
+    required projects, the projects they are nested in and their hooks are
+    checked out.
+
     Args:
         manifest (str): Relative path to the manifest in the remote repository.
         remote (str): URL to the remote repository.
@@ -120,6 +129,10 @@ class CheckoutApi(recipe_api.RecipeApi):
         run_hooks (bool): Whether or not to run the hooks.
         override (bool): Whether to override the imported manifest with a commit's
             given revision.
+        projects (seq(str)): The names of the jiri projects the build requires.
+        packages (seq(str)): Paths or GN labels within the checkout (e.g.
+            //garnet/packages/foo) which the build requires; the projects
+            containing them are checked out.
     """
     self.m.jiri.ensure_jiri()
     self.m.jiri.init()
@@ -132,7 +145,9 @@ class CheckoutApi(recipe_api.RecipeApi):
           project=project,
           run_hooks=run_hooks,
           timeout_secs=timeout_secs,
-          gerrit_change=build_input.gerrit_changes[0])
+          gerrit_change=build_input.gerrit_changes[0],
+          projects=projects,
+          packages=packages)
     else:
       commit = None
       if build_input and build_input.gitiles_commit.id:
@@ -145,12 +160,14 @@ class CheckoutApi(recipe_api.RecipeApi):
           project=project,
           run_hooks=run_hooks,
           override=override,
-          timeout_secs=timeout_secs)
+          timeout_secs=timeout_secs,
+          projects=projects,
+          packages=packages)
 
     self.m.jiri.emit_source_manifest()
 
   def from_patchset(self, manifest, remote, project, run_hooks, timeout_secs,
-                    gerrit_change):
+                    gerrit_change, projects=None, packages=None):
     """Initializes and populates a Jiri checkout from a remote manifest and Gerrit change.
 
     Args:
@@ -161,11 +178,30 @@ class CheckoutApi(recipe_api.RecipeApi):
             build.
         timeout_secs (int): A timeout for jiri update in seconds.
         gerrit_change: An element from buildbucket.build_pb2.Build.Input.gerrit_changes.
+        projects (seq(str)): If set, check out only these projects sparsely.
+        packages (seq(str)): If set, check out only the projects containing these
+            paths sparsely.
     """
     self.m.gerrit.ensure_gerrit()
 
-    # Fetch the project and update.
     details = self._get_change_details(gerrit_change)
+    if projects is not None or packages is not None:
+      # The project under test is always required. Hooks can only be run while
+      # updating to a snapshot, so they run before the change is patched.
+      self._sparse_update(
+          manifest,
+          remote,
+          revision=details['branch'],
+          projects=list(projects or []) + [gerrit_change.project],
+          packages=packages,
+          run_hooks=run_hooks,
+          timeout_secs=timeout_secs)
+      self._patch_change(gerrit_change, details)
+      # There is no follow-up update to rebase the patchfile's changes.
+      self._apply_patchfile(gerrit_change, rebase=True)
+      return
+
+    # Fetch the project and update.
     self.m.jiri.import_manifest(
         manifest,
         remote,
@@ -176,16 +212,9 @@ class CheckoutApi(recipe_api.RecipeApi):
     self.m.jiri.update(run_hooks=False, timeout=timeout_secs)
 
     # Patch the current Gerrit change.
-    current_revision = details['current_revision']
-    patch_ref = details['revisions'][current_revision]['ref']
-    self.m.jiri.patch(
-        patch_ref,
-        host='https://%s' % gerrit_change.host,
-        project=gerrit_change.project,
-        rebase=True,
-    )
+    self._patch_change(gerrit_change, details)
 
-    # Handle the patchfile, if present.
+    # Handle the patchfile, if present. Its changes are rebased by the update.
     self._apply_patchfile(gerrit_change)
 
     self.m.jiri.update(
@@ -199,7 +228,7 @@ class CheckoutApi(recipe_api.RecipeApi):
       self.m.jiri.run_hooks(local_manifest=True)
 
   def from_commit(self, manifest, remote, commit, project, run_hooks, override,
-                  timeout_secs):
+                  timeout_secs, projects=None, packages=None):
     """Initializes and populates a Jiri checkout from a remote manifest and Gerrit change.
 
     Args:
@@ -213,8 +242,27 @@ class CheckoutApi(recipe_api.RecipeApi):
         run_hooks (bool): Whether or not to run the hooks.
         override (bool): Whether to override the imported manifest with a commit's
             given revision.
+        projects (seq(str)): If set, check out only these projects sparsely.
+        packages (seq(str)): If set, check out only the projects containing these
+            paths sparsely.
     """
     revision = commit.id if commit else 'HEAD'
+    if projects is not None or packages is not None:
+      pins = {}
+      if override and commit:
+        pins[commit.project] = revision
+        revision = 'HEAD'
+      self._sparse_update(
+          manifest,
+          remote,
+          revision=revision,
+          projects=projects,
+          packages=packages,
+          run_hooks=run_hooks,
+          timeout_secs=timeout_secs,
+          pins=pins)
+      return
+
     if override and commit:
       self.m.jiri.import_manifest(
           manifest, remote, name=project, revision='HEAD')
@@ -239,8 +287,181 @@ class CheckoutApi(recipe_api.RecipeApi):
     if run_hooks:
       self.m.jiri.run_hooks()
 
-  def _apply_patchfile(self, gerrit_change):
-    """Parses and applies the patchfile for the given gerrit change."""
+  def _sparse_update(self,
+                     manifest,
+                     remote,
+                     revision,
+                     projects,
+                     packages,
+                     run_hooks,
+                     timeout_secs,
+                     pins=None):
+    """Checks out only the projects which a build requires.
+
+    Args:
+        manifest (str): Relative path to the manifest in the remote repository.
+        remote (str): URL to the remote repository.
+        revision (str): The revision of the manifest to check out.
+        projects (seq(str)): The names of the required projects.
+        packages (seq(str)): Paths or GN labels within the required projects.
+        run_hooks (bool): Whether or not to run the hooks of the projects.
+        timeout_secs (int): A timeout for jiri update in seconds.
+        pins (dict(str, str)): Revisions to check out, by project name, instead of
+            those in the manifest.
+    """
+    with self.m.step.nest('resolve sparse checkout') as step_result:
+      all_projects, hooks = self._resolve_manifest(manifest, remote, revision)
+      required = self._required_projects(all_projects, projects or [],
+                                         packages or [])
+      step_result.presentation.step_text = '%d of %d projects' % (len(required),
+                                                       len(all_projects))
+
+      root = ElementTree.Element('manifest')
+      projects_element = ElementTree.SubElement(root, 'projects')
+      for name in sorted(required):
+        attributes = dict(all_projects[name])
+        if name in (pins or {}):
+          attributes['revision'] = pins[name]
+        ElementTree.SubElement(projects_element, 'project', attributes)
+      hooks_element = ElementTree.SubElement(root, 'hooks')
+      for _, attributes in sorted(hooks.iteritems()):
+        if attributes.get('project') in required:
+          ElementTree.SubElement(hooks_element, 'hook', attributes)
+
+      snapshot = self.m.path['cleanup'].join('sparse_snapshot')
+      self.m.file.write_text('write snapshot', snapshot,
+                             ElementTree.tostring(root))
+
+    # Hooks are only recorded by the snapshot, so they must be run during update.
+    self.m.jiri.update(
+        run_hooks=run_hooks, snapshot=snapshot, timeout=timeout_secs)
+
+  def _resolve_manifest(self, manifest, remote, revision):
+    """Reads a remote manifest and everything it imports through Gitiles.
+
+    Args:
+        manifest (str): Relative path to the manifest in the remote repository.
+        remote (str): URL to the remote repository.
+        revision (str): The revision of the manifest to read.
+
+    Returns:
+        A tuple of the attributes of every <project>, by name, and of every
+        <hook>, by its project and name. Project paths are relative to the root
+        of the checkout.
+    """
+    projects, hooks = {}, {}
+    pending = [(remote, manifest, revision, '')]
+    fetched = set()
+    while pending:
+      remote, manifest, revision, root = pending.pop(0)
+      if (remote, manifest, revision) in fetched:
+        continue
+      fetched.add((remote, manifest, revision))
+
+      # Only the top-level manifest has contents by default in tests.
+      test_data = '<manifest/>'
+      if len(fetched) == 1:
+        test_data = self.test_api.example_manifest
+      xml = self.m.gitiles.fetch(
+          remote,
+          manifest,
+          branch=revision,
+          step_name='fetch %s:%s' % (urlparse(remote).path.strip('/'),
+                                     manifest),
+          test_data=test_data)
+      contents = self.m.jiri.Manifest(xml)
+
+      for name, attributes in contents.projects.iteritems():
+        # Like jiri, the first definition of a project wins.
+        if name not in projects:
+          attributes = dict(attributes)
+          attributes['path'] = posixpath.join(root,
+                                              attributes.get('path', name))
+          projects[name] = attributes
+      for key, attributes in contents.hooks.iteritems():
+        hooks.setdefault(key, attributes)
+
+      for localimport in contents.localimports:
+        pending.append((remote,
+                        posixpath.normpath(
+                            posixpath.join(
+                                posixpath.dirname(manifest), localimport)),
+                        revision, root))
+      for attributes in contents.imports.itervalues():
+        pending.append((attributes['remote'], attributes['manifest'],
+                        attributes.get('revision') or
+                        attributes.get('remotebranch', 'master'),
+                        posixpath.join(root, attributes.get('root', ''))))
+    return projects, hooks
+
+  def _required_projects(self, projects, names, packages):
+    """Returns the names of the projects which a build requires.
+
+    Args:
+        projects (dict(str, dict(str, str))): The attributes of every project in
+            the manifest, by name.
+        names (seq(str)): The names of projects which are required.
+        packages (seq(str)): Paths or GN labels within projects which are
+            required.
+
+    Returns:
+        A set of the required projects together with the projects they are nested
+        in, since those must be checked out for their paths to exist.
+    """
+    paths = {
+        attributes['path']: name for name, attributes in projects.iteritems()
+    }
+
+    def owner(path):
+      """Returns the project containing a path, if any."""
+      while path:
+        if path in paths:
+          return paths[path]
+        path = posixpath.dirname(path)
+      return None
+
+    required = set()
+    for name in names:
+      if name not in projects:
+        raise self.m.step.StepFailure('Unknown project: %s' % name)
+      required.add(name)
+    for package in packages:
+      # Strip the GN toolchain and target, if any.
+      path = package.lstrip('/').split('(')[0].split(':')[0].rstrip('/')
+      name = owner(path)
+      if name is None:
+        raise self.m.step.StepFailure('No project contains %s' % package)
+      required.add(name)
+
+    for name in list(required):
+      parent = owner(posixpath.dirname(projects[name]['path']))
+      while parent is not None:
+        required.add(parent)
+        parent = owner(posixpath.dirname(projects[parent]['path']))
+    return required
+
+  def _patch_change(self, gerrit_change, details):
+    """Patches the current revision of a Gerrit change into the checkout."""
+    current_revision = details['current_revision']
+    patch_ref = details['revisions'][current_revision]['ref']
+    self.m.jiri.patch(
+        patch_ref,
+        host='https://%s' % gerrit_change.host,
+        project=gerrit_change.project,
+        rebase=True,
+    )
+
+  def _apply_patchfile(self, gerrit_change, rebase=False):
+    """Parses and applies the patchfile for the given gerrit change.
+
+    The changes in the patchfile are fetched concurrently and checked out on
+    branches which track the branch each change was uploaded for, so that they
+    can all be rebased by a single `jiri update -rebase-tracked`.
+
+    Args:
+        gerrit_change: An element from buildbucket.build_pb2.Build.Input.gerrit_changes.
+        rebase (bool): Whether to rebase the changes right away instead.
+    """
 
     # Verify the patchfile exists.
     patchfile_path = self.m.path['start_dir'].join(gerrit_change.project,
@@ -255,6 +476,23 @@ class CheckoutApi(recipe_api.RecipeApi):
     if validation_err is not None:
       raise self.m.step.StepFailure(str(validation_err))
 
+    # Find all of the patched projects in one go.
+    projects = sorted(set(i.project for i in patch_file.inputs))
+    paths = {
+        project['name']: project['path']
+        for project in self.m.jiri.project(projects).json.output
+    }
+    missing = [project for project in projects if project not in paths]
+    if missing:
+      raise self.m.step.StepFailure(
+          'The patchfile patches projects which are not checked out: %s' %
+          ', '.join(missing))
+
+    # Each change tracks its own branch, which need not be the branch of the
+    # change being tested. The branches of the changes on each host are looked
+    # up by a single query.
+    changes = []
+    change_ids_by_host = collections.OrderedDict()
     for patch_input in patch_file.inputs:
       # Strip protocol if present.
       host = patch_input.host
@@ -262,12 +500,45 @@ class CheckoutApi(recipe_api.RecipeApi):
       if host_url.scheme:
         host = host_url.hostname
 
-      # Patch in the change
-      self.m.jiri.patch(
-          ref=patch_input.ref,
-          host='https://%s' % host,
-          project=patch_input.project,
-          rebase=True)
+      # The ref has the form refs/changes/<shard>/<change>/<patchset>.
+      change = '/'.join(patch_input.ref.split('/')[3:])
+      change_id = '%s~%s' % (patch_input.project, change.split('/')[0])
+      changes.append((patch_input, host, change, change_id))
+      change_ids_by_host.setdefault(host, []).append(change_id)
+
+    branches = {}
+    for host, change_ids in change_ids_by_host.iteritems():
+      details = self.m.gerrit.changes_details(
+          name='get patchfile change details',
+          change_ids=change_ids,
+          gerrit_host='https://%s' % host,
+          test_data=self.m.json.test_api.output([{
+              'project': change_id.split('~')[0],
+              '_number': change_id.split('~')[1],
+              'branch': 'master',
+          } for change_id in change_ids]),
+      )
+      for change_id in change_ids:
+        if change_id not in details:
+          raise self.m.step.StepFailure(
+              'The patchfile change %s was not found on %s' % (change_id, host))
+        branches[(host, change_id)] = details[change_id]['branch']
+
+    patches = []
+    for patch_input, host, change, change_id in changes:
+      patches.append({
+          'path': paths[patch_input.project],
+          'remote': 'https://%s/%s' % (host, patch_input.project),
+          'ref': patch_input.ref,
+          'branch': 'change/%s' % change,
+          'upstream': 'origin/%s' % branches[(host, change_id)],
+      })
+
+    args = ['--spec', self.m.json.input(patches)]
+    if rebase:
+      args.append('--rebase')
+    self.m.python('fetch patchfile changes', self.resource('fetch_patches.py'),
+                  args=args)
 
   def _get_change_details(self, gerrit_change):
     """Fetches the details of a Gerrit change"""
@@ -2,12 +2,16 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+from recipe_engine.config import List
 from recipe_engine.recipe_api import Property
 import collections
 
 DEPS = [
     'infra/checkout',
+    'infra/gitiles',
+    'infra/jiri',
     'recipe_engine/buildbucket',
+    'recipe_engine/json',
     'recipe_engine/properties',
     'recipe_engine/path',
 ]
@@ -17,16 +21,24 @@ PROPERTIES = {
         Property(kind=str, help='The git project', default='garnet'),
     'override':
         Property(kind=bool, help='Whether to override $project', default=False),
+    'projects':
+        Property(kind=List(basestring), help='Projects to check out sparsely',
+                 default=None),
+    'packages':
+        Property(kind=List(basestring), help='Packages to check out sparsely',
+                 default=None),
 }
 
 
-def RunSteps(api, project, override):
+def RunSteps(api, project, override, projects, packages):
   api.checkout(
       manifest='minimal',
       remote='https://fuchsia.googlesource.com/manifest',
       project=project,
       build_input=api.buildbucket.build.input,
       override=override,
+      projects=projects,
+      packages=packages,
   )
 
 
@@ -69,6 +81,32 @@ def GenTests(api):
           'project': 'not_garnet'
       }])
 
+  yield api.checkout.test(
+      'tryjob_with_patchfile_on_another_branch',
+      project='garnet',
+      tryjob=True,
+      patchfile=[{
+          'ref': 'refs/changes/cc/aabbcc/1',
+          'host': 'example-review.googlesource.com',
+          'project': 'not_garnet'
+      }]) + api.step_data(
+          'get patchfile change details',
+          api.json.output([{
+              'project': 'not_garnet',
+              '_number': 'aabbcc',
+              'branch': 'releases/1.0',
+          }]))
+
+  yield api.checkout.test(
+      'tryjob_with_patchfile_change_not_found',
+      project='garnet',
+      tryjob=True,
+      patchfile=[{
+          'ref': 'refs/changes/cc/aabbcc/1',
+          'host': 'example-review.googlesource.com',
+          'project': 'not_garnet'
+      }]) + api.step_data('get patchfile change details', api.json.output([]))
+
   yield api.checkout.test(
       'fail_to_patch_over_gerrit_change',
       project='garnet',
@@ -102,3 +140,75 @@ def GenTests(api):
           'host': 'https://fuchsia-review.googlesource.com',
           'project': 'zircon',
       }])
+
+  yield api.checkout.test(
+      'sparse ci',
+      project='integration',
+      projects=['topaz'],
+      packages=['//garnet/third_party/foo:bar'],
+  )
+
+  yield api.checkout.test(
+      'sparse local ci',
+      project='garnet',
+      override=True,
+      projects=['garnet'],
+  )
+
+  yield (api.checkout.test(
+      'sparse tryjob',
+      project='garnet',
+      tryjob=True,
+      packages=['//vendor/peridot/bin/sessionmgr'],
+  ) + api.gitiles.fetch(
+      'resolve sparse checkout.fetch manifest:minimal',
+      api.jiri.manifest(
+          projects=[{'name': 'garnet', 'path': 'garnet'}],
+          imports=[{
+              'name': 'peridot',
+              'manifest': 'manifest/peridot',
+              'remote': 'https://fuchsia.googlesource.com/peridot',
+              'root': 'vendor',
+          }],
+          localimports=['zircon'],
+      )) + api.gitiles.fetch(
+          'resolve sparse checkout.fetch manifest:zircon',
+          api.jiri.manifest(
+              projects=[{'name': 'zircon', 'path': 'zircon'}],
+              localimports=['minimal'],
+          )) + api.gitiles.fetch(
+              'resolve sparse checkout.fetch peridot:manifest/peridot',
+              api.jiri.manifest(projects=[{'name': 'peridot', 'path': 'peridot'}])))
+
+  yield api.checkout.test(
+      'sparse_tryjob_with_patchfile',
+      project='garnet',
+      tryjob=True,
+      projects=['zircon'],
+      patchfile=[{
+          'ref': 'refs/changes/cc/aabbcc/1',
+          'host': 'fuchsia-review.googlesource.com',
+          'project': 'zircon',
+      }])
+
+  yield api.checkout.test(
+      'fail_to_patch_missing_project',
+      project='garnet',
+      tryjob=True,
+      patchfile=[{
+          'ref': 'refs/changes/cc/aabbcc/1',
+          'host': 'fuchsia-review.googlesource.com',
+          'project': 'zircon',
+      }]) + api.step_data('jiri project', api.jiri.project([]))
+
+  yield api.checkout.test(
+      'sparse_unknown_project',
+      project='integration',
+      projects=['nonexistent'],
+  )
+
+  yield api.checkout.test(
+      'sparse_unknown_package',
+      project='integration',
+      packages=['//nowhere/foo'],
+  )
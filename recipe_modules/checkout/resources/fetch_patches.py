@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Fetches Gerrit changes into several git repositories concurrently.
+
+The spec is a JSON file of the form:
+  [
+    {
+      "path": <path to the repository>,
+      "remote": <URL of the Gerrit repository to fetch the change from>,
+      "ref": <ref of the change, e.g. refs/changes/56/123456/3>,
+      "branch": <local branch to check the change out on>,
+      "upstream": <branch to track, e.g. origin/master>
+    },
+    ...
+  ]
+
+Each change is fetched from its Gerrit repository and checked out on a
+local branch which tracks the upstream branch, so that a following
+`jiri update -rebase-tracked` rebases all of them at once. With --rebase, each
+change is instead rebased onto its upstream branch right away.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from multiprocessing.pool import ThreadPool
+
+
+def git(path, *args):
+  subprocess.check_call(['git', '-C', path] + list(args))
+
+
+def fetch_patch(patch, rebase):
+  path = patch['path']
+  git(path, 'fetch', patch['remote'], patch['ref'])
+  git(path, 'checkout', '-B', patch['branch'], 'FETCH_HEAD')
+  git(path, 'branch', '--set-upstream-to=%s' % patch['upstream'])
+  if rebase:
+    git(path, 'rebase', patch['upstream'])
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--spec', required=True, type=argparse.FileType('r'),
+                      help='The JSON spec of the changes to fetch')
+  parser.add_argument('--jobs', type=int, default=8,
+                      help='How many changes to fetch at once')
+  parser.add_argument('--rebase', action='store_true',
+                      help='Rebase each change onto its upstream branch')
+  args = parser.parse_args()
+
+  patches = json.load(args.spec)
+  pool = ThreadPool(args.jobs)
+  try:
+    results = [
+        pool.apply_async(fetch_patch, (patch, args.rebase))
+        for patch in patches
+    ]
+    for result in results:
+      result.get()
+  finally:
+    pool.close()
+    pool.join()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -7,7 +7,14 @@ from recipe_engine import recipe_test_api
 
 class CheckoutTestApi(recipe_test_api.RecipeTestApi):
 
-  def test(self, name, project, patchfile=None, override=False, tryjob=False):
+  def test(self,
+           name,
+           project,
+           patchfile=None,
+           override=False,
+           tryjob=False,
+           projects=None,
+           packages=None):
     """Creates a CheckoutApi test case
 
     Args:
@@ -17,12 +24,18 @@ class CheckoutTestApi(recipe_test_api.RecipeTestApi):
           no patchfile will be present in this test.
         override (bool): Whether to `jiri override` the project being tested.
         tryjob (bool): Whether this is a tryjob.
+        projects (seq(str)): The projects to check out sparsely, if any.
+        packages (seq(str)): The packages to check out sparsely, if any.
     """
     # Default properties.
     properties = dict(
         project=project,
         override=override,
     )
+    if projects is not None:
+      properties['projects'] = projects
+    if packages is not None:
+      properties['packages'] = packages
 
     # Add buildbucket properties.
     properties.update(
@@ -47,6 +60,32 @@ class CheckoutTestApi(recipe_test_api.RecipeTestApi):
 
     return ret
 
+  @property
+  def example_manifest(self):
+    """The XML of a manifest with nested projects and hooks."""
+    return self.m.jiri.manifest(
+        projects=[
+            {'name': 'build', 'path': 'build',
+             'remote': 'https://fuchsia.googlesource.com/build'},
+            {'name': 'garnet', 'path': 'garnet',
+             'remote': 'https://fuchsia.googlesource.com/garnet'},
+            {'name': 'third_party/foo', 'path': 'garnet/third_party/foo',
+             'remote': 'https://fuchsia.googlesource.com/third_party/foo'},
+            {'name': 'topaz', 'path': 'topaz',
+             'remote': 'https://fuchsia.googlesource.com/topaz'},
+            {'name': 'zircon', 'path': 'zircon',
+             'remote': 'https://fuchsia.googlesource.com/zircon'},
+        ],
+        hooks=[
+            {'name': 'download-toolchain', 'project': 'build',
+             'action': 'download-toolchain.sh'},
+            {'name': 'update-foo', 'project': 'third_party/foo',
+             'action': 'update.sh'},
+            # Hooks of different projects may share a name.
+            {'name': 'download-toolchain', 'project': 'zircon',
+             'action': 'download-toolchain.sh'},
+        ])
+
   def _buildbucket_properties(self,
                               bucket='###buildbucket-bucket###',
                               builder='###buildbucket-builder###',
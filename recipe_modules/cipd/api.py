@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import contextlib
 import re
 
 from collections import namedtuple
@@ -9,6 +10,10 @@ from collections import namedtuple
 from recipe_engine import recipe_api
 from recipe_engine.config_types import Path
 
+# Matches the errors with which CIPD reports that a package, or an instance of
+# it with a given tag or ref, does not exist.
+UNPUBLISHED_ERROR_RE = re.compile(r'no such (package|tag|ref)|no instances?\b')
+
 
 def check_type(name, var, expect):
   if not isinstance(var, expect):  # pragma: no cover
@@ -153,6 +158,48 @@ class CIPDApi(recipe_api.RecipeApi):
   """
   PackageDefinition = PackageDefinition
 
+  def __init__(self, *args, **kwargs):
+    super(CIPDApi, self).__init__(*args, **kwargs)
+    # The (root, packages) pairs passed to ensure() while preloading.
+    self._preloads = None
+    # Backend lookups memoized for the duration of the run. A package's entries
+    # are forgotten whenever this run registers or tags an instance of it.
+    self._resolved = {}  # (package, version) -> instance ID
+    self._searches = {}  # (package, tag) -> step result
+    self._descriptions = {}  # (package, version) -> step result
+
+  def _forget(self, package_name):
+    """Forgets the memoized lookups of a package which is being modified."""
+    for memo in (self._resolved, self._searches, self._descriptions):
+      for key in [key for key in memo if key[0] == package_name]:
+        del memo[key]
+
+  def _pinned(self, name, version):
+    """Returns the instance ID a version was resolved to, else the version."""
+    return self._resolved.get((name, version), version)
+
+  def _expand(self, package_name):
+    """Expands the platform placeholders of a package name template."""
+    os, arch = self.platform_suffix().split('-')
+    return (package_name.replace('${platform}', '%s-%s' % (os, arch))
+            .replace('${os}', os).replace('${arch}', arch))
+
+  def _remember_pins(self, packages, pins):
+    """Memoizes the instance IDs which the versions of packages resolved to.
+
+    Args:
+      packages (dict[str]str): Maps package names to the versions resolved.
+      pins (list[dict]|dict[str]list[dict]): The pins which the versions
+        resolved to, either as a list or as a map from subdir to list.
+    """
+    if isinstance(pins, dict):
+      pins = [pin for subdir in sorted(pins) for pin in pins[subdir]]
+    instance_ids = {pin['package']: pin['instance_id'] for pin in pins}
+    for name, version in packages.iteritems():
+      instance_id = instance_ids.get(self._expand(name))
+      if instance_id:
+        self._resolved[(name, version)] = instance_id
+
   # Map for architecture mapping. First key is platform module arch, second is
   # platform module bits.
   _SUFFIX_ARCH_MAP = {
@@ -264,6 +311,7 @@ class CIPDApi(recipe_api.RecipeApi):
     )
 
   def register(self, package_name, package_path, refs=None, tags=None):
+    self._forget(package_name)
     cmd = [
       self.executable,
       'pkg-register', package_path,
@@ -288,6 +336,7 @@ class CIPDApi(recipe_api.RecipeApi):
     check_list_type('refs', refs, str)
     check_dict_type('tags', tags, str, basestring)
     tags = { k: str(v) for k, v in tags.items() }
+    self._forget(pkg_name)
     cmd = [
       self.executable,
       'create',
@@ -349,14 +398,141 @@ class CIPDApi(recipe_api.RecipeApi):
     return self._create(
       pkg_def.package_name, self.m.json.input(pkg_def.to_jsonish()), refs, tags)
 
+  def publish_many(self, step_name, pkg_defs, refs=None, tags=None,
+                   mirror_dir=None, mirror_subdirs=None, jobs=4):
+    """Builds and registers several packages concurrently in one step.
+
+    Args:
+      step_name (str) - the name of the step.
+      pkg_defs (list(PackageDefinition)) - The descriptions of the packages we
+        want to publish.
+      refs (list(str)) - A list of ref names to set for each package instance.
+      tags (dict(str, str)) - A map of tag name -> value to set for each
+                              package instance.
+      mirror_dir (Path) - If given, each package file is also placed at
+        <mirror_dir>/<mirror subdir>/<instance ID>, so that all of them can be
+        mirrored to GCS with a single `gsutil rsync`.
+      mirror_subdirs (list(str)) - The mirror subdir of each package, in the
+        order of pkg_defs. Defaults to the package names.
+      jobs (int) - How many packages to publish at once.
+
+    Returns the JSON 'result' section of each package in the order given, e.g.:
+    [{
+      "package": "infra/tools/cipd/android-amd64",
+      "instance_id": "433bfdf86c0bb82d1eee2d1a0473d3709c25d2c4"
+    }]
+    """
+    refs = refs or []
+    tags = tags or {}
+    check_list_type('pkg_defs', pkg_defs, PackageDefinition)
+    check_list_type('refs', refs, str)
+    check_dict_type('tags', tags, str, basestring)
+    package_names = [pkg_def.package_name for pkg_def in pkg_defs]
+    mirror_subdirs = mirror_subdirs or package_names
+    assert len(mirror_subdirs) == len(pkg_defs)
+    for package_name in package_names:
+      self._forget(package_name)
+    spec = {
+      'packages': [
+        {
+          'pkg_def': pkg_def.to_jsonish(),
+          'output': str(self.m.path['cleanup'].join(
+              '%s.cipd' % pkg_def.package_name.replace('/', '_'))),
+          'mirror_subdir': mirror_subdir,
+        }
+        for pkg_def, mirror_subdir in zip(pkg_defs, mirror_subdirs)
+      ],
+      'refs': refs,
+      'tags': { k: str(v) for k, v in tags.items() },
+      'mirror_dir': str(mirror_dir) if mirror_dir else None,
+    }
+    result = self.m.python(
+        step_name,
+        self.resource('publish.py'),
+        args=[
+          '--cipd', self.executable,
+          '--spec', self.m.json.input(spec),
+          '--jobs', jobs,
+          '--json-output', self.m.json.output(),
+        ],
+        step_test_data=lambda: self.test_api.example_publish_many(
+            package_names),
+    )
+    pins = result.json.output['result']
+    result.presentation.step_text = ''.join(
+        '</br>%(package)s: %(instance_id)s' % pin for pin in pins)
+    return pins
+
+  @contextlib.contextmanager
+  def preload(self):
+    """Installs the packages of every ensure() in the context in one step.
+
+    Calls to ensure() within the context only record the packages to install,
+    so a recipe can declare all the tools it needs up front, e.g.
+
+      with api.cipd.preload():
+        api.jiri.ensure_jiri()
+        api.swarming.ensure_swarming()
+
+    and they are all resolved and installed by a single `cipd ensure` when
+    the context exits, each into the root it was ensured in. The tools must
+    not be used before then, and their roots must be within the start dir.
+    """
+    assert self._preloads is None, 'preloads may not be nested'
+    self._preloads = []
+    try:
+      yield
+      preloads = self._preloads
+    finally:
+      self._preloads = None
+    if preloads:
+      self._ensure_subdirs(preloads)
+
+  def _ensure_subdirs(self, preloads):
+    """Installs packages into several roots below the start dir at once."""
+    start_dir = self.m.path['start_dir']
+    subdirs = {}
+    for root, packages in preloads:
+      assert start_dir.is_parent_of(root), (
+          '%r is not within the start dir' % root)
+      subdir = '/'.join(root.pieces[len(start_dir.pieces):])
+      subdirs.setdefault(subdir, {}).update(packages)
+    lines = []
+    for subdir, packages in sorted(subdirs.items()):
+      lines.append('@Subdir %s' % subdir)
+      # Versions which were already resolved in this run need not be again.
+      lines.extend('%s %s' % (name, self._pinned(name, version))
+                   for name, version in sorted(packages.items()))
+    cmd = [
+      self.executable,
+      'ensure',
+      '-root', start_dir,
+      '-ensure-file', self.m.raw_io.input('\n'.join(lines)),
+      '-json-output', self.m.json.output(),
+    ]
+    step_result = self.m.step(
+        'preload packages', cmd,
+        step_test_data=lambda: self.test_api.example_ensure_subdirs(subdirs)
+    )
+    pins = step_result.json.output['result']
+    for subdir, packages in subdirs.iteritems():
+      self._remember_pins(packages, pins.get(subdir, []))
+    return step_result
+
   def ensure(self, root, packages):
     """Ensures that packages are installed in a given root dir.
 
     packages must be a mapping from package name to its version, where
       * name must be for right platform (see also ``platform_suffix``),
       * version could be either instance_id, or ref, or unique tag.
+
+    Within preload(), the packages are only installed once the context exits.
     """
-    package_list = ['%s %s' % (name, version)
+    if self._preloads is not None:
+      self._preloads.append((root, packages))
+      return None
+    # Versions which were already resolved in this run need not be again.
+    package_list = ['%s %s' % (name, self._pinned(name, version))
                     for name, version in sorted(packages.items())]
     ensure_file = self.m.raw_io.input('\n'.join(package_list))
     cmd = [
@@ -366,12 +542,110 @@ class CIPDApi(recipe_api.RecipeApi):
       '-ensure-file', ensure_file,
       '-json-output', self.m.json.output(),
     ]
-    return self.m.step(
+    step_result = self.m.step(
         'ensure_installed', cmd,
         step_test_data=lambda: self.test_api.example_ensure(packages)
     )
+    self._remember_pins(packages, step_result.json.output['result'])
+    return step_result
+
+  def resolve(self, package_name, version):
+    """Resolves a version of a package to an instance ID.
+
+    Versions resolved before in this run are not resolved again.
+
+    Args:
+      package_name (str) - the name of the package.
+      version (str) - an instance ID, ref, or unique tag of the package.
+
+    Returns:
+      The instance ID of the package the version refers to.
+    """
+    return self.resolve_many({package_name: version})[package_name]
+
+  def resolve_many(self, packages):
+    """Resolves the versions of several packages with a single step.
+
+    Versions resolved before in this run are not resolved again, and if all of
+    them were, no step is run at all.
+
+    Args:
+      packages (dict(str, str)) - a map from package name to version, as for
+        ensure().
+
+    Returns:
+      A map from each package name to the instance ID its version refers to.
+    """
+    unresolved = self._unresolved(packages)
+    if unresolved:
+      self._resolve('resolve %d packages' % len(unresolved), unresolved)
+    return {
+        name: self._resolved[(name, version)]
+        for name, version in packages.items()
+    }
+
+  def published(self, packages):
+    """Checks whether instances of several packages are all published.
+
+    This is meant to be called before building packages, so that the build
+    can be skipped when all of them were already published. Only a single step
+    is run however many packages are checked.
+
+    Args:
+      packages (dict(str, str)) - a map from package name to a unique tag of
+        the instance to check for, e.g. 'git_revision:<hash>'.
+
+    Returns:
+      True if all the packages have an instance with the tag, False otherwise.
+
+    Raises:
+      InfraFailure if CIPD fails for any other reason than a package or tag not
+      existing, e.g. a network or authentication error.
+    """
+    unresolved = self._unresolved(packages)
+    if not unresolved:
+      return True
+    step_result = self._resolve(
+        'check published packages', unresolved, ok_ret='any')
+    if step_result.retcode == 0:
+      return True
+    error = (step_result.json.output or {}).get('error') or ''
+    if UNPUBLISHED_ERROR_RE.search(error):
+      return False
+    step_result.presentation.status = self.m.step.EXCEPTION
+    raise self.m.step.InfraFailure(
+        'Failed to check published packages: %s' % error)
+
+  def _unresolved(self, packages):
+    return {
+        name: version for name, version in packages.items()
+        if (name, version) not in self._resolved
+    }
+
+  def _resolve(self, step_name, packages, **kwargs):
+    versions_file = self.m.path.mkdtemp('cipd-resolve').join('versions')
+    lines = ['$ResolvedVersions %s' % versions_file]
+    if any('${' in name for name in packages):
+      lines.append('$VerifiedPlatform %s' % self.platform_suffix())
+    lines.extend('%s %s' % (name, version)
+                 for name, version in sorted(packages.items()))
+    step_result = self.m.step(
+        step_name,
+        [
+          self.executable,
+          'ensure-file-resolve',
+          '-ensure-file', self.m.raw_io.input('\n'.join(lines)),
+          '-json-output', self.m.json.output(),
+        ],
+        step_test_data=lambda: self.test_api.example_ensure(packages),
+        **kwargs
+    )
+    if step_result.retcode == 0:
+      self._remember_pins(packages, step_result.json.output['result'])
+    return step_result
 
   def set_tag(self, package_name, version, tags):
+    self._forget(package_name)
     cmd = [
       self.executable,
       'set-tag', package_name,
@@ -390,6 +664,7 @@ class CIPDApi(recipe_api.RecipeApi):
     )
 
   def set_ref(self, package_name, version, refs):
+    self._forget(package_name)
     cmd = [
       self.executable,
       'set-ref', package_name,
@@ -408,7 +683,14 @@ class CIPDApi(recipe_api.RecipeApi):
     )
 
   def search(self, package_name, tag):
+    """Searches for the instances of a package with a tag.
+
+    The search is only run once per run for each package and tag, unless an
+    instance of the package is registered or tagged in between.
+    """
     assert ':' in tag, 'tag must be in a form "k:v"'
+    if (package_name, tag) in self._searches:
+      return self._searches[(package_name, tag)]
 
     cmd = [
       self.executable,
@@ -417,14 +699,27 @@ class CIPDApi(recipe_api.RecipeApi):
       '-json-output', self.m.json.output(),
     ]
 
-    return self.m.step(
+    step_result = self.m.step(
         'cipd search %s %s' % (package_name, tag),
         cmd,
         step_test_data=lambda: self.test_api.example_search(package_name)
     )
+    self._searches[(package_name, tag)] = step_result
+    instances = step_result.json.output['result']
+    if len(instances) == 1:
+      self._resolved[(package_name, tag)] = instances[0]['instance_id']
+    return step_result
 
   def describe(self, package_name, version,
                test_data_refs=None, test_data_tags=None):
+    """Describes an instance of a package.
+
+    The description is only fetched once per run for each package and version,
+    unless an instance of the package is registered or tagged in between.
+    """
+    if (package_name, version) in self._descriptions:
+      return self._descriptions[(package_name, version)]
+
     cmd = [
       self.executable,
       'describe', package_name,
@@ -432,7 +727,7 @@ class CIPDApi(recipe_api.RecipeApi):
       '-json-output', self.m.json.output(),
     ]
 
-    return self.m.step(
+    step_result = self.m.step(
         'cipd describe %s' % package_name,
         cmd,
         step_test_data=lambda: self.test_api.example_describe(
@@ -441,3 +736,7 @@ class CIPDApi(recipe_api.RecipeApi):
             test_data_tags=test_data_tags
         )
     )
+    self._descriptions[(package_name, version)] = step_result
+    self._resolved[(package_name, version)] = (
+        step_result.json.output['result']['pin']['instance_id'])
+    return step_result
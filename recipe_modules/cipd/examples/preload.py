@@ -0,0 +1,31 @@
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+DEPS = [
+  'cipd',
+  'recipe_engine/path',
+]
+
+
+def RunSteps(api):
+  tools_dir = api.path['start_dir'].join('cipd')
+
+  # Packages ensured within the context are installed in a single step when
+  # it exits.
+  with api.cipd.preload():
+    api.cipd.ensure(tools_dir.join('jiri'), {
+        'fuchsia/tools/jiri/%s' % api.cipd.platform_suffix(): 'stable',
+    })
+    api.cipd.ensure(tools_dir.join('isolated'), {
+        'infra/tools/luci/isolated/${platform}': 'release',
+        'infra/tools/luci/isolate/${platform}': 'release',
+    })
+
+  # Nothing is installed if nothing was ensured.
+  with api.cipd.preload():
+    pass
+
+
+def GenTests(api):
+  yield api.test('basic')
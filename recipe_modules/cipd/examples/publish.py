@@ -0,0 +1,30 @@
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+DEPS = [
+  'cipd',
+  'recipe_engine/path',
+  'recipe_engine/step',
+]
+
+
+def RunSteps(api):
+  pkg_defs = []
+  for platform in ('linux-amd64', 'mac-amd64'):
+    root = api.path['start_dir'].join(platform)
+    pkg_def = api.cipd.PackageDefinition(
+        'fuchsia/tools/foo/%s' % platform, root, 'copy')
+    pkg_def.add_file(root.join('foo'))
+    pkg_defs.append(pkg_def)
+
+  pins = api.cipd.publish_many(
+      'publish foo', pkg_defs,
+      refs=['latest'],
+      tags={'git_revision': 'deadbeef'},
+      mirror_dir=api.path['cleanup'].join('mirror'))
+  api.step('instances', ['echo'] + [pin['instance_id'] for pin in pins])
+
+
+def GenTests(api):
+  yield api.test('basic')
@@ -0,0 +1,76 @@
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+DEPS = [
+  'cipd',
+  'recipe_engine/path',
+  'recipe_engine/step',
+]
+
+
+def RunSteps(api):
+  jiri = 'fuchsia/tools/jiri/%s' % api.cipd.platform_suffix()
+  isolated = 'infra/tools/luci/isolated/${platform}'
+  root = api.path['start_dir'].join('cipd')
+
+  # Versions resolved by an ensure are pinned by later ones and need not be
+  # resolved again.
+  api.cipd.ensure(root, {jiri: 'stable'})
+  api.cipd.ensure(root, {jiri: 'stable'})
+  api.step('jiri', ['echo', api.cipd.resolve(jiri, 'stable')])
+
+  # Only the versions which were not yet resolved are.
+  pins = api.cipd.resolve_many({
+      jiri: 'stable',
+      isolated: 'release',
+  })
+  api.step('pins', ['echo', pins[jiri], pins[isolated]])
+
+  # Searches and descriptions are only run once...
+  for _ in range(2):
+    api.cipd.search(jiri, 'git_revision:deadbeef')
+    api.cipd.describe(jiri, 'latest')
+
+  # ...unless the package changes in between.
+  api.cipd.set_ref(jiri, 'git_revision:deadbeef', ['latest'])
+  api.cipd.describe(jiri, 'latest')
+
+  # Builds can be skipped when all their packages are already published.
+  packages = {
+      'fuchsia/clang/${platform}': 'git_revision:deadbeef',
+      'fuchsia/lib/llvm/${platform}': 'git_revision:deadbeef',
+  }
+  if api.cipd.published(packages):
+    # Tags known to be published are not checked again.
+    assert api.cipd.published({
+        'fuchsia/clang/${platform}': 'git_revision:deadbeef',
+    })
+    api.step('packages are up-to-date', cmd=None)
+
+
+def GenTests(api):
+  yield api.test('basic')
+
+  yield (
+      api.test('ensure_output_by_subdir') +
+      api.step_data('ensure_installed', api.json.output({
+          'result': {
+              '': [api.cipd.make_pin('fuchsia/tools/jiri/linux-amd64')],
+          },
+      }))
+  )
+
+  yield (
+      api.test('unpublished') +
+      api.step_data('check published packages', api.cipd.example_error(
+          'no instance of fuchsia/clang/linux-amd64 tagged '
+          'git_revision:deadbeef'))
+  )
+
+  yield (
+      api.test('published_check_failed') +
+      api.step_data('check published packages', api.cipd.example_error(
+          'failed to resolve fuchsia/clang/linux-amd64: '
+          'HTTP 403: permission denied'))
+  )
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Builds, registers and mirrors several CIPD packages concurrently.
+
+The spec is a JSON file of the form:
+  {
+    "packages": [{"pkg_def": <package definition>, "output": <path>,
+                  "mirror_subdir": <path>}, ...],
+    "refs": [<ref>, ...],
+    "tags": {<key>: <value>, ...},
+    "mirror_dir": <path or null>
+  }
+
+Each package is built to its output path and registered. When a mirror
+directory is given, the package file is then also linked to
+<mirror_dir>/<mirror_subdir>/<instance ID>, reusing the instance ID which the
+build computed rather than hashing the file again. The mirror subdir defaults
+to the package name.
+
+The pins of the registered instances are written to the JSON output in the
+order of the packages.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from multiprocessing.pool import ThreadPool
+
+
+def run_cipd(cipd, args):
+  fd, json_output = tempfile.mkstemp(suffix='.json')
+  os.close(fd)
+  try:
+    subprocess.check_call([cipd] + args + ['-json-output', json_output])
+    with open(json_output) as f:
+      return json.load(f)['result']
+  finally:
+    os.remove(json_output)
+
+
+def publish(cipd, package, refs, tags, mirror_dir):
+  fd, pkg_def = tempfile.mkstemp(suffix='.yaml')
+  with os.fdopen(fd, 'w') as f:
+    # JSON is valid YAML, which is what the client expects.
+    json.dump(package['pkg_def'], f)
+  try:
+    built = run_cipd(cipd, [
+        'pkg-build', '-pkg-def', pkg_def, '-out', package['output']])
+  finally:
+    os.remove(pkg_def)
+
+  register_args = ['pkg-register', package['output']]
+  for ref in refs:
+    register_args.extend(['-ref', ref])
+  for key, value in sorted(tags.items()):
+    register_args.extend(['-tag', '%s:%s' % (key, value)])
+  pin = run_cipd(cipd, register_args)
+  assert pin['instance_id'] == built['instance_id'], (pin, built)
+
+  if mirror_dir:
+    mirror_path = os.path.join(
+        mirror_dir, package.get('mirror_subdir') or pin['package'],
+        pin['instance_id'])
+    if not os.path.isdir(os.path.dirname(mirror_path)):
+      os.makedirs(os.path.dirname(mirror_path))
+    try:
+      os.link(package['output'], mirror_path)
+    except OSError:
+      shutil.copyfile(package['output'], mirror_path)
+  return pin
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--cipd', required=True, help='The CIPD client')
+  parser.add_argument('--spec', required=True, type=argparse.FileType('r'),
+                      help='The JSON spec of the packages to publish')
+  parser.add_argument('--jobs', type=int, default=4,
+                      help='How many packages to publish at once')
+  parser.add_argument('--json-output', required=True,
+                      help='Where to write the pins of the packages')
+  args = parser.parse_args()
+
+  spec = json.load(args.spec)
+  pool = ThreadPool(args.jobs)
+  try:
+    results = [
+        pool.apply_async(publish, (args.cipd, package, spec.get('refs', []),
+                                   spec.get('tags', {}),
+                                   spec.get('mirror_dir')))
+        for package in spec['packages']
+    ]
+    pins = [result.get() for result in results]
+  finally:
+    pool.close()
+    pool.join()
+
+  with open(args.json_output, 'w') as f:
+    json.dump({'result': pins}, f)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -41,10 +41,25 @@ class CIPDTestApi(recipe_test_api.RecipeTestApi):
 
   example_register = example_build
 
+  def example_publish_many(self, package_names):
+    return self._resultify([self.make_pin(name) for name in package_names])
+
+  def _expand(self, package_name):
+    # The platform of test runs is linux-amd64 unless overridden.
+    return (package_name.replace('${platform}', 'linux-amd64')
+            .replace('${os}', 'linux').replace('${arch}', 'amd64'))
+
   def example_ensure(self, packages):
-    return self._resultify([self.make_pin(name, version)
+    return self._resultify([self.make_pin(self._expand(name), version)
                            for name, version in sorted(packages.items())])
 
+  def example_ensure_subdirs(self, subdirs):
+    return self._resultify({
+        subdir: [self.make_pin(self._expand(name), version)
+                 for name, version in sorted(packages.items())]
+        for subdir, packages in subdirs.iteritems()
+    })
+
   def example_set_tag(self, package_name, version):
     return self._resultify({
         'package': package_name,
@@ -4,6 +4,7 @@ DEPS = [
     'recipe_engine/file',
     'recipe_engine/json',
     'recipe_engine/path',
+    'recipe_engine/platform',
     'recipe_engine/python',
     'recipe_engine/raw_io',
     'recipe_engine/step',
@@ -2,6 +2,8 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import bisect
+
 from recipe_engine import recipe_api
 from recipe_engine.config import List
 
@@ -11,6 +13,8 @@ class ClangTidyApi(recipe_api.RecipeApi):
 
   def __init__(self, *args, **kwargs):
     super(ClangTidyApi, self).__init__(*args, **kwargs)
+    # Maps file paths to their sizes and the offsets at which their lines start.
+    self._line_starts = {}
 
   def ensure_clang(self):
     with self.m.context(infra_steps=True):
@@ -42,24 +46,31 @@ class ClangTidyApi(recipe_api.RecipeApi):
     offset from the beginning of the file. This converts that number into a line
     and char position.
 
+    Each file is only read once; the offsets at which its lines start are kept
+    for later lookups. Warnings returned by run() and run_many() already have
+    their positions resolved in StartLine and StartChar.
+
     Args:
       filename (str): Path to file.
       offset (int): Offset to convert.
     """
-    file_data = self.m.file.read_text(
-        'read %s' % f, f, test_data='''test
+    key = str(f)
+    if key not in self._line_starts:
+      file_data = self.m.file.read_text(
+          'read %s' % f, f, test_data='''test
 newlineoutput''')
-    line = 1
-    char = 1
-    for i, c in enumerate(file_data):
-      if i + 1 == offset:
-        return line, char
-      if c == '\n':
-        line += 1
-        char = 1
-      else:
-        char += 1
-    return 0, 0
+      line_starts = [0]
+      for i, c in enumerate(file_data):
+        if c == '\n':
+          line_starts.append(i + 1)
+      self._line_starts[key] = (len(file_data), line_starts)
+
+    size, line_starts = self._line_starts[key]
+    index = offset - 1
+    if index < 0 or index >= size:
+      return 0, 0
+    line = bisect.bisect_right(line_starts, index)
+    return line, index - line_starts[line - 1] + 1
 
   def run(self, step_name, filename, compile_commands, checks=['*']):
     """Runs clang-tidy on the specified file and returns parsed json output.
@@ -87,9 +98,55 @@ newlineoutput''')
       ]
 
       step_result = self.m.step('clang-tidy %s' % filename, clang_tidy_cmd)
-      return self._parse_warnings(warnings_file)
+      return self._parse_warnings([warnings_file])
+
+  def run_many(self, step_name, filenames, compile_commands, checks=['*']):
+    """Runs clang-tidy on several files in parallel and returns parsed output.
+
+    Each file is run through clang-tidy concurrently, up to one per core, and
+    writes its own fixes file. All fixes files are then parsed at once.
 
-  def _parse_warnings(self, warnings_file):
+    Args:
+      step_name (str): Name of the step.
+      filenames (seq(str)): Paths to files on which clang-tidy should be run.
+      compile_commands (str): Path to dir containing compile_commands.json.
+      checks (List): List of checks to run for clang-tidy (default is whatever
+        is specified in the .clang-tidy file).
+
+    Returns:
+      A dict of parsed warnings by check for all files, as returned by run().
+    """
+    assert type(checks) == list
+    assert len(checks) > 0
+    if not filenames:
+      return {}
+    with self.m.step.nest(step_name):
+      spec = []
+      for i, filename in enumerate(filenames):
+        spec.append({
+            'file': filename,
+            'fixes': str(self.m.path['cleanup'].join(
+                'clang_tidy_fixes_%d.yaml' % i)),
+        })
+
+      self.m.python(
+          'clang-tidy',
+          self.resource('run_clang_tidy.py'),
+          args=[
+              '--clang-tidy',
+              self.m.path['start_dir'].join('cipd', 'clang', 'bin',
+                                            'clang-tidy'),
+              '-p',
+              compile_commands,
+              '--checks=%s' % ','.join(checks),
+              '--spec',
+              self.m.json.input(spec),
+              '--jobs',
+              self.m.platform.cpu_count,
+          ])
+      return self._parse_warnings([entry['fixes'] for entry in spec])
+
+  def _parse_warnings(self, warnings_files):
     """Parse all warnings output by clang-tidy.
 
     Clang-Tidy issues warnings as follows:
@@ -104,7 +161,8 @@ newlineoutput''')
             ReplacementText: 'replacement text'
 
     Args:
-      raw_warnings (str): YAML-encoded warnings as output by the clang-tidy binary
+      warnings_files (seq(Path)): Paths to the fixes files written by the
+        clang-tidy binary.
 
     Returns:
       A dict of parsed warnings by check.
@@ -136,7 +194,7 @@ newlineoutput''')
     parsed_results = self.m.python(
         'load yaml',
         self.resource('parse_yaml.py'),
-        args=[warnings_file],
+        args=list(warnings_files),
         stdout=self.m.json.output(),
         venv=self.resource('clang-tidy.vpython')).stdout
     if not parsed_results:
@@ -25,9 +25,17 @@ def RunSteps(api):
   one_check = api.clang_tidy.run('step two', 'other/path/to/file',
                                  compile_commands,
                                  ['-*', 'fuchsia-default-arguments'])
+  many_files = api.clang_tidy.run_many('step three',
+                                       ['path/to/file', 'other/path/to/file'],
+                                       compile_commands)
+  assert len(many_files['check']) == 2, many_files
+  no_files = api.clang_tidy.run_many('step four', [], compile_commands)
+  assert no_files == {}, no_files
 
-  api.clang_tidy.get_line_from_offset('path/to/file', 12)
-  api.clang_tidy.get_line_from_offset('other/path/to/file', 65)
+  assert api.clang_tidy.get_line_from_offset('path/to/file', 12) == (2, 7)
+  assert api.clang_tidy.get_line_from_offset('other/path/to/file', 65) == (0, 0)
+  # The file has already been read, so this does not read it again.
+  assert api.clang_tidy.get_line_from_offset('path/to/file', 2) == (1, 2)
 
 
 def GenTests(api):
@@ -53,5 +61,7 @@ newline output
     ) +
     api.step_data(
       'step one.load yaml', stdout=api.json.output(has_errors_json)) +
-         api.step_data('step two.load yaml', stdout=api.json.output(''))
+         api.step_data('step two.load yaml', stdout=api.json.output('')) +
+         api.step_data('step three.load yaml',
+                       stdout=api.json.output(has_errors_json * 2))
   )
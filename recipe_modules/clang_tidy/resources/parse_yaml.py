@@ -3,19 +3,117 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+"""Merges the diagnostics of clang-tidy fixes files into one JSON list.
+
+Fixes files which do not exist are skipped, as clang-tidy may not write one
+when it has nothing to report.
+
+Clang-Tidy marks locations by their offset from the beginning of the file.
+Each diagnostic is given the StartLine and StartChar of its FileOffset, and
+each replacement the File, Text, StartLine, StartChar, EndLine and EndChar of
+its range. Locations which cannot be resolved are given as line 0, char 0.
+"""
+
 import argparse
+import bisect
 import json
+import os
 import sys
 import yaml
 
 
+class LineIndex(object):
+  """Converts file offsets to line and char positions.
+
+  The offsets at which the lines of each file start are computed the first
+  time the file is seen, so that each lookup is a bisection.
+  """
+
+  def __init__(self):
+    self._line_starts = {}
+    self._sizes = {}
+
+  def _load(self, path):
+    if path not in self._line_starts:
+      line_starts = [0]
+      size = 0
+      try:
+        with open(path, 'rb') as f:
+          data = f.read()
+      except IOError:
+        data = None
+      if data is not None:
+        size = len(data)
+        index = data.find('\n')
+        while index != -1:
+          line_starts.append(index + 1)
+          index = data.find('\n', index + 1)
+      self._line_starts[path] = line_starts
+      self._sizes[path] = size
+    return self._line_starts[path], self._sizes[path]
+
+  def position(self, path, offset):
+    """Returns the line and char of the offset, both 1-based.
+
+    Like ClangTidyApi.get_line_from_offset, the offset counts from 1, and
+    (0, 0) is returned when it is out of the file.
+    """
+    line_starts, size = self._load(path)
+    index = offset - 1
+    if index < 0 or index >= size:
+      return 0, 0
+    line = bisect.bisect_right(line_starts, index)
+    return line, index - line_starts[line - 1] + 1
+
+
+def load_diagnostics(path):
+  if not os.path.exists(path):
+    return []
+  with open(path) as f:
+    fixes = yaml.load(f)
+  if not fixes:
+    return []
+  # The fixes file is either a bare list of diagnostics or a document with
+  # the list under 'Diagnostics', depending on the version of clang-tidy.
+  if isinstance(fixes, dict):
+    return fixes.get('Diagnostics') or []
+  return fixes
+
+
+def resolve_offsets(diagnostic, index):
+  if 'FilePath' in diagnostic and 'FileOffset' in diagnostic:
+    line, char = index.position(diagnostic['FilePath'],
+                                diagnostic['FileOffset'])
+    diagnostic['StartLine'] = line
+    diagnostic['StartChar'] = char
+  for replacement in diagnostic.get('Replacements') or []:
+    path = replacement['FilePath']
+    offset = replacement['Offset']
+    start_line, start_char = index.position(path, offset)
+    end_line, end_char = index.position(
+        path, offset + replacement.get('Length', 0))
+    replacement.update({
+        'File': path,
+        'Text': replacement.get('ReplacementText', ''),
+        'StartLine': start_line,
+        'StartChar': start_char,
+        'EndLine': end_line,
+        'EndChar': end_char,
+    })
+
+
 def main():
-  parser = argparse.ArgumentParser()
-  parser.add_argument('file')
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('files', nargs='+', help='The fixes files to parse')
   args = parser.parse_args()
 
-  with open(args.file) as f:
-    print json.dumps(yaml.load(f))
+  index = LineIndex()
+  diagnostics = []
+  for path in args.files:
+    for diagnostic in load_diagnostics(path):
+      resolve_offsets(diagnostic, index)
+      diagnostics.append(diagnostic)
+  print json.dumps(diagnostics)
 
 
 if __name__ == '__main__':
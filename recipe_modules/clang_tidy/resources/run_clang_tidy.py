@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Runs clang-tidy over several files concurrently.
+
+The spec is a JSON file of the form:
+  [
+    {
+      "file": <path to the file to run clang-tidy on>,
+      "fixes": <path to write the fixes for the file to>
+    },
+    ...
+  ]
+
+Each file gets its own fixes file, since clang-tidy overwrites the file passed
+to --export-fixes. All files are run even if some of them fail, in which case
+the script exits with a non-zero status.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from multiprocessing.pool import ThreadPool
+
+
+def run_clang_tidy(clang_tidy, compile_commands, checks, entry):
+  cmd = [
+      clang_tidy,
+      '-p',
+      compile_commands,
+      '--checks=%s' % checks,
+      '--export-fixes',
+      entry['fixes'],
+      entry['file'],
+  ]
+  process = subprocess.Popen(
+      cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  output, _ = process.communicate()
+  return process.returncode, output
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--clang-tidy', required=True,
+                      help='The clang-tidy binary')
+  parser.add_argument('-p', dest='compile_commands', required=True,
+                      help='Path to dir containing compile_commands.json')
+  parser.add_argument('--checks', required=True,
+                      help='Comma-separated list of checks to run')
+  parser.add_argument('--spec', required=True, type=argparse.FileType('r'),
+                      help='The JSON spec of the files to run clang-tidy on')
+  parser.add_argument('--jobs', type=int, default=8,
+                      help='How many files to run clang-tidy on at once')
+  args = parser.parse_args()
+
+  spec = json.load(args.spec)
+  pool = ThreadPool(args.jobs)
+  try:
+    results = [
+        pool.apply_async(run_clang_tidy, (args.clang_tidy,
+                                          args.compile_commands, args.checks,
+                                          entry))
+        for entry in spec
+    ]
+    failed = []
+    # Print the output of each file in order, as a block, so that the output
+    # of concurrent runs is not interleaved.
+    for entry, result in zip(spec, results):
+      returncode, output = result.get()
+      print '==== clang-tidy %s (exit code %d)' % (entry['file'], returncode)
+      sys.stdout.write(output)
+      sys.stdout.flush()
+      if returncode:
+        failed.append(entry['file'])
+  finally:
+    pool.close()
+    pool.join()
+
+  if failed:
+    print 'clang-tidy failed on: %s' % ', '.join(failed)
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,5 +1,6 @@
 DEPS = [
     'infra/checkout',
+    'infra/cipd',
     'infra/cloudkms',
     'infra/gerrit',
     'infra/git',
@@ -8,6 +9,7 @@ DEPS = [
     'infra/gsutil',
     'infra/isolated',
     'infra/jiri',
+    'infra/lkgs',
     'infra/minfs',
     'infra/ninja',
     'infra/qemu',
@@ -15,7 +17,6 @@ DEPS = [
     'infra/tar',
     'infra/testsharder',
     'infra/zbi',
-    'recipe_engine/cipd',
     'recipe_engine/buildbucket',
     'recipe_engine/context',
     'recipe_engine/json',
@@ -26,6 +27,7 @@ DEPS = [
     'recipe_engine/python',
     'recipe_engine/raw_io',
     'recipe_engine/step',
+    'recipe_engine/time',
 ]
 
 from recipe_engine.recipe_api import Property
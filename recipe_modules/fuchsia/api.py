@@ -5,8 +5,11 @@
 from recipe_engine import recipe_api
 
 import collections
+import copy
+import math
 import os
 import pipes
+import re
 
 # Host architecture -> number of bits -> host platform name.
 # Add to this dictionary as we support building on more devices.
@@ -32,10 +35,35 @@ GUID_SYSTEM_STRING = '606B000B-B7C7-4653-A7D5-B737332C899D'
 # The PCI address to use for the block device to contain test results.
 TEST_FS_PCI_ADDR = '06.0'
 
+# The maximum number of QEMU instances which may be packed into a single
+# Swarming task. Each instance is assigned its own PCI slot for its test
+# results block device, starting at TEST_FS_PCI_ADDR.
+MAX_QEMU_INSTANCES_PER_TASK = 8
+
+# The isolate server namespace for the images tested on devices. Those are
+# already compressed (the ZBI's bootfs and the sparse FVM), so gzipping them
+# again only costs time on the builder and on every bot.
+DEVICE_TEST_ISOLATE_NAMESPACE = 'default'
+
 # How long to wait (in seconds) before killing the test swarming task if there's
 # no output being produced.
 TEST_IO_TIMEOUT_SECS = 180
 
+# How many times longer than with KVM tests are given to run in QEMU when they
+# fall back to a bot without KVM, where the CPU is emulated.
+NON_KVM_TIMEOUT_MULTIPLIER = 4
+
+# How often (in seconds) to check for straggling test tasks when hedging.
+HEDGE_POLL_INTERVAL_SECS = 60
+
+# The fraction of test tasks which must complete before the durations of the
+# remaining ones are considered for hedging.
+HEDGE_QUORUM = 0.5
+
+# How long (in seconds) to keep collecting test tasks past the latest time at
+# which Swarming should have expired or killed them.
+COLLECT_DEADLINE_SLACK_SECS = 10 * 60
+
 # The path in the BootFS manifest that we want runcmds to show up at.
 RUNCMDS_BOOTFS_PATH = 'infra/runcmds'
 
@@ -141,6 +169,23 @@ class FuchsiaBuildResults(object):
       self._api._upload_build_results(self, gcs_bucket, upload_breakpad_symbols)
 
 
+class _PackedShardResult(object):
+  """The portion of a swarming.CollectResult belonging to one packed shard.
+
+  Exposes the same interface as swarming.CollectResult, so that it may be
+  analyzed like the result of a task which ran a single shard.
+  """
+
+  def __init__(self, result, name, state, output, archive_name):
+    self.id = result.id
+    self.state = state
+    self.name = name
+    self.output = output
+    self.outputs = {}
+    if archive_name in result.outputs:
+      self.outputs[archive_name] = result.outputs[archive_name]
+
+
 class FuchsiaApi(recipe_api.RecipeApi):
   """APIs for checking out, building, and testing Fuchsia."""
 
@@ -242,15 +287,22 @@ class FuchsiaApi(recipe_api.RecipeApi):
 
   def __init__(self, fuchsia_properties, *args, **kwargs):
     super(FuchsiaApi, self).__init__(*args, **kwargs)
+    self._snapshot_gcs_bucket = fuchsia_properties.get('snapshot_gcs_bucket')
     self._test_coverage_gcs_bucket = fuchsia_properties.get(
         'test_coverage_gcs_bucket')
+    # The directories of the CIPD tools which have been ensured.
+    self._ninjatrace_dir = None
+    self._bloaty_dir = None
+    self._covargs_dir = None
 
   def checkout(self,
                build,
                manifest,
                remote,
                project=None,
-               timeout_secs=40 * 60):
+               timeout_secs=40 * 60,
+               projects=None,
+               packages=None):
     """Uses Jiri to check out a Fuchsia project.
 
     The root of the checkout is returned via FuchsiaCheckoutResults.root_dir.
@@ -262,6 +314,10 @@ class FuchsiaApi(recipe_api.RecipeApi):
       project (str): The name of the project
       timeout_secs (int): How long to wait for the checkout to complete
           before failing
+      projects (seq(str)): If set, check out only these Jiri projects, and
+          those containing `packages`. See api.checkout.
+      packages (seq(str)): Paths or GN labels within the checkout whose
+          projects should be checked out sparsely.
 
     Returns:
       A FuchsiaCheckoutResults containing details of the checkout.
@@ -276,6 +332,8 @@ class FuchsiaApi(recipe_api.RecipeApi):
             build_input=build.input if build else None,
             timeout_secs=timeout_secs,
             override=project == 'integration' and not global_integration,
+            projects=projects,
+            packages=packages,
         )
 
         snapshot_file = self.m.path['cleanup'].join('jiri.snapshot')
@@ -391,6 +449,61 @@ class FuchsiaApi(recipe_api.RecipeApi):
 
       return self._checkout_snapshot(snapshot_repo_dir=snapshot_repo_dir)
 
+  def has_relevant_changes(self, checkout, projects):
+    """Determines whether a CI build has anything relevant to build.
+
+    The snapshot of the checkout is compared with the snapshot which the last
+    good build of this builder uploaded via
+    FuchsiaCheckoutResults.upload_results. If $infra/fuchsia.snapshot_gcs_bucket
+    is set, this build's snapshot is uploaded in turn for the next build to
+    compare with.
+
+    Tryjobs, and builds for which no previous snapshot is found, always have
+    relevant changes.
+
+    Args:
+      checkout (FuchsiaCheckoutResults): The checkout of this build.
+      projects (seq(str)): The names of the jiri projects which the builder
+        depends on.
+
+    Returns:
+      Whether any of the projects changed. If not, the build should end early;
+      a step says that nothing relevant changed.
+    """
+    build = self.m.buildbucket.build
+    if build.input.gerrit_changes:
+      return True
+
+    with self.m.step.nest('check for relevant changes') as step_result:
+      if self._snapshot_gcs_bucket:
+        checkout.upload_results(self._snapshot_gcs_bucket)
+
+      self.m.lkgs.ensure_lkgs()
+      previous_snapshot = self.m.path['cleanup'].join('previous.snapshot')
+      try:
+        self.m.lkgs(
+            step_name='fetch previous snapshot',
+            builder=['%s/%s/%s' % (build.builder.project, build.builder.bucket,
+                                   build.builder.builder)],
+            output_file=previous_snapshot)
+      except self.m.step.StepFailure:
+        step_result.presentation.step_text = 'no previous snapshot'
+        return True
+
+      changes = self.m.jiri.diff_snapshots(previous_snapshot,
+                                           checkout.snapshot_file)
+      step_result.presentation.logs['changed projects'] = [
+          '%s: %s -> %s' % (name, old, new)
+          for name, (old, new) in sorted(changes.iteritems())
+      ]
+      relevant = sorted(set(changes).intersection(projects))
+      if relevant:
+        step_result.presentation.step_text = ', '.join(relevant)
+        return True
+
+    self.m.step('nothing relevant changed', cmd=None)
+    return False
+
   # TODO(IN-690): DEPRECATED. Do not extend this method. Move it to CheckoutApi.
   def _checkout_snapshot(self, snapshot_repo_dir):
     # Read the snapshot so it shows up in the step presentation.
@@ -407,15 +520,13 @@ class FuchsiaApi(recipe_api.RecipeApi):
       cherrypick_json = self.m.file.read_raw(
           'read cherrypick file', cherrypick_file, '{\"topaz\":[\"test\"]}')
       cherrypick_dict = self.m.json.loads(cherrypick_json)
+      snapshot = self.m.jiri.read_manifest(snapshot_file)
 
       for project, cherrypicks in cherrypick_dict.items():
         # Get the project relative checkout path and join it to the start_dir.
         # path always exists in the snapshot file, so we don't need to check for its existance.
         project_path = self.m.path['start_dir'].join(
-            self.m.jiri.read_manifest_element(
-                manifest=snapshot_file,
-                element_type='project',
-                element_name=project)['path'])
+            snapshot.projects[project]['path'])
 
         for cherrypick in cherrypicks:
           self.m.git('-C', project_path, 'cherry-pick', cherrypick,
@@ -659,11 +770,17 @@ class FuchsiaApi(recipe_api.RecipeApi):
     self._symbolize_compat(build_dir, data)
     self._symbolize_filter(build_dir, data, json_output)
 
-  def _isolate_files_at_isolated_root(self, files):
+  def _isolate_files_at_isolated_root(self, files, namespace='default-gzip',
+                                      use_digest_cache=False):
     """Isolates a set of files such that they all appear at the top-level.
 
     Args:
       files (seq[Path]): A list of paths which point to files to be isolated.
+      namespace (str): The namespace on the isolate server to archive to.
+      use_digest_cache (bool): Whether to reuse the isolated archived by an
+        earlier build with the same files. An isolated with a file generated
+        afresh by every build (e.g. a MinFS image or a ZBI with runcmds) is
+        never reused, so this only adds to the cost of archiving it.
 
     Returns:
       The isolated hash that may be used to reference and download the
@@ -673,7 +790,7 @@ class FuchsiaApi(recipe_api.RecipeApi):
 
     self.m.isolated.ensure_isolated(version='latest')
 
-    isolated = self.m.isolated.isolated()
+    isolated = self.m.isolated.isolated(namespace=namespace)
 
     # Add the extra files to isolated at the top-level.
     names = set()
@@ -685,8 +802,8 @@ class FuchsiaApi(recipe_api.RecipeApi):
       isolated.add_file(
           path, wd=self.m.path.abs_to_path(self.m.path.dirname(path)))
 
-    # Archive the isolated.
-    return isolated.archive('isolate artifacts')
+    return isolated.archive(
+        'isolate artifacts', use_digest_cache=use_digest_cache)
 
   @property
   def results_dir_on_target(self):
@@ -755,12 +872,13 @@ class FuchsiaApi(recipe_api.RecipeApi):
         json_api=self.m.json,
     )
 
-  def _create_runcmds_script(self, device_type, test_cmds, output_path):
+  def _create_runcmds_script(self, device_type, test_cmds, output_path,
+                             pci_addr=TEST_FS_PCI_ADDR):
     """Creates a script for running tests on boot."""
     # The device topological path is the toplogical path to the block device
     # which will contain test output.
     device_topological_path = '/dev/sys/pci/00:%s/virtio-block/block' % (
-        TEST_FS_PCI_ADDR)
+        pci_addr)
 
     # Script that mounts the block device to contain test output and runs tests,
     # dropping test output into the block device.
@@ -782,9 +900,124 @@ class FuchsiaApi(recipe_api.RecipeApi):
     self.m.file.write_text('write runcmds', output_path, '\n'.join(runcmds))
     self.m.step.active_result.presentation.logs['runcmds'] = runcmds
 
+  def _botanist_qemu_cmd(self, build, zbi_name, storage_full_name,
+                         qemu_kernel_name, minfs_image_name,
+                         pci_addr=TEST_FS_PCI_ADDR, external_network=False,
+                         use_kvm=True):
+    """Returns a botanist command which boots a single QEMU instance.
+
+    All *_name arguments are relative paths to the corresponding artifacts
+    inside the test Swarming task.
+    """
+    botanist_cmd = [
+      './botanist/botanist',
+      'qemu',
+      '-qemu-dir', './qemu/bin',
+      '-qemu-kernel', qemu_kernel_name,
+      '-zircon-a', zbi_name,
+      '-storage-full', storage_full_name,
+      '-arch', build.target,
+      '-minfs', minfs_image_name,
+      '-pci-addr', pci_addr,
+    ] # yapf: disable
+
+    if use_kvm:
+      botanist_cmd.append('-use-kvm')
+    if external_network:
+      botanist_cmd.append('-enable-networking')
+
+    botanist_cmd.append(
+        'zircon.autorun.system=/boot/bin/sh+/boot/%s' % RUNCMDS_BOOTFS_PATH)
+    return botanist_cmd
+
+  def _pinned_test_cipd_packages(self, packages):
+    """Returns test task CIPD packages with their latest versions pinned.
+
+    QEMU test tasks are idempotent, so Swarming may reuse the results of an
+    earlier task with the same properties. Pinning the versions to instance IDs
+    keeps a new release of a package from being mistaken for the one a cached
+    result was produced with. Each version is only resolved once per build.
+
+    Args:
+      packages (seq((str, str))): The (path, package name) of each package,
+        where path is relative to the Swarming root dir in which to install
+        the package.
+
+    Returns:
+      A list of (path, package, instance ID) tuples for
+      TaskRequest.cipd_packages.
+    """
+    pins = self.m.cipd.resolve_many(
+        {package: 'latest' for _, package in packages})
+    return [(path, package, pins[package]) for path, package in packages]
+
+  @staticmethod
+  def _qemu_dimensions(build, test_pool):
+    """Returns the Swarming dimensions of bots which can run QEMU for build.
+
+    Bots with KVM additionally have the dimension kvm:1.
+    """
+    return {
+        'pool': test_pool,
+        'os': 'Debian',
+        'cpu': {
+            'arm64': 'arm64',
+            'x64': 'x86-64',
+        }[build.target],
+    }
+
+  def _qemu_task_request(self, task_name, cmd, build, test_pool, files,
+                         outputs, timeout_secs, secret_bytes='',
+                         kvm_expiration_secs=None, non_kvm_cmd=None,
+                         idempotent=True):
+    """Isolates files and wraps cmd in a QEMU Swarming task request.
+
+    If kvm_expiration_secs is set, the task falls back to running non_kvm_cmd
+    on a bot without KVM when no bot with KVM picks it up in that many seconds.
+    Tasks with secret_bytes are never idempotent.
+    """
+    # Isolate the Fuchsia build artifacts in addition to the test images and
+    # the qemu runner.
+    isolated_hash = self._isolate_files_at_isolated_root(files)
+
+    cipd_arch = {
+        'arm64': 'arm64',
+        'x64': 'amd64',
+    }[build.target]
+
+    dimensions = self._qemu_dimensions(build, test_pool)
+    fallback_slices = []
+    expiration_secs = 300
+    if kvm_expiration_secs:
+      assert non_kvm_cmd
+      fallback_slices.append(self.m.swarming.TaskSlice(
+          dimensions=dimensions,
+          cmd=non_kvm_cmd,
+          hard_timeout_secs=timeout_secs * NON_KVM_TIMEOUT_MULTIPLIER,
+      ))
+      expiration_secs = kvm_expiration_secs
+
+    return self.m.swarming.task_request(
+        name=task_name,
+        cmd=cmd,
+        isolated=isolated_hash,
+        dimensions=dict(dimensions, kvm='1'),
+        expiration_secs=expiration_secs,
+        fallback_slices=fallback_slices,
+        io_timeout_secs=TEST_IO_TIMEOUT_SECS,
+        hard_timeout_secs=timeout_secs,
+        idempotent=idempotent and not secret_bytes,
+        secret_bytes=secret_bytes,
+        outputs=outputs,
+        cipd_packages=self._pinned_test_cipd_packages([
+            ('qemu', 'fuchsia/qemu/linux-%s' % cipd_arch),
+            ('botanist', 'fuchsia/infra/botanist/linux-%s' % cipd_arch),
+        ]),
+    )
+
   def _construct_qemu_task_request(self, task_name, zbi_path, build, test_pool,
                                    timeout_secs, external_network,
-                                   secret_bytes):
+                                   secret_bytes, kvm_expiration_secs=None):
     """Constructs a Swarming task request which runs Fuchsia tests inside QEMU.
 
     Expects the build and artifacts to be at the same place they were at
@@ -798,6 +1031,8 @@ class FuchsiaApi(recipe_api.RecipeApi):
       external_network (bool): Whether to give Fuchsia inside QEMU access
         to the external network.
       secret_bytes (str): secret bytes to pass to the QEMU task.
+      kvm_expiration_secs (int): If set, the number of seconds to wait for a
+        bot with KVM before falling back to any bot which can run QEMU.
 
     Returns:
       An api.swarming.TaskRequest representing the swarming task request.
@@ -811,13 +1046,6 @@ class FuchsiaApi(recipe_api.RecipeApi):
     storage_full_path = build.images['storage-full']
     qemu_kernel_path = build.images['qemu-kernel']
 
-    # All the *_name references below act as relative paths to the corresponding
-    # artifacts in the test Swarming task, since we isolate all of the artifacts
-    # into the root directory where the isolate is extracted.
-    zbi_name = self.m.path.basename(zbi_path)
-    storage_full_name = self.m.path.basename(storage_full_path)
-    qemu_kernel_name = self.m.path.basename(qemu_kernel_path)
-
     # As part of running tests, we'll send a MinFS image over to another machine
     # which will be declared as a block device in QEMU, at which point
     # Fuchsia will mount it and write test output to.
@@ -829,65 +1057,157 @@ class FuchsiaApi(recipe_api.RecipeApi):
     minfs_image_path = self.m.path['start_dir'].join(minfs_image_name)
     self.m.minfs.create(minfs_image_path, '1G', name='create test image')
 
-    botanist_cmd = [
-      './botanist/botanist',
-      'qemu',
-      '-qemu-dir', './qemu/bin',
-      '-qemu-kernel', qemu_kernel_name,
-      '-zircon-a', zbi_name,
-      '-storage-full', storage_full_name,
-      '-arch', build.target,
-      '-minfs', minfs_image_name,
-      '-pci-addr', TEST_FS_PCI_ADDR,
-      '-use-kvm'
-    ] # yapf: disable
+    # All the *_name references below act as relative paths to the corresponding
+    # artifacts in the test Swarming task, since we isolate all of the artifacts
+    # into the root directory where the isolate is extracted.
+    def botanist_cmd(use_kvm):
+      return self._botanist_qemu_cmd(
+          build=build,
+          zbi_name=self.m.path.basename(zbi_path),
+          storage_full_name=self.m.path.basename(storage_full_path),
+          qemu_kernel_name=self.m.path.basename(qemu_kernel_path),
+          minfs_image_name=minfs_image_name,
+          external_network=external_network,
+          use_kvm=use_kvm,
+      )
 
-    if external_network:
-      botanist_cmd.append('-enable-networking')
+    return self._qemu_task_request(
+        task_name=task_name,
+        cmd=botanist_cmd(use_kvm=True),
+        build=build,
+        test_pool=test_pool,
+        files=[
+            zbi_path,
+            storage_full_path,
+            qemu_kernel_path,
+            minfs_image_path,
+        ],
+        outputs=[minfs_image_name],
+        timeout_secs=timeout_secs,
+        secret_bytes=secret_bytes,
+        kvm_expiration_secs=kvm_expiration_secs,
+        non_kvm_cmd=botanist_cmd(use_kvm=False),
+        # The results of tests which reach the external network depend on more
+        # than the inputs to the task.
+        idempotent=not external_network,
+    )
 
-    botanist_cmd.append(
-        'zircon.autorun.system=/boot/bin/sh+/boot/%s' % RUNCMDS_BOOTFS_PATH)
+  def _construct_packed_qemu_task_request(self, task_name, shards, build,
+                                          test_pool, timeout_secs,
+                                          kvm_expiration_secs=None):
+    """Constructs a Swarming task request which runs several QEMU instances.
 
-    # Isolate the Fuchsia build artifacts in addition to the test image and the
-    # qemu runner.
-    isolated_hash = self._isolate_files_at_isolated_root([
-        zbi_path,
-        storage_full_path,
-        qemu_kernel_path,
-        minfs_image_path,
-    ])
+    Each shard is booted in its own QEMU instance, with its own copy of the
+    storage-full image and its own MinFS image for test output, and all the
+    instances run concurrently inside of the same Swarming task. Every line of
+    output produced by an instance is prefixed with the name of its shard so
+    that the task output may be demultiplexed with _demux_packed_output(), and
+    every instance records its exit status in a status file of its own which
+    is output alongside its MinFS image.
 
-    cipd_arch = {
-        'arm64': 'arm64',
-        'x64': 'amd64',
-    }[build.target]
+    Args:
+      task_name (str): The name of the Swarming task.
+      shards (seq[(str, Path, str)]): A sequence of (shard name, ZBI path, PCI
+        address) tuples, one for each QEMU instance.
+      build (FuchsiaBuildResults): The Fuchsia build to test.
+      test_pool (str): Swarming pool from which the test task will be drawn.
+      timeout_secs (int): The amount of seconds to wait for the tests to
+        execute before giving up.
+      kvm_expiration_secs (int): If set, the number of seconds to wait for a
+        bot with KVM before falling back to any bot which can run QEMU.
 
-    dimension_cpu = {
-        'arm64': 'arm64',
-        'x64': 'x86-64',
-    }[build.target]
+    Returns:
+      An api.swarming.TaskRequest representing the swarming task request.
+    """
+    assert 1 < len(shards) <= MAX_QEMU_INSTANCES_PER_TASK
+    self.m.swarming.ensure_swarming(version='latest')
 
-    return self.m.swarming.task_request(
-        name=task_name,
-        cmd=botanist_cmd,
-        isolated=isolated_hash,
-        dimensions={
-            'pool': test_pool,
-            'os': 'Debian',
-            'cpu': dimension_cpu,
-            'kvm': '1',
-        },
-        io_timeout_secs=TEST_IO_TIMEOUT_SECS,
-        hard_timeout_secs=timeout_secs,
-        secret_bytes=secret_bytes,
-        outputs=[minfs_image_name],
-        cipd_packages=[
-            ('qemu', 'fuchsia/qemu/linux-%s' % cipd_arch, 'latest'),
-            ('botanist', 'fuchsia/infra/botanist/linux-%s' % cipd_arch,
-             'latest'),
-        ],
+    storage_full_path = build.images['storage-full']
+    qemu_kernel_path = build.images['qemu-kernel']
+    storage_full_name = self.m.path.basename(storage_full_path)
+
+    files = [storage_full_path, qemu_kernel_path]
+    outputs = []
+    instances = []
+    for i, (shard_name, zbi_path, pci_addr) in enumerate(shards):
+      minfs_image_name = self._packed_minfs_image_name(shard_name)
+      minfs_image_path = self.m.path['start_dir'].join(minfs_image_name)
+      self.m.minfs.create(
+          minfs_image_path, '1G', name='create test image for %s' % shard_name)
+      files.extend([zbi_path, minfs_image_path])
+      outputs.extend([
+          minfs_image_name,
+          self._packed_status_file_name(shard_name),
+      ])
+      # QEMU instances must not share a writable disk image, so give each one
+      # its own copy of storage-full.
+      instances.append((shard_name, '%d-%s' % (i, storage_full_name),
+                        self.m.path.basename(zbi_path), minfs_image_name,
+                        pci_addr))
+
+    def packed_cmd(use_kvm):
+      script = []
+      for (shard_name, instance_storage_full_name, zbi_name, minfs_image_name,
+           pci_addr) in instances:
+        botanist_cmd = self._botanist_qemu_cmd(
+            build=build,
+            zbi_name=zbi_name,
+            storage_full_name=instance_storage_full_name,
+            qemu_kernel_name=self.m.path.basename(qemu_kernel_path),
+            minfs_image_name=minfs_image_name,
+            pci_addr=pci_addr,
+            use_kvm=use_kvm,
+        )
+        # Escape the characters which are special in the replacement of a sed
+        # substitution, so that any shard name is prefixed verbatim.
+        sed_prefix = re.sub(r'([\\/&])', r'\\\1', '[%s] ' % shard_name)
+        script.append(
+            '(cp --sparse=always %s %s && %s; echo $? > %s) 2>&1 | '
+            'sed -u %s &' % (
+                pipes.quote(storage_full_name),
+                pipes.quote(instance_storage_full_name),
+                ' '.join(pipes.quote(arg) for arg in botanist_cmd),
+                pipes.quote(self._packed_status_file_name(shard_name)),
+                pipes.quote('s/^/%s/' % sed_prefix),
+            ))
+
+      # The exit status of each instance is reported through its status file,
+      # so that a failing instance fails only its own shard; the task itself
+      # succeeds once every instance has finished.
+      script.append('wait')
+      return ['/bin/sh', '-c', '\n'.join(script)]
+
+    return self._qemu_task_request(
+        task_name=task_name,
+        cmd=packed_cmd(use_kvm=True),
+        build=build,
+        test_pool=test_pool,
+        files=files,
+        outputs=outputs,
+        timeout_secs=timeout_secs,
+        kvm_expiration_secs=kvm_expiration_secs,
+        non_kvm_cmd=packed_cmd(use_kvm=False),
     )
 
+  @staticmethod
+  def _packed_minfs_image_name(shard_name):
+    """The name of the MinFS image holding test output for a packed shard."""
+    return 'output-%s.fs' % shard_name
+
+  @staticmethod
+  def _packed_status_file_name(shard_name):
+    """The name of the file holding the exit status of a packed shard."""
+    return '%s.status' % shard_name
+
+  @staticmethod
+  def _demux_packed_output(output, shard_name):
+    """Extracts the output of one shard from the output of a packed task."""
+    prefix = '[%s] ' % shard_name
+    return '\n'.join(
+        line[len(prefix):]
+        for line in output.split('\n')
+        if line.startswith(prefix))
+
   def _construct_device_task_request(self, task_name, device_type, zbi_path,
                                      build, test_pool, pave, timeout_secs):
     """Constructs a Swarming task request to run Fuchsia tests on a device.
@@ -955,7 +1275,8 @@ class FuchsiaApi(recipe_api.RecipeApi):
         'zircon.autorun.system=/boot/bin/sh+/boot/%s' % RUNCMDS_BOOTFS_PATH)
 
     # Isolate all the necessary artifacts used by the botanist command.
-    isolated_hash = self._isolate_files_at_isolated_root(image_paths)
+    isolated_hash = self._isolate_files_at_isolated_root(
+        image_paths, namespace=DEVICE_TEST_ISOLATE_NAMESPACE)
 
     return self.m.swarming.task_request(
         name=task_name,
@@ -967,9 +1288,13 @@ class FuchsiaApi(recipe_api.RecipeApi):
         },
         io_timeout_secs=TEST_IO_TIMEOUT_SECS,
         hard_timeout_secs=timeout_secs,
+        # Device tasks are not idempotent: their results also depend on the
+        # state of the device, which a cached result says nothing about.
+        namespace=DEVICE_TEST_ISOLATE_NAMESPACE,
         outputs=[output_archive_name],
-        cipd_packages=[('botanist', 'fuchsia/infra/botanist/linux-amd64',
-                        'latest')],
+        cipd_packages=self._pinned_test_cipd_packages([
+            ('botanist', 'fuchsia/infra/botanist/linux-amd64'),
+        ]),
     )
 
   def _extract_test_results(self, device_type, archive_path, shard_name='', leak_to=None):
@@ -1156,7 +1481,10 @@ class FuchsiaApi(recipe_api.RecipeApi):
     )
 
   # TODO(mknyszek): Rename to test and delete test when this is stable.
-  def test_in_shards(self, test_pool, build, timeout_secs=40 * 60):
+  def test_in_shards(self, test_pool, build, timeout_secs=40 * 60,
+                     qemu_shards_per_task=1, fail_fast=False,
+                     hedge_percentile=None, kvm_expiration_secs=None,
+                     fit_to_capacity=False):
     """Tests a Fuchsia build by sharding.
 
     Expects the build and artifacts to be at the same place they were at
@@ -1167,10 +1495,27 @@ class FuchsiaApi(recipe_api.RecipeApi):
       build (FuchsiaBuildResults): The Fuchsia build to test.
       timeout_secs (int): The amount of seconds to wait for the tests to
         execute before giving up.
+      qemu_shards_per_task (int): The maximum number of QEMU shards to pack
+        into a single Swarming task. Packed shards run in concurrent QEMU
+        instances on the same bot, and their results are still reported
+        separately.
+      fail_fast (bool): Whether to cancel the remaining test tasks as soon as
+        one shard fails. Intended for tryjobs, where a single failure is
+        enough to reject the change.
+      hedge_percentile (int): If set, launch a duplicate of any test task which
+        runs longer than this percentile of the durations of the tasks which
+        already completed, and use whichever copy finishes first.
+      kvm_expiration_secs (int): If set, the number of seconds QEMU test tasks
+        wait for a bot with KVM before falling back to any bot which can run
+        QEMU, with NON_KVM_TIMEOUT_MULTIPLIER times the timeout.
+      fit_to_capacity (bool): Whether to merge the shards of each device type
+        down to the number which the idle Swarming bots can run at once.
 
     Returns:
       A list of FuchsiaTestResults representing the completed test tasks.
     """
+    assert 1 <= qemu_shards_per_task <= MAX_QEMU_INSTANCES_PER_TASK
+
     # Run the testsharder to collect test specifications and shard them.
     self.m.testsharder.ensure_testsharder()
     shards = self.m.testsharder.execute(
@@ -1189,13 +1534,30 @@ class FuchsiaApi(recipe_api.RecipeApi):
     self.m.swarming.ensure_swarming(version='latest')
     self.m.isolated.ensure_isolated(version='latest')
 
+    if fit_to_capacity:
+      shards = self._fit_shards_to_capacity(
+          shards, build, test_pool, qemu_shards_per_task)
+
     # Generate Swarming task requests.
     task_requests = []
     shard_name_to_device_type = {}
+    # Maps the name of each Swarming task to the names of the shards it runs.
+    task_name_to_shard_names = collections.OrderedDict()
+    # (shard name, ZBI path, PCI address) for each QEMU shard, to be packed
+    # into tasks once all shards have been processed.
+    qemu_shards = []
     for shard in shards:
       with self.m.step.nest('shard %s' % shard.name):
         shard_name_to_device_type[shard.name] = shard.device_type
 
+        # Packed QEMU instances each get their own PCI slot for the block
+        # device holding test results.
+        pci_addr = TEST_FS_PCI_ADDR
+        if shard.device_type == 'QEMU' and qemu_shards_per_task > 1:
+          pci_addr = '%02x.0' % (
+              int(TEST_FS_PCI_ADDR.split('.')[0], 16) +
+              len(qemu_shards) % qemu_shards_per_task)
+
         # Produce runtests file for shard.
         test_locations = []
         for test in shard.tests:
@@ -1220,6 +1582,7 @@ class FuchsiaApi(recipe_api.RecipeApi):
                 )
             ],
             output_path=runcmds_path,
+            pci_addr=pci_addr,
         )
 
         # Create new zbi image for shard.
@@ -1237,6 +1600,9 @@ class FuchsiaApi(recipe_api.RecipeApi):
         )
 
         if shard.device_type == 'QEMU':
+          if qemu_shards_per_task > 1:
+            qemu_shards.append((shard.name, shard_zbi_path, pci_addr))
+            continue
           task_requests.append(self._construct_qemu_task_request(
               task_name=shard.name,
               zbi_path=shard_zbi_path,
@@ -1246,6 +1612,7 @@ class FuchsiaApi(recipe_api.RecipeApi):
               # TODO(IN-654): Add support for external_network and secret_bytes.
               external_network=False,
               secret_bytes='',
+              kvm_expiration_secs=kvm_expiration_secs,
           ))
         else:
           task_requests.append(self._construct_device_task_request(
@@ -1258,11 +1625,52 @@ class FuchsiaApi(recipe_api.RecipeApi):
               # TODO(IN-655): Add support for non-paving tests.
               pave=True,
           ))
+        task_name_to_shard_names[shard.name] = [shard.name]
+
+    # Pack the QEMU shards into tasks of up to qemu_shards_per_task instances.
+    for i in xrange(0, len(qemu_shards), qemu_shards_per_task):
+      packed = qemu_shards[i:i + qemu_shards_per_task]
+      shard_names = [shard_name for shard_name, _, _ in packed]
+      task_name = '+'.join(shard_names)
+      with self.m.step.nest('task %s' % task_name):
+        if len(packed) == 1:
+          shard_name, shard_zbi_path, _ = packed[0]
+          task_requests.append(self._construct_qemu_task_request(
+              task_name=task_name,
+              zbi_path=shard_zbi_path,
+              test_pool=test_pool,
+              build=build,
+              timeout_secs=timeout_secs,
+              external_network=False,
+              secret_bytes='',
+              kvm_expiration_secs=kvm_expiration_secs,
+          ))
+        else:
+          task_requests.append(self._construct_packed_qemu_task_request(
+              task_name=task_name,
+              shards=packed,
+              build=build,
+              test_pool=test_pool,
+              timeout_secs=timeout_secs,
+              kvm_expiration_secs=kvm_expiration_secs,
+          ))
+      task_name_to_shard_names[task_name] = shard_names
 
     with self.m.context(infra_steps=True):
       # Spawn tasks.
       tasks_json = self.m.swarming.spawn_tasks(tasks=task_requests)
 
+      if fail_fast or hedge_percentile:
+        return self._collect_shards_incrementally(
+            tasks_json=tasks_json,
+            task_requests={task.name: task for task in task_requests},
+            task_name_to_shard_names=task_name_to_shard_names,
+            shard_name_to_device_type=shard_name_to_device_type,
+            build=build,
+            fail_fast=fail_fast,
+            hedge_percentile=hedge_percentile,
+        )
+
       # Collect results.
       results = self.m.swarming.collect(
           tasks_json=self.m.json.input(tasks_json))
@@ -1270,34 +1678,413 @@ class FuchsiaApi(recipe_api.RecipeApi):
       # Iterate over all task results, check them, and collect test results.
       fuchsia_test_results = []
       for result in results:
-        # Figure out what happened to the swarming tasks.
-        self.analyze_collect_result(
-            step_name='%s task results' % result.name,
-            result=result,
-            build_dir=build.fuchsia_build_dir,
-        )
-        # Extract test results (there should only be one archive).
-        assert len(result.outputs) == 1
-        archive_name = result.outputs.keys()[0]
-        results_dir = self.results_dir_on_host.join(result.id)
-        test_results_map = self._extract_test_results(
-            shard_name=result.name,
-            device_type=shard_name_to_device_type[result.name],
-            archive_path=result.outputs[archive_name],
-            # Write test results to the a subdirectory of |results_dir_on_host|
-            # so as not to collide with host test results.
-            leak_to=results_dir,
-        )
-        fuchsia_test_results.append(self.FuchsiaTestResults(
-            name=result.name,
-            build_dir=build.fuchsia_build_dir,
-            results_dir=results_dir,
-            zircon_kernel_log=result.output,
-            outputs=test_results_map,
-            json_api=self.m.json,
-        ))
+        fuchsia_test_results.extend(
+            self._process_task_result(
+                result=result,
+                # A result which failed to be collected has no name.
+                shard_names=task_name_to_shard_names.get(result.name, []),
+                shard_name_to_device_type=shard_name_to_device_type,
+                build=build,
+            ))
+    return fuchsia_test_results
+
+  def _fit_shards_to_capacity(self, shards, build, test_pool,
+                              qemu_shards_per_task):
+    """Merges shards down to the number the idle Swarming bots can run.
+
+    Args:
+      shards (seq[api.testsharder.Shard]): The shards to fit.
+      build (FuchsiaBuildResults): The Fuchsia build to test.
+      test_pool (str): Swarming pool from which the test tasks will be drawn.
+      qemu_shards_per_task (int): The number of QEMU shards run by each task.
+
+    Returns:
+      A list of api.testsharder.Shards.
+    """
+    shards_by_device_type = collections.OrderedDict()
+    for shard in shards:
+      shards_by_device_type.setdefault(shard.device_type, []).append(shard)
+
+    fitted = []
+    with self.m.step.nest('fit shards to capacity'):
+      for device_type, typed_shards in shards_by_device_type.iteritems():
+        if device_type == 'QEMU':
+          dimensions = dict(self._qemu_dimensions(build, test_pool), kvm='1')
+          shards_per_bot = qemu_shards_per_task
+        else:
+          dimensions = {'pool': test_pool, 'device_type': device_type}
+          shards_per_bot = 1
+        capacity = (
+            self.m.swarming.bot_counts(dimensions).idle * shards_per_bot)
+        # Without any idle bots the shards will be pending regardless, so there
+        # is nothing to fit them to.
+        if 0 < capacity < len(typed_shards):
+          typed_shards = self.m.testsharder.merge_shards(
+              typed_shards, capacity)
+        fitted.extend(typed_shards)
+    return fitted
+
+  def _collect_shards_incrementally(self, tasks_json, task_requests,
+                                    task_name_to_shard_names,
+                                    shard_name_to_device_type, build,
+                                    fail_fast, hedge_percentile):
+    """Collects test tasks as they complete.
+
+    If fail_fast is set, the tasks which have not completed yet are cancelled
+    as soon as one task fails, either because the task itself failed (e.g. a
+    kernel panic) or because one of its tests failed.
+
+    If hedge_percentile is set, then once at least HEDGE_QUORUM of the tasks
+    have completed, any task which has been outstanding for longer than that
+    percentile of the completed tasks' durations is launched again with the
+    same inputs, pinned to an idle bot other than the one running the
+    original. Whichever copy completes first is used, and the other one is
+    cancelled. The durations are taken from the timestamps Swarming reports
+    for each task.
+
+    Tasks are collected until Swarming should have expired or killed all of
+    them, plus COLLECT_DEADLINE_SLACK_SECS; the tasks still outstanding after
+    that are cancelled.
+
+    Returns:
+      A list of FuchsiaTestResults for the tasks which completed.
+
+    Raises:
+      The StepFailure raised by analyzing the first failed task, if any, or an
+      InfraFailure if the tasks are not all collected by the deadline.
+    """
+    start_time = self.m.time.time()
+    # Seconds from spawning until which to keep collecting tasks.
+    deadline = max(
+        self._task_lifetime_secs(task) for task in task_requests.values()
+    ) + COLLECT_DEADLINE_SLACK_SECS
+    # Maps the name of each outstanding task to the IDs of its copies; the
+    # first ID is always the original task.
+    outstanding = collections.OrderedDict()
+    for task in tasks_json['tasks']:
+      outstanding[task['request']['name']] = [task['task_id']]
+    task_count = len(outstanding)
+    # Maps the name of each task to the creation time and the bot of its
+    # original, as last reported by Swarming.
+    created = {}
+    bot_ids = {}
+    # Seconds from the creation of each task until it completed.
+    durations = []
+    # Maps the name of each hedged task to the duration threshold it exceeded.
+    hedges = {}
+    duplicate_wins = 0
+    straggling_secs = 0
+    # The first failure to raise once every task has been collected.
+    failure = None
+
+    fuchsia_test_results = []
+    while outstanding:
+      results = self.m.swarming.collect(
+          tasks=[task_id for ids in outstanding.values() for task_id in ids],
+          eager=True,
+          timeout=(
+              '%ds' % HEDGE_POLL_INTERVAL_SECS if hedge_percentile else None),
+      )
+      elapsed = self.m.time.time() - start_time
+
+      for result in results:
+        if result.state == self.m.swarming.TaskState.RPC_FAILURE:
+          # The result has no name to tell which task it is for, so the
+          # failure cannot be waited out; give up on all of them.
+          self._cancel_tasks(outstanding, task_name_to_shard_names)
+          self._process_task_result(
+              result=result,
+              shard_names=[],
+              shard_name_to_device_type=shard_name_to_device_type,
+              build=build,
+          )
+        copies = outstanding.get(result.name)
+        if not copies:
+          continue
+        if result.id == copies[0]:
+          created[result.name] = result.created_ts
+          bot_ids[result.name] = result.bot_id
+        if not result.completed:
+          continue
+        # The first copy of a task to complete wins; cancel the others.
+        del outstanding[result.name]
+        for task_id in copies:
+          if task_id != result.id:
+            self.m.swarming.cancel(task_id, kill_running=True)
+        duration = self._seconds_between(
+            created.get(result.name, result.created_ts), result.completed_ts)
+        durations.append(duration)
+        if result.id != copies[0]:
+          duplicate_wins += 1
+          straggling_secs += duration - hedges[result.name]
+
+        try:
+          task_results = self._process_task_result(
+              result=result,
+              shard_names=task_name_to_shard_names[result.name],
+              shard_name_to_device_type=shard_name_to_device_type,
+              build=build,
+          )
+        except self.m.step.StepFailure as e:
+          if fail_fast:
+            if outstanding:
+              self._cancel_tasks(outstanding, task_name_to_shard_names)
+            raise
+          # Only the copies of the failed task have been cancelled; keep
+          # collecting the others and fail once they are done.
+          failure = failure or e
+          continue
+        fuchsia_test_results.extend(task_results)
+
+        if fail_fast and any(
+            r.summary and r.failed_test_outputs for r in task_results):
+          if outstanding:
+            self._cancel_tasks(outstanding, task_name_to_shard_names)
+          return fuchsia_test_results
+
+      if hedge_percentile and len(durations) >= HEDGE_QUORUM * task_count:
+        threshold = self._percentile(durations, hedge_percentile)
+        stragglers = [
+            name for name in outstanding
+            if name not in hedges and elapsed > threshold
+        ]
+        duplicates = self._pin_duplicates(
+            [task_requests[name] for name in stragglers],
+            exclude_bot_ids=bot_ids.values())
+        if duplicates:
+          with self.m.step.nest('hedge %d tasks' % len(duplicates)):
+            spawn_resp = self.m.swarming.spawn_tasks(tasks=duplicates)
+          for task in spawn_resp['tasks']:
+            name = task['request']['name']
+            outstanding[name].append(task['task_id'])
+            hedges[name] = threshold
+            deadline = max(deadline, elapsed + COLLECT_DEADLINE_SLACK_SECS +
+                           self._task_lifetime_secs(task_requests[name]))
+
+      if outstanding and elapsed > deadline:
+        self._cancel_tasks(outstanding, task_name_to_shard_names)
+        raise self.m.step.InfraFailure(
+            'Timed out collecting %d tasks after %d seconds' % (
+                len(outstanding), elapsed))
+
+    if hedge_percentile:
+      step_result = self.m.step('hedging summary', None)
+      step_result.presentation.step_text = (
+          'hedged %d of %d tasks, %d duplicates finished first, '
+          'cutting %d seconds of straggling' % (
+              len(hedges), task_count, duplicate_wins, straggling_secs))
+    if failure:
+      raise failure
     return fuchsia_test_results
 
+  def _pin_duplicates(self, task_requests, exclude_bot_ids):
+    """Creates duplicates of task requests, each pinned to a distinct idle bot.
+
+    Swarming cannot exclude a bot from the ones a task may run on, so instead
+    each duplicate is pinned to an idle bot matching the original's
+    dimensions, to keep it off of the (possibly slow) bots already running
+    the originals. Tasks for which no such bot is idle are not duplicated.
+
+    Args:
+      task_requests (seq[api.swarming.TaskRequest]): The requests to
+        duplicate.
+      exclude_bot_ids (seq[str]): The IDs of bots not to pin duplicates to.
+
+    Returns:
+      A list of api.swarming.TaskRequests.
+    """
+    excluded = set(exclude_bot_ids)
+    idle_ids_by_dimensions = {}
+    duplicates = []
+    for task_request in task_requests:
+      key = tuple(sorted(task_request.dimensions.iteritems()))
+      if key not in idle_ids_by_dimensions:
+        idle_ids_by_dimensions[key] = self.m.swarming.bot_counts(
+            task_request.dimensions).idle_ids
+      idle_ids = [i for i in idle_ids_by_dimensions[key] if i not in excluded]
+      if not idle_ids:
+        continue
+      excluded.add(idle_ids[0])
+      duplicate = copy.copy(task_request)
+      duplicate.dimensions = dict(task_request.dimensions, id=idle_ids[0])
+      # The pinned bot already matches the original's preferred dimensions.
+      duplicate.fallback_slices = ()
+      # An idempotent duplicate could be deduplicated into the very task it is
+      # meant to replace.
+      duplicate.idempotent = False
+      duplicates.append(duplicate)
+    return duplicates
+
+  @staticmethod
+  def _seconds_between(start, end):
+    """Returns the number of seconds between two datetimes."""
+    delta = end - start
+    return delta.days * 24 * 60 * 60 + delta.seconds + (
+        delta.microseconds / 1e6)
+
+  @staticmethod
+  def _task_lifetime_secs(task_request):
+    """Returns the most seconds a task may take from spawning to completing."""
+    slices = task_request.fallback_slices
+    expiration_secs = task_request.expiration_secs + sum(
+        task_slice.expiration_secs for task_slice in slices)
+    hard_timeout_secs = max([task_request.hard_timeout_secs] + [
+        task_slice.hard_timeout_secs or 0 for task_slice in slices
+    ])
+    return expiration_secs + hard_timeout_secs
+
+  @staticmethod
+  def _percentile(values, percentile):
+    """Returns the nearest-rank percentile of a non-empty list of values."""
+    values = sorted(values)
+    rank = int(math.ceil(percentile / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+  def _cancel_tasks(self, outstanding, task_name_to_shard_names):
+    """Cancels every copy of the tasks of shards which have not completed.
+
+    Args:
+      outstanding (dict[str]list[str]): Maps the name of each task to cancel
+        to the IDs of its copies.
+      task_name_to_shard_names (dict[str]list[str]): Maps the name of each
+        task to the names of the shards it runs.
+    """
+    cancelled = []
+    with self.m.step.nest('cancel remaining shards') as step_result:
+      for name, task_ids in outstanding.iteritems():
+        for task_id in task_ids:
+          self.m.swarming.cancel(task_id, kill_running=True)
+        cancelled.extend(task_name_to_shard_names[name])
+      step_result.presentation.step_text = 'cancelled %d shards' % len(
+          cancelled)
+      step_result.presentation.logs['cancelled shards'] = cancelled
+
+  def _process_task_result(self, result, shard_names,
+                           shard_name_to_device_type, build):
+    """Checks a test task's result and extracts the test results of its shards.
+
+    Args:
+      result (swarming.CollectResult): The result of the task.
+      shard_names (seq[str]): The names of the shards run by the task.
+      shard_name_to_device_type (dict[str]str): Maps each shard's name to the
+        type of device it ran on.
+      build (FuchsiaBuildResults): The Fuchsia build which was tested.
+
+    Returns:
+      A list of FuchsiaTestResults, one for each shard run by the task.
+    """
+    if result.state == self.m.swarming.TaskState.RPC_FAILURE:
+      # There is no name to tell which shards the task ran, so just report the
+      # failure as a whole.
+      self.analyze_collect_result(
+          step_name='%s task results' % result.name,
+          result=result,
+          build_dir=build.fuchsia_build_dir,
+      )
+    if len(shard_names) == 1:
+      shard_results = [result]
+    else:
+      # Demultiplex the results of a packed task into one result per
+      # shard, so that each shard is analyzed and reported on its own.
+      shard_results = [
+          _PackedShardResult(
+              result=result,
+              name=shard_name,
+              state=self._packed_shard_state(result, shard_name),
+              output=self._demux_packed_output(result.output, shard_name),
+              archive_name=self._packed_minfs_image_name(shard_name),
+          ) for shard_name in shard_names
+      ]
+
+    fuchsia_test_results = []
+    failures = []
+    for shard_result in shard_results:
+      # Write test results to the a subdirectory of |results_dir_on_host|
+      # so as not to collide with host test results.
+      results_dir = self.results_dir_on_host.join(result.id)
+      if len(shard_names) > 1:
+        results_dir = results_dir.join(shard_result.name)
+      # Report on every shard of a packed task before failing on any of them.
+      try:
+        fuchsia_test_results.append(
+            self._process_shard_result(
+                result=shard_result,
+                device_type=shard_name_to_device_type[shard_result.name],
+                build=build,
+                results_dir=results_dir,
+            ))
+      except self.m.step.StepFailure as e:
+        failures.append(e)
+    if failures:
+      raise failures[0]
+    return fuchsia_test_results
+
+  def _packed_shard_state(self, result, shard_name):
+    """Determines the state of one shard of a packed task.
+
+    Each QEMU instance of a packed task records its exit status in its own
+    status file, so the shards of a task which ran to completion succeed or
+    fail individually. Otherwise every shard shares the state of the task.
+
+    Args:
+      result (swarming.CollectResult): The result of the packed task.
+      shard_name (str): The name of the shard.
+
+    Returns:
+      The api.swarming.TaskState of the shard.
+    """
+    TaskState = self.m.swarming.TaskState
+    if result.state not in (TaskState.SUCCESS, TaskState.TASK_FAILURE):
+      return result.state
+    status_file = self._packed_status_file_name(shard_name)
+    # A missing status file means the instance never finished.
+    if status_file not in result.outputs:
+      return TaskState.TASK_FAILURE
+    status = self.m.file.read_text(
+        'read %s status' % shard_name,
+        result.outputs[status_file],
+        test_data='0\n',
+    )
+    if status.strip() != '0':
+      return TaskState.TASK_FAILURE
+    return TaskState.SUCCESS
+
+  def _process_shard_result(self, result, device_type, build, results_dir):
+    """Checks a shard's task result and extracts its test results.
+
+    Args:
+      result (swarming.CollectResult): The result of the shard's task.
+      device_type (str): The type of device the shard ran on.
+      build (FuchsiaBuildResults): The Fuchsia build which was tested.
+      results_dir (Path): The directory to extract test results to.
+
+    Returns:
+      A FuchsiaTestResults representing the shard's test results.
+    """
+    # Figure out what happened to the swarming tasks.
+    self.analyze_collect_result(
+        step_name='%s task results' % result.name,
+        result=result,
+        build_dir=build.fuchsia_build_dir,
+    )
+    # Extract test results (there should only be one archive).
+    assert len(result.outputs) == 1
+    archive_name = result.outputs.keys()[0]
+    test_results_map = self._extract_test_results(
+        shard_name=result.name,
+        device_type=device_type,
+        archive_path=result.outputs[archive_name],
+        leak_to=results_dir,
+    )
+    return self.FuchsiaTestResults(
+        name=result.name,
+        build_dir=build.fuchsia_build_dir,
+        results_dir=results_dir,
+        zircon_kernel_log=result.output,
+        outputs=test_results_map,
+        json_api=self.m.json,
+    )
+
   def analyze_collect_result(self, step_name, result, build_dir):
     """Analyzes a swarming.CollectResult and reports results as a step.
 
@@ -1596,14 +2383,66 @@ class FuchsiaApi(recipe_api.RecipeApi):
     return list(
         map(self.m.path.abs_to_path, binary_to_symbol_file.itervalues()))
 
+  def ensure_tools(self, upload_results=False, run_tests=False,
+                   test_in_shards=False):
+    """Ensures that the tools used by later steps are installed.
+
+    Each tool is otherwise installed when it is first needed. Within
+    api.cipd.preload(), this installs all of them with a single step.
+
+    Args:
+      upload_results (bool): Whether the build results will be uploaded.
+      run_tests (bool): Whether tests will be run.
+      test_in_shards (bool): Whether tests will be run in shards.
+    """
+    if upload_results:
+      self.m.gsutil.ensure_gsutil()
+      self._ensure_ninjatrace()
+      self._ensure_bloaty()
+    if run_tests:
+      self.m.swarming.ensure_swarming(version='latest')
+      self.m.isolated.ensure_isolated(version='latest')
+      if test_in_shards:
+        self.m.testsharder.ensure_testsharder()
+      if self._test_coverage_gcs_bucket:
+        self._ensure_covargs()
+
+  def _ensure_ninjatrace(self):
+    if not self._ninjatrace_dir:
+      with self.m.step.nest('ensure ninjatrace'):
+        with self.m.context(infra_steps=True):
+          cipd_dir = self.m.path['start_dir'].join('cipd')
+          self.m.cipd.ensure(cipd_dir, {
+              'fuchsia/tools/ninjatrace/${platform}': 'latest',
+          })
+      self._ninjatrace_dir = cipd_dir
+    return self._ninjatrace_dir
+
+  def _ensure_bloaty(self):
+    if not self._bloaty_dir:
+      with self.m.step.nest('ensure bloaty'):
+        with self.m.context(infra_steps=True):
+          cipd_dir = self.m.path['start_dir'].join('cipd')
+          self.m.cipd.ensure(cipd_dir, {
+              'fuchsia/tools/bloatalyzer/${platform}': 'latest',
+              'fuchsia/third_party/bloaty/${platform}': 'latest',
+          })
+      self._bloaty_dir = cipd_dir
+    return self._bloaty_dir
+
+  def _ensure_covargs(self):
+    if not self._covargs_dir:
+      with self.m.context(infra_steps=True):
+        cipd_dir = self.m.path['start_dir'].join('cipd')
+        self.m.cipd.ensure(cipd_dir, {
+            'fuchsia/tools/covargs/${platform}': 'latest',
+        })
+      self._covargs_dir = cipd_dir
+    return self._covargs_dir
+
   def _process_coverage(self, test_results, symbolize_dump):
     self.m.gsutil.ensure_gsutil()
-
-    with self.m.context(infra_steps=True):
-      cipd_dir = self.m.path['start_dir'].join('cipd')
-      pkgs = self.m.cipd.EnsureFile()
-      pkgs.add_package('fuchsia/tools/covargs/${platform}', 'latest')
-      self.m.cipd.ensure(cipd_dir, pkgs)
+    cipd_dir = self._ensure_covargs()
 
     host_platform = HOST_PLATFORMS[self.m.platform.arch][self.m.platform.bits]
     downloads_dir = self.m.path['start_dir'].join('zircon', 'prebuilt',
@@ -1680,18 +2519,13 @@ class FuchsiaApi(recipe_api.RecipeApi):
       A Path to the file containing the gn tracing data in Chromium's
       about:tracing html format.
     """
-    with self.m.step.nest('ensure ninjatrace'):
-      with self.m.context(infra_steps=True):
-        cipd_dir = self.m.path['start_dir'].join('cipd')
-        pkgs = self.m.cipd.EnsureFile()
-        pkgs.add_package('fuchsia/tools/ninjatrace/${platform}', 'latest')
-        self.m.cipd.ensure(cipd_dir, pkgs)
+    cipd_dir = self._ensure_ninjatrace()
 
     trace = self.m.path['cleanup'].join('ninja_trace.json')
     html = self.m.path['cleanup'].join('ninja_trace.html')
     self.m.step(
         'ninja tracing', [
-            self.m.path['start_dir'].join('cipd').join('ninjatrace'),
+            cipd_dir.join('ninjatrace'),
             '-filename',
             build_results.fuchsia_build_dir.join('.ninja_log'),
             '-trace-json',
@@ -1726,21 +2560,15 @@ class FuchsiaApi(recipe_api.RecipeApi):
       A Path to the file containing the resulting bloaty data.
     """
     assert gcs_bucket
-    with self.m.step.nest('ensure bloaty'):
-      with self.m.context(infra_steps=True):
-        cipd_dir = self.m.path['start_dir'].join('cipd')
-        pkgs = self.m.cipd.EnsureFile()
-        pkgs.add_package('fuchsia/tools/bloatalyzer/${platform}', 'latest')
-        pkgs.add_package('fuchsia/third_party/bloaty/${platform}', 'latest')
-        self.m.cipd.ensure(cipd_dir, pkgs)
+    cipd_dir = self._ensure_bloaty()
 
     bloaty_file = self.m.path['cleanup'].join('bloaty.html')
     self.m.step(
         'bloaty',
         [
-            self.m.path['start_dir'].join('cipd', 'bloatalyzer'),
+            cipd_dir.join('bloatalyzer'),
             '-bloaty',
-            self.m.path['start_dir'].join('cipd', 'bloaty'),
+            cipd_dir.join('bloaty'),
             '-input',
             build_results.ids,
             '-output',
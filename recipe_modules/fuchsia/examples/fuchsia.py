@@ -15,16 +15,19 @@ TARGETS = ['arm64', 'x64']
 BUILD_TYPES = ['debug', 'release', 'thinlto', 'lto']
 
 DEPS = [
+    'infra/cipd',
     'infra/fuchsia',
     'infra/goma',
     'infra/jiri',
     'infra/swarming',
     'infra/testsharder',
     'recipe_engine/buildbucket',
+    'recipe_engine/file',
     'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/properties',
     'recipe_engine/raw_io',
+    'recipe_engine/time',
 ]
 
 PROPERTIES = {
@@ -112,6 +115,33 @@ PROPERTIES = {
             kind=bool,
             help='Whether to run tests in shards',
             default=False),
+    'qemu_shards_per_task':
+        Property(
+            kind=int,
+            help='Maximum number of QEMU shards to run in a single task',
+            default=1),
+    'fail_fast':
+        Property(
+            kind=bool,
+            help='Whether to cancel remaining shards on the first failure',
+            default=False),
+    'hedge_percentile':
+        Property(
+            kind=int,
+            help='Percentile of completed shard durations after which to '
+            'launch a duplicate of a straggling shard',
+            default=None),
+    'kvm_expiration_secs':
+        Property(
+            kind=int,
+            help='Seconds to wait for a KVM bot before falling back to '
+            'running QEMU without KVM',
+            default=None),
+    'fit_to_capacity':
+        Property(
+            kind=bool,
+            help='Whether to merge test shards down to the idle bot count',
+            default=False),
     'gcs_bucket':
         Property(
             kind=str,
@@ -129,7 +159,9 @@ def RunSteps(api, project, manifest, remote, checkout_snapshot, target,
              build_type, packages, variants, gn_args, ninja_targets, run_tests,
              runtests_args, device_type, run_host_tests, networking_for_tests,
              requires_secrets, pave, boards, products, zircon_args,
-             test_in_shards, gcs_bucket, upload_breakpad_symbols):
+             test_in_shards, qemu_shards_per_task, fail_fast, hedge_percentile,
+             kvm_expiration_secs, fit_to_capacity, gcs_bucket,
+             upload_breakpad_symbols):
   upload_results = not api.properties.get('tryjob') and gcs_bucket
   build = api.buildbucket.build
 
@@ -180,7 +212,12 @@ def RunSteps(api, project, manifest, remote, checkout_snapshot, target,
     if test_in_shards:
       all_results = api.fuchsia.test_in_shards(
           test_pool='fuchsia.tests',
-          build=build)
+          build=build,
+          qemu_shards_per_task=qemu_shards_per_task,
+          fail_fast=fail_fast,
+          hedge_percentile=hedge_percentile,
+          kvm_expiration_secs=kvm_expiration_secs,
+          fit_to_capacity=fit_to_capacity)
       api.fuchsia.analyze_test_results(all_results)
     else:
       test_results = api.fuchsia.test(
@@ -468,12 +505,8 @@ def GenTests(api):
           gcs_bucket='###fuchsia-build###',
       ),
       paths=[api.path['cleanup'].join('snapshot_repo', 'cherrypick.json')],
-  ) + api.jiri.read_manifest_element(
-      api=api,
-      manifest=api.path['cleanup'].join('snapshot_repo', 'snapshot'),
-      element_type='project',
-      element_name='topaz',
-      test_output={'path': 'topaz'})
+  ) + api.jiri.read_manifest(
+      'snapshot', projects=[{'name': 'topaz', 'path': 'topaz'}])
 
   # Test cases for generating symbol files during the build.
   yield api.fuchsia.test(
@@ -543,3 +576,561 @@ def GenTests(api):
           api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
           api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
       ])
+  yield api.fuchsia.test(
+      'test_in_shards_pinned_tools',
+      clear_default_steps=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+              api.testsharder.shard(
+                  name='fuchsia-0001',
+                  tests=[api.testsharder.test(
+                      name='test1',
+                      location='/path/to/test1',
+                  )],
+                  device_type='QEMU',
+              ),
+          ]),
+          # The tools are only pinned once, by the first shard's task.
+          api.step_data(
+              'shard fuchsia-0000.resolve 2 packages',
+              api.cipd.example_ensure({
+                  'fuchsia/qemu/linux-amd64': 'latest',
+                  'fuchsia/infra/botanist/linux-amd64': 'latest',
+              })),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(id='610', name='fuchsia-0000'),
+              api.fuchsia.task_mock_data(id='710', name='fuchsia-0001'),
+          ),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_rpc_failure',
+      clear_default_steps=True,
+      expect_failure=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  state=api.swarming.TaskState.RPC_FAILURE,
+              ),
+          ),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_packed_qemu',
+      clear_default_steps=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          qemu_shards_per_task=2,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-%04d' % i,
+                  tests=[api.testsharder.test(
+                      name='test%d' % i,
+                      location='/path/to/test%d' % i,
+                  )],
+                  device_type='QEMU',
+              ) for i in range(3)
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  name='fuchsia-0000+fuchsia-0001',
+                  output='[fuchsia-0000] hello\n[fuchsia-0001] world',
+                  outputs=[
+                      'output-fuchsia-0000.fs',
+                      'fuchsia-0000.status',
+                      'output-fuchsia-0001.fs',
+                      'fuchsia-0001.status',
+                  ],
+              ),
+              api.fuchsia.task_mock_data(id='710', name='fuchsia-0002'),
+          ),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0002'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_packed_qemu_shard_failure',
+      clear_default_steps=True,
+      expect_failure=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          qemu_shards_per_task=2,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-%04d' % i,
+                  tests=[api.testsharder.test(
+                      name='test%d' % i,
+                      location='/path/to/test%d' % i,
+                  )],
+                  device_type='QEMU',
+              ) for i in range(2)
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  name='fuchsia-0000+fuchsia-0001',
+                  output='[fuchsia-0000] hello\n[fuchsia-0001] world',
+                  outputs=[
+                      'output-fuchsia-0000.fs',
+                      'fuchsia-0000.status',
+                      'output-fuchsia-0001.fs',
+                      'fuchsia-0001.status',
+                  ],
+              ),
+          ),
+          # Only the failing instance fails its shard; the other one is still
+          # reported on.
+          api.step_data('read fuchsia-0001 status', api.file.read_text('1\n')),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_kvm_fallback',
+      clear_default_steps=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          qemu_shards_per_task=2,
+          kvm_expiration_secs=600,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-%04d' % i,
+                  tests=[api.testsharder.test(
+                      name='test%d' % i,
+                      location='/path/to/test%d' % i,
+                  )],
+                  device_type='QEMU',
+              ) for i in range(3)
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  name='fuchsia-0000+fuchsia-0001',
+                  output='[fuchsia-0000] hello\n[fuchsia-0001] world',
+                  outputs=[
+                      'output-fuchsia-0000.fs',
+                      'fuchsia-0000.status',
+                      'output-fuchsia-0001.fs',
+                      'fuchsia-0001.status',
+                  ],
+              ),
+              api.fuchsia.task_mock_data(id='710', name='fuchsia-0002'),
+          ),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0002'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_fit_to_capacity',
+      clear_default_steps=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          fit_to_capacity=True,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-%04d' % i,
+                  tests=[api.testsharder.test(
+                      name='test%d' % i,
+                      location='/path/to/test%d' % i,
+                  )],
+                  device_type='QEMU',
+              ) for i in range(3)
+          ] + [
+              api.testsharder.shard(
+                  name='fuchsia-0003',
+                  tests=[api.testsharder.test(
+                      name='test3',
+                      location='/path/to/test3',
+                  )],
+                  device_type='NUC',
+              ),
+          ]),
+          # Only two QEMU bots are idle, so two of the QEMU shards are merged.
+          api.step_data(
+              'fit shards to capacity.count bots '
+              'cpu:x86-64,kvm:1,os:Debian,pool:fuchsia.tests',
+              api.swarming.bots(idle=2, busy=6)),
+          # No NUC is idle, so the NUC shard is left as is.
+          api.step_data(
+              'fit shards to capacity.count bots '
+              'device_type:NUC,pool:fuchsia.tests',
+              api.swarming.bots(idle=0, busy=2)),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610', name='fuchsia-0000+fuchsia-0002'),
+              api.fuchsia.task_mock_data(id='710', name='fuchsia-0001'),
+              api.fuchsia.task_mock_data(
+                  id='810', name='fuchsia-0003', device=True),
+          ),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000+fuchsia-0002'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0003'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_fail_fast',
+      clear_default_steps=True,
+      expect_failure=True,
+      tryjob=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          fail_fast=True,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+              api.testsharder.shard(
+                  name='fuchsia-0001',
+                  tests=[api.testsharder.test(
+                      name='test1',
+                      location='/path/to/test1',
+                  )],
+                  device_type='NUC',
+              ),
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(id='610', name='fuchsia-0000'),
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  state=api.swarming.TaskState.RUNNING,
+              ),
+          ),
+          api.fuchsia.test_step_data(failure=True, shard_name='fuchsia-0000'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_fail_fast_kernel_panic',
+      clear_default_steps=True,
+      expect_failure=True,
+      tryjob=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          fail_fast=True,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+              api.testsharder.shard(
+                  name='fuchsia-0001',
+                  tests=[api.testsharder.test(
+                      name='test1',
+                      location='/path/to/test1',
+                  )],
+                  device_type='NUC',
+              ),
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  name='fuchsia-0000',
+                  output='KERNEL PANIC',
+              ),
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  state=api.swarming.TaskState.PENDING,
+              ),
+          ),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_fail_fast_rpc_failure',
+      clear_default_steps=True,
+      expect_failure=True,
+      tryjob=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          fail_fast=True,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+              api.testsharder.shard(
+                  name='fuchsia-0001',
+                  tests=[api.testsharder.test(
+                      name='test1',
+                      location='/path/to/test1',
+                  )],
+                  device_type='NUC',
+              ),
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  state=api.swarming.TaskState.RPC_FAILURE,
+              ),
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  state=api.swarming.TaskState.PENDING,
+              ),
+          ),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_fail_fast_passing',
+      clear_default_steps=True,
+      tryjob=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          fail_fast=True,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+              api.testsharder.shard(
+                  name='fuchsia-0001',
+                  tests=[api.testsharder.test(
+                      name='test1',
+                      location='/path/to/test1',
+                  )],
+                  device_type='NUC',
+              ),
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  name='fuchsia-0000',
+                  state=api.swarming.TaskState.PENDING,
+              ),
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  device=True,
+              ),
+          ),
+          api.step_data('collect (2)', api.swarming.collect(task_data=[
+              api.fuchsia.task_mock_data(id='610', name='fuchsia-0000'),
+          ])),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_hedged',
+      clear_default_steps=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          hedge_percentile=90,
+      ),
+      steps=[
+          # Every reading of the clock is ten seconds later, so the running
+          # shard outlasts the few seconds the other shard took.
+          api.time.step(10),
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+              api.testsharder.shard(
+                  name='fuchsia-0001',
+                  tests=[api.testsharder.test(
+                      name='test1',
+                      location='/path/to/test1',
+                  )],
+                  device_type='QEMU',
+              ),
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(id='610', name='fuchsia-0000'),
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  state=api.swarming.TaskState.RUNNING,
+              ),
+          ),
+          api.step_data('collect (2)', api.swarming.collect(task_data=[
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  state=api.swarming.TaskState.RUNNING,
+              ),
+          ])),
+          # The duplicate launched for the straggling shard finishes first.
+          api.step_data('collect (3)', api.swarming.collect(task_data=[
+              api.fuchsia.task_mock_data(
+                  id='39927049b6ee7010',
+                  name='fuchsia-0001',
+              ),
+          ])),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_hedged_no_idle_bots',
+      clear_default_steps=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          hedge_percentile=90,
+      ),
+      steps=[
+          api.time.step(10),
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-%04d' % i,
+                  tests=[api.testsharder.test(
+                      name='test%d' % i,
+                      location='/path/to/test%d' % i,
+                  )],
+                  device_type='QEMU',
+              ) for i in range(2)
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(id='610', name='fuchsia-0000'),
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  state=api.swarming.TaskState.RUNNING,
+              ),
+          ),
+          # With no other bot to pin a duplicate to, the shard is not hedged.
+          api.step_data(
+              'count bots cpu:x86-64,kvm:1,os:Debian,pool:fuchsia.tests',
+              api.swarming.bots(idle=0, busy=2)),
+          api.step_data('collect (2)', api.swarming.collect(task_data=[
+              api.fuchsia.task_mock_data(id='710', name='fuchsia-0001'),
+          ])),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0000'),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_hedged_failure',
+      clear_default_steps=True,
+      expect_failure=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          hedge_percentile=90,
+      ),
+      steps=[
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-%04d' % i,
+                  tests=[api.testsharder.test(
+                      name='test%d' % i,
+                      location='/path/to/test%d' % i,
+                  )],
+                  device_type='QEMU',
+              ) for i in range(2)
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  name='fuchsia-0000',
+                  state=api.swarming.TaskState.TASK_FAILURE,
+              ),
+              api.fuchsia.task_mock_data(
+                  id='710',
+                  name='fuchsia-0001',
+                  state=api.swarming.TaskState.RUNNING,
+              ),
+          ),
+          # Without fail_fast, the other shard is still collected.
+          api.step_data('collect (2)', api.swarming.collect(task_data=[
+              api.fuchsia.task_mock_data(id='710', name='fuchsia-0001'),
+          ])),
+          api.fuchsia.test_step_data(shard_name='fuchsia-0001'),
+      ])
+  yield api.fuchsia.test(
+      'test_in_shards_hedged_deadline',
+      clear_default_steps=True,
+      expect_failure=True,
+      properties=dict(
+          run_tests=True,
+          test_in_shards=True,
+          hedge_percentile=90,
+      ),
+      steps=[
+          # Every reading of the clock is a day later, so the deadline passes
+          # while the shard is still running.
+          api.time.step(24 * 60 * 60),
+          api.fuchsia.shards_step_data(shards=[
+              api.testsharder.shard(
+                  name='fuchsia-0000',
+                  tests=[api.testsharder.test(
+                      name='test0',
+                      location='/path/to/test0',
+                  )],
+                  device_type='QEMU',
+              ),
+          ]),
+          api.fuchsia.tasks_step_data(
+              api.fuchsia.task_mock_data(
+                  id='610',
+                  name='fuchsia-0000',
+                  state=api.swarming.TaskState.RUNNING,
+              ),
+          ),
+      ])
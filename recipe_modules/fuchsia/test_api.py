@@ -207,7 +207,8 @@ class FuchsiaTestApi(recipe_test_api.RecipeTestApi):
                      name='test',
                      state=None,
                      output='hello world!',
-                     device=False):
+                     device=False,
+                     outputs=None):
     """Returns mock data for task results.
 
     This should be used by any test which calls api.fuchsia.test*() and passed
@@ -217,11 +218,14 @@ class FuchsiaTestApi(recipe_test_api.RecipeTestApi):
       state (api.swarming.TaskState): The collected task's state.
       output (str): The mock task's stdout/stderr.
       device (bool): Whether we're mocking testing on a hardware device.
+      outputs (seq[str]): The mock task's output files; overrides the default
+        output file implied by device.
 
     Returns:
       Mock data for a Swarming task result which ran Fuchsia tests.
     """
-    outputs = ['out.tar'] if device else ['output.fs']
+    if outputs is None:
+      outputs = ['out.tar'] if device else ['output.fs']
     return self.m.swarming.task_data(
           id=id, name=name, state=state or self.m.swarming.TaskState.SUCCESS,
           output=output, outputs=outputs)
@@ -12,6 +12,8 @@ class GerritApi(recipe_api.RecipeApi):
     super(GerritApi, self).__init__(*args, **kwargs)
     self._gerrit_host = gerrit_host
     self._gerrit_path = None
+    # The change details fetched so far, by (host, change ID, query params).
+    self._change_details = {}
 
   def __call__(self, name, subcmd, input_json, gerrit_host=None,
                test_data=None):
@@ -52,6 +54,11 @@ class GerritApi(recipe_api.RecipeApi):
 
         return self._gerrit_path
 
+  @property
+  def gerrit_path(self):
+    """The path to the Gerrit client, once ensure_gerrit() has run."""
+    return self._gerrit_path
+
   @property
   def host(self):
     return self._gerrit_host
@@ -74,6 +81,7 @@ class GerritApi(recipe_api.RecipeApi):
     input_json = {'change_id': change_id}
     if message:
       input_json['input'] = {'message': message}
+    self.invalidate_change_details(change_id)
     return self(
         name=name,
         subcmd='change-abandon',
@@ -142,6 +150,7 @@ class GerritApi(recipe_api.RecipeApi):
       input_json['input']['reviewers'] += [{'reviewer': i} for i in reviewers]
     if ccs:
       input_json['input']['reviewers'] += [{'reviewer': i, 'state': 'CC'} for i in ccs]
+    self.invalidate_change_details(change_id)
     return self(
         name=name,
         subcmd='set-review',
@@ -153,6 +162,9 @@ class GerritApi(recipe_api.RecipeApi):
                      test_data=None):
     """Returns a JSON dict of details regarding a specific change.
 
+    The details are only fetched once per run for a given host, change and
+    query parameters; callers which poll a change must invalidate them first.
+
     Args:
       name (str): The name of the step.
       change_id (str): A change ID that uniquely defines a change on the host.
@@ -164,13 +176,87 @@ class GerritApi(recipe_api.RecipeApi):
       test_data (recipe_test_api.StepTestData): Test JSON output data for this
         step.
     """
-    input_json={'change_id': change_id}
-    if query_params:
-      input_json['params'] = {'o': query_params}
-    return self(
-        name=name,
-        subcmd='change-detail',
-        input_json=input_json,
-        gerrit_host=gerrit_host,
-        test_data=test_data,
-    )
+    key = self._change_details_key(gerrit_host, change_id, query_params)
+    if key not in self._change_details:
+      input_json={'change_id': change_id}
+      if query_params:
+        input_json['params'] = {'o': query_params}
+      self._change_details[key] = self(
+          name=name,
+          subcmd='change-detail',
+          input_json=input_json,
+          gerrit_host=gerrit_host,
+          test_data=test_data,
+      )
+    return self._change_details[key]
+
+  def changes_details(self, name, change_ids, gerrit_host=None,
+                      query_params=[], test_data=None):
+    """Returns JSON dicts of details regarding several changes.
+
+    The details of all changes which were not fetched before are fetched by a
+    single query.
+
+    Args:
+      name (str): The name of the step.
+      change_ids (seq(str)): Change IDs that uniquely define changes on the
+        host, either as numbers, Change-Ids or <project>~<number>.
+      gerrit_host (str): The Gerrit host to make the query against. Overrides
+        the recipe module's global host property.
+      query_params (list): A list of Gerrit REST query parameters (strings).
+      test_data (recipe_test_api.StepTestData): Test JSON output data for this
+        step.
+
+    Returns:
+      A dict mapping each change ID to the details of its change. Changes which
+      the query did not find are omitted.
+    """
+    keys = {
+        change_id: self._change_details_key(gerrit_host, change_id,
+                                            query_params)
+        for change_id in change_ids
+    }
+    missing = sorted(
+        change_id for change_id, key in keys.iteritems()
+        if key not in self._change_details)
+    if missing:
+      params = {'q': ' OR '.join('change:%s' % c for c in missing)}
+      if query_params:
+        params['o'] = query_params
+      changes = self(
+          name=name,
+          subcmd='change-query',
+          input_json={'params': params},
+          gerrit_host=gerrit_host,
+          test_data=test_data,
+      )
+      for change in changes or []:
+        aliases = {
+            str(change.get('_number')),
+            change.get('change_id'),
+            change.get('id'),
+            '%s~%s' % (change.get('project'), change.get('_number')),
+        }
+        for change_id in missing:
+          if change_id in aliases:
+            self._change_details[keys[change_id]] = change
+    return {
+        change_id: self._change_details[key]
+        for change_id, key in keys.iteritems()
+        if key in self._change_details
+    }
+
+  def invalidate_change_details(self, change_id=None):
+    """Forgets the details fetched for a change, or for all changes.
+
+    Args:
+      change_id (str): The change ID which the details were fetched for, or
+        None to forget the details of all changes.
+    """
+    for key in self._change_details.keys():
+      if change_id is None or key[1] == str(change_id):
+        del self._change_details[key]
+
+  def _change_details_key(self, gerrit_host, change_id, query_params):
+    return (gerrit_host or self._gerrit_host, str(change_id),
+            tuple(sorted(query_params)))
@@ -42,6 +42,27 @@ def RunSteps(api):
       query_params=['CURRENT_REVISION', 'DOWNLOAD_COMMANDS'],
   )
 
+  # Change details are only fetched once, until they are invalidated.
+  api.gerrit.change_details('get details', change_id)
+  api.gerrit.invalidate_change_details(change_id)
+  api.gerrit.change_details('get details', change_id)
+
+  # Get the details of several changes with a single query. Only those which
+  # were not fetched before are queried.
+  details = api.gerrit.changes_details(
+      'get several details',
+      [change_id, '12345', 'infra/config~12346', 'I0123456789abcdef'],
+      test_data=api.json.test_api.output([{
+          '_number': 12345,
+          'id': 'infra/config~master~I0123456789abcdef',
+          'change_id': 'I0123456789abcdef',
+          'project': 'infra/config',
+      }]),
+  )
+  assert sorted(details) == sorted(
+      [change_id, '12345', 'I0123456789abcdef']), details
+  api.gerrit.invalidate_change_details()
+
   # Set review.
   api.gerrit.set_review(
       '-1',
@@ -23,9 +23,37 @@ class GitApi(recipe_api.RecipeApi):
       git_cmd.extend(['-c', '%s=%s' % (k, v)])
     return self.m.step(name, git_cmd + list(args), **kwargs)
 
+  def _cache_path(self, url):
+    """Returns the path of the bare mirror of a repository in the git cache.
+
+    The mirrors are kept apart from the rest of the cache, which jiri uses as
+    its own -cache directory.
+    """
+    name = re.sub(r'[^\w.-]+', '-', url.split('://', 1)[-1]).strip('-')
+    return self.m.path['cache'].join('git', 'mirrors', name)
+
+  def _update_cache(self, url, **kwargs):
+    """Updates the bare mirror of a repository in the git cache.
+
+    The mirror is created the first time a repository is checked out on a bot
+    and only fetches what is new afterwards.
+
+    Returns:
+      The path of the mirror.
+    """
+    cache_path = self._cache_path(url)
+    self.m.file.ensure_directory('makedirs cache', cache_path)
+    with self.m.context(cwd=cache_path):
+      # Reinitializing an existing repository is safe and cheap.
+      self('init', '--bare', name='git init cache', **kwargs)
+      self('fetch', '--prune', '--tags', url, '+refs/heads/*:refs/heads/*',
+           name='git fetch cache', **kwargs)
+    return cache_path
+
   def checkout(self, url, path=None, ref=None, recursive=False,
                submodules=True, submodule_force=False, remote='origin',
-               file=None, **kwargs):
+               file=None, cache=False, depth=None, partial=False,
+               submodule_jobs=None, **kwargs):
     """Checkout a given ref and return the checked out revision.
 
     Args:
@@ -37,6 +65,13 @@ class GitApi(recipe_api.RecipeApi):
       submodule_force (bool): whether to update submodules with --force
       remote (str): name of the remote to use
       file (str): optional path to a single file to checkout
+      cache (bool): whether to borrow objects from a bare mirror of the repo
+        kept in the git named cache, so that only what is new gets fetched
+      depth (int): if set, only fetch that many commits of history
+      partial (bool): whether to make a partial clone, which only fetches
+        the blobs that are checked out (--filter=blob:none)
+      submodule_jobs (int): how many submodules to update in parallel;
+        defaults to the number of CPUs
     """
     if not path:
       path = url.rsplit('/', 1)[-1]
@@ -47,18 +82,33 @@ class GitApi(recipe_api.RecipeApi):
 
     self.m.file.ensure_directory('makedirs', path)
 
+    cache_path = self._update_cache(url, **kwargs) if cache else None
+
     with self.m.context(cwd=path):
       if self.m.path.exists(path.join('.git')): # pragma: no cover
         self('config', '--remove-section', 'remote.%s' % remote, **kwargs)
       else:
         self('init', **kwargs)
       self('remote', 'add', remote or 'origin', url)
+      if cache_path:
+        # Objects in the mirror need not be fetched again, nor copied.
+        self.m.file.write_text(
+            'use cache', path.join('.git', 'objects', 'info', 'alternates'),
+            '%s\n' % cache_path.join('objects'))
+      if partial:
+        # This is how `git clone --filter` marks the remote as able to serve
+        # the objects which were filtered out, and has git fetch them lazily.
+        self('config', 'remote.%s.promisor' % (remote or 'origin'), 'true',
+             name='git config promisor', **kwargs)
+        self('config', 'remote.%s.partialclonefilter' % (remote or 'origin'),
+             'blob:none', name='git config partial clone filter', **kwargs)
 
       if not ref:
         fetch_ref = self.m.properties.get('branch') or 'master'
         checkout_ref = 'FETCH_HEAD'
       elif self._GIT_HASH_RE.match(ref):
-        fetch_ref = ''
+        # A shallow fetch of all refs might not include the revision.
+        fetch_ref = ref if depth else ''
         checkout_ref = ref
       elif ref.startswith('refs/heads/'):
         fetch_ref = ref[len('refs/heads/'):]
@@ -69,6 +119,10 @@ class GitApi(recipe_api.RecipeApi):
       fetch_args = [x for x in (remote, fetch_ref) if x]
       if recursive:
         fetch_args.append('--recurse-submodules')
+      if depth:
+        fetch_args.append('--depth=%d' % depth)
+      if partial:
+        fetch_args.append('--filter=blob:none')
       self('fetch', *fetch_args, **kwargs)
       if file:
         self('checkout', '-f', checkout_ref, '--', file, **kwargs)
@@ -82,7 +136,8 @@ class GitApi(recipe_api.RecipeApi):
       self('clean', '-f', '-d', '-x', **kwargs)
       if submodules:
         self('submodule', 'sync', name='submodule sync')
-        submodule_update_args = ['--init']
+        jobs = submodule_jobs or self.m.platform.cpu_count
+        submodule_update_args = ['--init', '--jobs=%d' % jobs]
         if recursive:
           submodule_update_args.append('--recursive')
         if submodule_force:
@@ -136,3 +191,10 @@ class GitApi(recipe_api.RecipeApi):
                 step_test_data=lambda:
                     self.m.raw_io.test_api.stream_output('1473312770'),
                 stdout=self.m.raw_io.output(), **kwargs).stdout.strip()
+
+  def count_commits(self, rev_range, test_data='3', **kwargs):
+    """Returns how many commits are in the given range, e.g. 'old..new'."""
+    return int(self('rev-list', '--count', rev_range,
+                    step_test_data=lambda:
+                        self.m.raw_io.test_api.stream_output(test_data),
+                    stdout=self.m.raw_io.output(), **kwargs).stdout.strip())
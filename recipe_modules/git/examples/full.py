@@ -26,13 +26,18 @@ def RunSteps(api):
       submodules=True,
       submodule_force=True,
       remote=api.properties.get('remote'),
-      file=api.properties.get('checkout_file'))
+      file=api.properties.get('checkout_file'),
+      cache=api.properties.get('cache', False),
+      depth=api.properties.get('depth'),
+      partial=api.properties.get('partial', False),
+      submodule_jobs=api.properties.get('submodule_jobs'))
 
   root_dir = api.properties.get('path') or api.path['start_dir'].join('fuchsia')
 
   with api.context(cwd=root_dir):
     api.git.get_hash()
     api.git.get_timestamp()
+    api.git.count_commits('HEAD~3..HEAD')
 
     # You can invoke arbitrary command on api.git.
     api.git('status', config={'foo': 'bar'})
@@ -69,3 +74,7 @@ def GenTests(api):
   yield api.test('basic_hash') + api.properties(
       revision='abcdef0123456789abcdef0123456789abcdef01')
   yield api.test('basic_file') + api.properties(checkout_file='README.md')
+  yield api.test('cached') + api.properties(cache=True, submodule_jobs=4)
+  yield api.test('shallow_hash') + api.properties(
+      revision='abcdef0123456789abcdef0123456789abcdef01', depth=1)
+  yield api.test('partial') + api.properties(partial=True)
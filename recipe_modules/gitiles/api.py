@@ -69,6 +69,58 @@ class GitilesApi(recipe_api.RecipeApi):
         step_test_data=test_data
     ).json.output
 
+  def bounded_log(self, url, treeish, limit, page_size=1000, step_name=None,
+                  test_data=None):
+    """Returns the most recent commits for treeish object.
+
+    The log is paged through the Gitiles REST API, and paging stops as soon as
+    `limit` commits are found. One more commit than that is requested, which
+    tells whether there are any more without counting them all.
+
+    Args:
+      url (str): base URL of the remote repository.
+      treeish (str): tree object identifier.
+      limit (int): the most commits to return.
+      page_size (int): the most commits to fetch per page.
+      step_name (str): custom name for this step (optional).
+      test_data (dict): Test JSON output for the first page.
+
+    Returns:
+      A tuple of the list of at most `limit` commits, in the format returned
+      by log() though without tree diffs, and whether there are more commits
+      than that.
+    """
+    commits = []
+    cursor = None
+    pages = 0
+    wanted = limit + 1
+    with self.m.step.nest(step_name or 'gitiles log: %s' % treeish) as nest:
+      while len(commits) < wanted:
+        pages += 1
+        page_url = self.m.url.join(
+            url, '+log/%s?format=JSON&n=%d' % (
+                treeish, min(page_size, wanted - len(commits))))
+        if cursor:
+          page_url += '&s=%s' % cursor
+        page = self.m.url.get_json(
+            page_url,
+            step_name='page %d' % pages,
+            strip_prefix=self.m.url.GERRIT_JSON_PREFIX,
+            default_test_data=test_data or {'log': []}).output
+        # Keep the commits, keyed as by the gitiles tool.
+        for entry in page['log'][:wanted - len(commits)]:
+          commit = dict(entry)
+          commit['id'] = commit.pop('commit')
+          commits.append(commit)
+        cursor = page.get('next')
+        if not cursor:
+          break
+      truncated = len(commits) > limit
+      commits = commits[:limit]
+      nest.presentation.step_text = '%s%d commits' % (
+          'more than ' if truncated else '', len(commits))
+    return commits, truncated
+
   def fetch(self, url, file_path, branch='master', step_name=None,
             timeout=None, test_data=None):
     """Downloads raw file content from a Gitiles repository.
@@ -14,6 +14,11 @@ def RunSteps(api):
   for ref, commit in api.gitiles.refs(url).iteritems():
     api.gitiles.log(url, ref, limit=10)
 
+  # Read only the first commits of a long log, a page at a time.
+  commits, truncated = api.gitiles.bounded_log(
+      url, 'refs/heads/A', limit=2, page_size=2, step_name='bounded log')
+  assert len(commits) == 2 and truncated, (commits, truncated)
+
   data = api.gitiles.fetch(url, 'OWNERS', test_data='foobar')
   assert data == 'foobar'
 
@@ -33,6 +38,8 @@ def GenTests(api):
           'gitiles log: refs/heads/B',
           'B',
       )
+      + api.gitiles.bounded_log('bounded log', 'A', n=5, limit=2,
+                                page_size=2)
       + api.gitiles.fetch(
           'fetch master:OWNERS',
           'foobar'
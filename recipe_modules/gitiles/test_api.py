@@ -53,5 +53,41 @@ class GitilesTestApi(recipe_test_api.RecipeTestApi):
       })
     return self.step_data(step_name, self.m.json.output(commits))
 
+  def bounded_log(self, step_name, s, n=3, limit=100, page_size=1000):
+    """Returns step data for the pages of a bounded_log() of n fake commits.
+
+    The limit and page size must be those passed to bounded_log().
+    """
+    entries = []
+    for i in xrange(n):
+      commit = 'fake %s hash %d' % (s, i)
+      entries.append({
+          'commit': self.hash(commit),
+          'tree': self.hash('tree', commit),
+          'parents': [self.hash('parent', commit)],
+          'author': {
+              'name': 'Fake %s' % s,
+              'email': 'fake_%s@fake_%i.email.com' % (s, i),
+              'time': 'Mon Jan 01 00:00:00 2015',
+          },
+          'message': 'fake %s msg %d' % (s, i),
+      })
+
+    ret = None
+    start = 0
+    pages = 0
+    wanted = min(n, limit + 1)
+    while True:
+      pages += 1
+      size = min(page_size, limit + 1 - start)
+      page = {'log': entries[start:start + size]}
+      if start + size < n:
+        page['next'] = self.hash('next', str(start))
+      data = self.m.url.json('%s.page %d' % (step_name, pages), page)
+      ret = data if ret is None else ret + data
+      start += size
+      if start >= wanted or 'next' not in page:
+        return ret
+
   def fetch(self, step_name, data):
     return self.m.url.text(step_name, base64.b64encode(data))
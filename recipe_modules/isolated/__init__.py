@@ -1,9 +1,10 @@
 DEPS = [
-    'recipe_engine/cipd',
+    'cipd',
     'recipe_engine/context',
+    'recipe_engine/file',
     'recipe_engine/json',
     'recipe_engine/path',
-    'recipe_engine/raw_io',
+    'recipe_engine/python',
     'recipe_engine/step',
 ]
 
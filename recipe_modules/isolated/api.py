@@ -4,7 +4,8 @@
 
 from recipe_engine import recipe_api
 
-import os
+# The namespace on the isolate server in which content is gzip-compressed.
+DEFAULT_NAMESPACE = 'default-gzip'
 
 
 class IsolatedApi(recipe_api.RecipeApi):
@@ -14,6 +15,7 @@ class IsolatedApi(recipe_api.RecipeApi):
     super(IsolatedApi, self).__init__(*args, **kwargs)
     self._isolate_server = isolate_server
     self._isolated_client = None
+    self._isolate_client = None
 
   def __call__(self, *args, **kwargs):
     """Return an isolate command step."""
@@ -28,11 +30,13 @@ class IsolatedApi(recipe_api.RecipeApi):
 
     with self.m.step.nest('ensure_isolated'):
       with self.m.context(infra_steps=True):
-        pkgs = self.m.cipd.EnsureFile()
-        pkgs.add_package('infra/tools/luci/isolated/${platform}', version or 'release')
         cipd_dir = self.m.path['start_dir'].join('cipd', 'isolated')
-        self.m.cipd.ensure(cipd_dir, pkgs)
+        self.m.cipd.ensure(cipd_dir, {
+            'infra/tools/luci/isolated/${platform}': version or 'release',
+            'infra/tools/luci/isolate/${platform}': version or 'release',
+        })
         self._isolated_client = cipd_dir.join('isolated')
+        self._isolate_client = cipd_dir.join('isolate')
         return self._isolated_client
 
   @property
@@ -49,19 +53,103 @@ class IsolatedApi(recipe_api.RecipeApi):
     """Changes URL of Isolate server to use."""
     self._isolate_server = value
 
-  def isolated(self):
+  def isolated(self, namespace=DEFAULT_NAMESPACE):
     """Returns an Isolated object that can be used to archive a set of files
-    and directories."""
-    return Isolated(self)
+    and directories.
+
+    Args:
+      namespace (str): The namespace on the isolate server to archive to, which
+        determines how content is compressed. Content which is already
+        compressed uploads and downloads faster in the uncompressed 'default'
+        namespace.
+    """
+    return Isolated(self, namespace)
+
+  def archive_many(self, step_name, isolateds):
+    """Archives several isolateds with a single invocation of the client.
+
+    Rather than being passed on the command line, the files and directories
+    staged in each isolated are written to an .isolate manifest, so the size of
+    the command line does not grow with the number of files. All the isolateds
+    are uploaded over the same connection to the isolate server.
+
+    The isolate client takes the root of an isolated to be the deepest
+    directory containing both its .isolate manifest and all of its entries,
+    so rather than writing the manifest into the (source or build) tree the
+    entries were staged from, the entries are first gathered under a
+    temporary root in the cleanup directory, next to the manifest.
+
+    Args:
+      step_name (str): The name of the step.
+      isolateds (seq[Isolated]): The isolateds to archive.
+
+    Returns:
+      A list of the hashes of the isolateds, in the same order.
+    """
+    return [
+        isolated_hash
+        for isolated_hash, _ in self._archive_many(step_name, isolateds)
+    ]
+
+  def _archive_many(self, step_name, isolateds):
+    """Implements archive_many().
+
+    Returns:
+      A list of the (hash, Path of the .isolated file) of each isolated.
+    """
+    assert self._isolate_client
+    assert isolateds
+    namespaces = set(isolated.namespace for isolated in isolateds)
+    assert len(namespaces) == 1, 'isolateds must share a namespace'
+    gen_dir = self.m.path.mkdtemp('isolate-gen')
+    names = []
+    gen_files = []
+    isolated_files = []
+    for i, isolated in enumerate(isolateds):
+      name = 'isolated-%d' % i
+      root, isolate = isolated._gathered().render_isolate()
+      isolate_path = root.join('%s.isolate' % name)
+      self.m.file.write_json(
+          'write %s.isolate' % name, isolate_path, isolate)
+      gen_file = gen_dir.join('%s.isolated.gen.json' % name)
+      isolated_file = gen_dir.join('%s.isolated' % name)
+      self.m.file.write_json(
+          'write %s.isolated.gen.json' % name, gen_file, {
+              'version': 1,
+              'dir': str(root),
+              'args': [
+                  '--isolate', str(isolate_path),
+                  '--isolated', str(isolated_file),
+              ],
+          })
+      names.append(name)
+      gen_files.append(gen_file)
+      isolated_files.append(isolated_file)
+
+    hashes = self.m.step(
+        step_name,
+        [
+            self._isolate_client,
+            'batcharchive',
+            '-isolate-server', self.isolate_server,
+            '-namespace', namespaces.pop(),
+            '-dump-json', self.m.json.output(),
+        ] + gen_files,
+        step_test_data=lambda: self.test_api.archive_many(len(isolateds)),
+    ).json.output
+    return [(hashes[name], f) for name, f in zip(names, isolated_files)]
 
 
 class Isolated(object):
   """Used to gather a list of files and directories to an isolated."""
 
-  def __init__(self, module):
+  def __init__(self, module, namespace):
     self._module = module
+    self._namespace = namespace
     self._files = {}
     self._dirs = {}
+    # Maps the string form of each wd to its Path.
+    self._wds = {}
 
   def add_file(self, path, wd=None):
     """Stages a single file to be added to the isolated.
@@ -81,7 +169,8 @@ class Isolated(object):
     assert path
     wd = wd or self._module.m.context.cwd
     assert wd.is_parent_of(path)
-    self._files.setdefault(str(wd), []).append(str(path))
+    self._wds[str(wd)] = wd
+    self._files.setdefault(str(wd), []).append(path)
 
   def add_dir(self, path, wd=None):
     """Stages a single directory to be added to the isolated.
@@ -101,26 +190,125 @@ class Isolated(object):
     assert path
     wd = wd or self._module.m.context.cwd
     assert wd.is_parent_of(path)
-    self._dirs.setdefault(str(wd), []).append(str(path))
+    self._wds[str(wd)] = wd
+    self._dirs.setdefault(str(wd), []).append(path)
 
-  def archive(self, step_name):
-    """Step to archive all staged files and directories."""
-    assert self._module._isolated_client
-    cmd = [
-        self._module._isolated_client,
-        'archive',
-        '-isolate-server', self._module.isolate_server,
-        '-namespace', 'default-gzip',
-        '-dump-hash', self._module.m.raw_io.output_text(),
+  @property
+  def namespace(self):
+    """The namespace on the isolate server this isolated is archived to."""
+    return self._namespace
+
+  def _relpath(self, wd_key, path):
+    """Returns the '/'-separated path of a staged path relative to its wd."""
+    return '/'.join(path.pieces[len(self._wds[wd_key].pieces):])
+
+  def _entries(self):
+    """Returns the (wd key, path, relative path, is dir) of each staged entry."""
+    return [
+        (wd_key, path, self._relpath(wd_key, path), is_dir)
+        for staged, is_dir in ((self._files, False), (self._dirs, True))
+        for wd_key, paths in sorted(staged.iteritems())
+        for path in paths
     ]
-    for wd, files in self._files.iteritems():
-      for f in files:
-        cmd.extend(['-files', wd + ':' + os.path.relpath(f, wd)])
-    for wd, dirs in self._dirs.iteritems():
-      for d in dirs:
-        cmd.extend(['-dirs', wd + ':' + os.path.relpath(d, wd)])
-    return self._module.m.step(
-        'archive',
-        cmd,
-        step_test_data=lambda: self._module.test_api.archive(),
-    ).raw_io.output_text
+
+  def render_isolate(self):
+    """Renders the staged files and directories as an .isolate manifest.
+
+    All files and directories must have been staged with the same wd, which
+    becomes the root of the isolated.
+
+    Returns:
+      A (root, isolate) tuple of the Path of the root and the JSON-compatible
+      contents of the .isolate file, whose paths are relative to the root.
+    """
+    assert len(self._wds) == 1, 'an .isolate must have a single root'
+    # Directories are distinguished from files by a trailing separator.
+    paths = [
+        rel + '/' if is_dir else rel
+        for _, _, rel, is_dir in self._entries()
+    ]
+    return self._wds.values()[0], {'variables': {'files': paths}}
+
+  def _gathered(self):
+    """Returns an equivalent isolated whose entries are staged under one wd.
+
+    The entries are gathered under a temporary root, hard-linked rather than
+    copied where possible, so that the isolated can be described by an
+    .isolate manifest without writing anything to the trees they came from.
+    """
+    m = self._module.m
+    root = m.path.mkdtemp('isolated-root')
+    gathered = Isolated(self._module, self._namespace)
+    spec = []
+    for _, path, rel, is_dir in self._entries():
+      spec.append([str(path), rel])
+      gathered_path = root.join(*rel.split('/'))
+      if is_dir:
+        gathered.add_dir(gathered_path, wd=root)
+      else:
+        gathered.add_file(gathered_path, wd=root)
+    m.python(
+        'gather files',
+        self._module.resource('link_files.py'),
+        args=['--root', root, m.json.input(spec)],
+        infra_step=True,
+    )
+    return gathered
+
+  def archive(self, step_name, use_digest_cache=False):
+    """Step to archive all staged files and directories.
+
+    Args:
+      step_name (str): The name of the step.
+      use_digest_cache (bool): Whether to consult the digest cache kept in the
+        'isolated' named cache, which remembers the digest of each staged file
+        by its path, size, mtime and inode, and the hash of each isolated
+        archived before by its contents. If the contents are those of an
+        isolated archived by an earlier build, and a single query of the
+        isolate server finds it still has that isolated and all of its files,
+        the isolated's hash is returned without archiving it again. Only files
+        which changed since they were last hashed are read for the lookup, so
+        this is only worthwhile for isolateds whose files are not all freshly
+        generated by every build.
+
+    Returns:
+      The hash of the isolated.
+    """
+    assert self._module._isolated_client
+    if not use_digest_cache:
+      return self._archive(step_name)[0]
+
+    m = self._module.m
+    cache_args = ['--cache', m.path['cache'].join('isolated', 'digests.json')]
+    entries = [[wd_key, rel] for wd_key, _, rel, _ in self._entries()]
+    lookup = m.python(
+        'look up cached digests',
+        self._module.resource('digest_cache.py'),
+        args=cache_args + ['lookup', m.json.input({
+            'server': self._module.isolate_server,
+            'namespace': self._namespace,
+            'entries': entries,
+        })],
+        stdout=m.json.output(),
+        infra_step=True,
+        step_test_data=lambda: self._module.test_api.digest_cache_lookup(),
+    )
+    key = lookup.stdout['key']
+    if lookup.stdout['isolated']:
+      lookup.presentation.step_text = 'unchanged since last archived'
+      return lookup.stdout['isolated']
+    lookup.presentation.step_text = 'changed since last archived'
+
+    isolated_hash, isolated_file = self._archive(step_name)
+    m.python(
+        'cache digests',
+        self._module.resource('digest_cache.py'),
+        args=cache_args + ['record', key, isolated_hash, isolated_file],
+        infra_step=True,
+    )
+    return isolated_hash
+
+  def _archive(self, step_name):
+    # The entries are described by an .isolate manifest rather than on the
+    # command line, which would grow with the number of files.
+    return self._module._archive_many(step_name, [self])[0]
@@ -37,9 +37,40 @@ def RunSteps(api):
   isolated.add_dir(temp.join('sub', 'dir'), temp)
   isolated.archive('archiving...')
 
+  # Files staged under different wds are gathered under a single root, here
+  # with c at the top level next to a.
+  flattened = api.isolated.isolated()
+  flattened.add_file(temp.join('a'), temp)
+  flattened.add_file(temp.join('sub', 'dir', 'c'), temp.join('sub', 'dir'))
+  flattened.archive('archiving flattened...')
+
+  # Files which have not changed since they were last archived need not be
+  # hashed or uploaded again.
+  cached = api.isolated.isolated()
+  cached.add_file(temp.join('a'), temp)
+  cached.archive('archiving with cache...', use_digest_cache=True)
+
+  # Content which is already compressed may be archived uncompressed.
+  uncompressed = api.isolated.isolated(namespace='default')
+  uncompressed.add_file(temp.join('b'), temp)
+  uncompressed.archive('archiving uncompressed...')
+  assert uncompressed.namespace == 'default'
+
+  # Or archive several isolateds at once with a single upload.
+  first = api.isolated.isolated()
+  first.add_file(temp.join('a'), temp)
+  first.add_dir(temp.join('sub', 'dir'), temp)
+  second = api.isolated.isolated()
+  second.add_file(temp.join('sub', 'dir', 'c'), temp.join('sub'))
+  hashes = api.isolated.archive_many('archiving many...', [first, second])
+  assert len(hashes) == 2
+
   # You can also run an arbitrary command.
   api.isolated('version')
 
 
 def GenTests(api):
   yield api.test('basic')
+  yield (api.test('digest_cache_hit') +
+         api.step_data('look up cached digests',
+                       api.isolated.digest_cache_lookup(isolated='[hash]')))
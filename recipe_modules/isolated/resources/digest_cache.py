@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Caches the digests of files staged for isolation across builds.
+
+The cache lives in a JSON file and holds two maps:
+  files: the path of each file hashed before to its [size, mtime, inode,
+    digest], so that a file is only read again once it has changed.
+  isolateds: a key identifying the contents of each isolated archived before
+    to the [hash, size] of its .isolated file and the time it was archived.
+
+An isolated whose contents were archived before is only reused if the isolate
+server still has the .isolated file and every file it references, which is
+checked with a single batched query, so how long the server retains content
+for need not be assumed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import stat
+import sys
+import time
+import urllib2
+
+# The OAuth scope the isolate server authenticates requests with.
+AUTH_SCOPE = 'https://www.googleapis.com/auth/userinfo.email'
+
+# The most isolateds to remember, to bound the size of the cache; the ones
+# archived longest ago are forgotten first.
+MAX_ISOLATEDS = 1000
+
+
+def load(cache_file):
+  try:
+    with open(cache_file) as f:
+      cache = json.load(f)
+  except (IOError, ValueError):
+    cache = {}
+  cache.setdefault('files', {})
+  # Forget the isolateds recorded in an older format.
+  cache['isolateds'] = {
+      key: value for key, value in cache.get('isolateds', {}).iteritems()
+      if len(value) == 3
+  }
+  return cache
+
+
+def save(cache, cache_file):
+  cache_dir = os.path.dirname(cache_file)
+  if not os.path.isdir(cache_dir):
+    os.makedirs(cache_dir)
+  tmp_file = cache_file + '.tmp'
+  with open(tmp_file, 'w') as f:
+    json.dump(cache, f)
+  os.rename(tmp_file, cache_file)
+
+
+def digest(cache, path, st):
+  key = [st.st_size, st.st_mtime, st.st_ino]
+  cached = cache['files'].get(path)
+  if cached and cached[:3] == key:
+    return cached[3]
+  sha1 = hashlib.sha1()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      sha1.update(chunk)
+  cache['files'][path] = key + [sha1.hexdigest()]
+  return sha1.hexdigest()
+
+
+def walk(wd, rel):
+  path = os.path.join(wd, rel)
+  if not os.path.isdir(path):
+    yield rel, path
+    return
+  for root, _, files in os.walk(path):
+    for name in files:
+      full = os.path.join(root, name)
+      yield os.path.relpath(full, wd), full
+
+
+def access_token():
+  """Returns an OAuth token from the LUCI_CONTEXT local auth server."""
+  with open(os.environ['LUCI_CONTEXT']) as f:
+    local_auth = json.load(f)['local_auth']
+  request = urllib2.Request(
+      'http://127.0.0.1:%d/rpc/LuciLocalAuthService.GetOAuthToken' %
+      local_auth['rpc_port'],
+      json.dumps({
+          'scopes': [AUTH_SCOPE],
+          'secret': local_auth['secret'],
+          'account_id': local_auth['default_account_id'],
+      }),
+      {'Content-Type': 'application/json'})
+  return json.load(urllib2.urlopen(request))['access_token']
+
+
+def missing(server, namespace, items):
+  """Returns how many of the (digest, size, is_isolated) items are missing.
+
+  Every item is checked with a single preupload request, to which the server
+  replies with the items it does not have.
+  """
+  if not server.startswith('http'):
+    server = 'https://' + server
+  request = urllib2.Request(
+      '%s/_ah/api/isolateservice/v1/preupload' % server.rstrip('/'),
+      json.dumps({
+          'items': [{
+              'digest': d,
+              'size': size,
+              'is_isolated': is_isolated,
+          } for d, size, is_isolated in items],
+          'namespace': {'namespace': namespace},
+      }),
+      {
+          'Authorization': 'Bearer %s' % access_token(),
+          'Content-Type': 'application/json',
+      })
+  return len(json.load(urllib2.urlopen(request)).get('items', []))
+
+
+def lookup(args):
+  with open(args.entries) as f:
+    entries = json.load(f)
+  cache = load(args.cache)
+  contents = []
+  for wd, rel in entries['entries']:
+    for name, path in walk(wd, rel):
+      st = os.stat(path)
+      contents.append([
+          name, digest(cache, path, st), st.st_size,
+          bool(st.st_mode & stat.S_IXUSR),
+      ])
+  save(cache, args.cache)
+  contents.sort()
+  key = hashlib.sha1(json.dumps(
+      [entries['server'], entries['namespace'], contents])).hexdigest()
+
+  isolated = None
+  cached = cache['isolateds'].get(key)
+  if cached:
+    items = [(cached[0], cached[1], True)] + [
+        (d, size, False) for _, d, size, _ in contents
+    ]
+    try:
+      if not missing(entries['server'], entries['namespace'], items):
+        isolated = cached[0]
+    except (IOError, KeyError, ValueError) as e:
+      # Without knowing whether the server still has everything, the isolated
+      # must be archived again.
+      sys.stderr.write('failed to query the isolate server: %s\n' % e)
+  json.dump({'key': key, 'isolated': isolated}, sys.stdout)
+
+
+def record(args):
+  cache = load(args.cache)
+  cache['isolateds'][args.key] = [
+      args.isolated, os.path.getsize(args.isolated_file), time.time()
+  ]
+  newest = sorted(
+      cache['isolateds'].iteritems(), key=lambda item: item[1][2],
+      reverse=True)[:MAX_ISOLATEDS]
+  cache['isolateds'] = dict(newest)
+  # Forget the files which no longer exist.
+  cache['files'] = {
+      path: value for path, value in cache['files'].iteritems()
+      if os.path.exists(path)
+  }
+  save(cache, args.cache)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--cache', required=True,
+                      help='The JSON file holding the cache.')
+  subparsers = parser.add_subparsers()
+
+  lookup_parser = subparsers.add_parser(
+      'lookup', help='Looks up the hash of an isolated with unchanged files.')
+  lookup_parser.add_argument(
+      'entries',
+      help='A JSON file with the server, namespace, and [wd, relative path] '
+      'entries of the isolated.')
+  lookup_parser.set_defaults(func=lookup)
+
+  record_parser = subparsers.add_parser(
+      'record', help='Records the hash of an archived isolated.')
+  record_parser.add_argument('key')
+  record_parser.add_argument('isolated')
+  record_parser.add_argument('isolated_file',
+                             help='The .isolated file which was archived.')
+  record_parser.set_defaults(func=record)
+
+  args = parser.parse_args()
+  args.func(args)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
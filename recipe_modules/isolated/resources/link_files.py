@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Gathers files and directories from several roots under a single one.
+
+The spec is a JSON file of the form:
+  [
+    [<absolute path of a file or directory>, <path relative to the root>],
+    ...
+  ]
+
+Files are hard-linked into place, so that no content is copied, unless the
+root is on another file system, in which case they are copied. Symlinks within
+directories are recreated as they are.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+
+
+def link_file(src, dest):
+  dest_dir = os.path.dirname(dest)
+  if not os.path.isdir(dest_dir):
+    os.makedirs(dest_dir)
+  if os.path.islink(src):
+    os.symlink(os.readlink(src), dest)
+    return
+  try:
+    os.link(src, dest)
+  except OSError:
+    shutil.copy2(src, dest)
+
+
+def link(src, dest):
+  if not os.path.isdir(src) or os.path.islink(src):
+    link_file(src, dest)
+    return
+  for root, dirs, files in os.walk(src):
+    dest_root = os.path.join(dest, os.path.relpath(root, src))
+    if not os.path.isdir(dest_root):
+      os.makedirs(dest_root)
+    for name in files:
+      link_file(os.path.join(root, name), os.path.join(dest_root, name))
+    # os.walk does not descend into symlinks to directories.
+    for name in dirs:
+      if os.path.islink(os.path.join(root, name)):
+        link_file(os.path.join(root, name), os.path.join(dest_root, name))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--root', required=True,
+                      help='The directory to gather everything under')
+  parser.add_argument('spec', type=argparse.FileType('r'),
+                      help='The JSON spec of what to gather')
+  args = parser.parse_args()
+
+  for src, rel in json.load(args.spec):
+    link(src, os.path.join(args.root, rel))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
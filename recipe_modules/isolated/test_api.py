@@ -7,5 +7,12 @@ from recipe_engine import recipe_test_api
 
 class IsolatedTestApi(recipe_test_api.RecipeTestApi):
 
-  def archive(self):
-    return self.m.raw_io.output_text('[dummy hash]')
+  def archive_many(self, count):
+    return self.m.json.output({
+        'isolated-%d' % i: '[dummy hash %d]' % i for i in range(count)})
+
+  def digest_cache_lookup(self, isolated=None):
+    return self.m.json.output_stream({
+        'key': 'e26bb6d5b9e0c2a8d5d6f7e4a6c7e3a2b1c4d5e6',
+        'isolated': isolated,
+    })
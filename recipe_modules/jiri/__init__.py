@@ -2,8 +2,11 @@ DEPS = [
   'cipd',
   'infra/gerrit',
   'recipe_engine/context',
+  'recipe_engine/file',
   'recipe_engine/json',
   'recipe_engine/path',
+  'recipe_engine/platform',
+  'recipe_engine/python',
   'recipe_engine/raw_io',
   'recipe_engine/source_manifest',
   'recipe_engine/step',
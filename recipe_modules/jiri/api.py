@@ -3,34 +3,153 @@
 # found in the LICENSE file.
 
 from recipe_engine import recipe_api
+from recipe_engine.config_types import Path
+
+import re
 
 from urlparse import urlparse
+from xml.etree import ElementTree
 
 # Flags added to all jiri commands.
 COMMON_FLAGS = [
     '-vv',
     '-time',
-    '-j=10',
 ]
 
+# Bounds on the number of jobs jiri runs in parallel. Fetches into a cold git
+# cache are bound by the network and the git servers rather than the bot, so
+# fewer of them are run at once.
+MIN_JOBS = 10
+COLD_CACHE_MAX_JOBS = 16
+WARM_CACHE_MAX_JOBS = 64
+
+# Matches a line of the timings which jiri prints with -time. Each line has
+# the start time of an operation, its label, indented by its depth, its
+# duration and its end time, e.g.
+# "00:00:10.000    fetch zircon  45.000s       00:00:55.000".
+TIMING_RE = re.compile(r'^(?:[\d:.]+\s+)?(?P<label>\S.*?)\s+'
+                       r'(?P<duration>(?:\d+(?:\.\d+)?(?:h|ms|us|ns|m|s))+)'
+                       r'(?:\s+[\d:.]+)?\s*$')
+# The label of the time within an operation that none of its sub-operations
+# account for.
+UNACCOUNTED_LABEL = '*'
+DURATION_UNIT_SECS = {
+    'h': 3600,
+    'm': 60,
+    's': 1,
+    'ms': 1e-3,
+    'us': 1e-6,
+    'ns': 1e-9,
+}
+
+# How many of the slowest operations to list in the timing summary.
+TIMING_SUMMARY_SIZE = 10
+
+
+def parse_timings(output):
+  """Parses the timings printed by jiri -time.
+
+  Args:
+    output (str): The output of a jiri command run with -time.
+
+  Returns:
+    A list of (label, seconds) tuples, from the slowest to the fastest.
+  """
+  timings = []
+  for line in (output or '').splitlines():
+    match = TIMING_RE.match(line.strip())
+    if not match or match.group('label') == UNACCOUNTED_LABEL:
+      continue
+    secs = sum(
+        float(value) * DURATION_UNIT_SECS[unit] for value, unit in re.findall(
+            r'(\d+(?:\.\d+)?)(h|ms|us|ns|m|s)', match.group('duration')))
+    timings.append((match.group('label'), secs))
+  return sorted(timings, key=lambda timing: timing[1], reverse=True)
+
+
+class Manifest(object):
+  """A jiri manifest or snapshot, parsed and indexed in-process.
+
+  Attributes:
+    projects (dict(str, dict(str, str))): The attributes of each <project>, by
+      name.
+    imports (dict(str, dict(str, str))): The attributes of each <import>, by
+      name.
+    localimports (list(str)): The file of each <localimport>, relative to the
+      manifest.
+    hooks (dict((str, str), dict(str, str))): The attributes of each <hook>,
+      by the name of its project and its own name, since hooks of different
+      projects may share a name.
+
+  Attributes which are missing or have empty values are omitted, as they are
+  by JiriApi.read_manifest_element.
+  """
+
+  def __init__(self, xml):
+    root = ElementTree.fromstring(xml)
+    self.projects = self._index(root.findall('projects/project'))
+    self.imports = self._index(root.findall('imports/import'))
+    self.localimports = [
+        element.get('file') for element in root.findall('imports/localimport')
+    ]
+    self.hooks = self._index(
+        root.findall('hooks/hook'),
+        key=lambda element: (element.get('project'), element.get('name')))
+
+  @staticmethod
+  def _index(elements, key=lambda element: element.get('name')):
+    return {
+        key(element): {
+            k: v.strip() for k, v in element.attrib.iteritems() if v.strip()
+        } for element in elements
+    }
+
+  def element(self, element_type, element_name):
+    """Returns the attributes of a <project> or <import>.
+
+    Args:
+      element_type (str): One of 'import' or 'project'.
+      element_name (str): The name of the element.
+
+    Returns:
+      A dict of the attributes of the element, which is empty if the manifest
+      has no such element.
+    """
+    assert element_type in ('import', 'project')
+    elements = self.projects if element_type == 'project' else self.imports
+    return dict(elements.get(element_name, {}))
+
 
 class JiriApi(recipe_api.RecipeApi):
   """JiriApi provides support for Jiri managed checkouts."""
 
+  Manifest = Manifest
+
   def __init__(self, *args, **kwargs):
     super(JiriApi, self).__init__(*args, **kwargs)
     self._jiri_executable = None
+    self._jobs = None
+    # The manifests read so far, by path. They are forgotten whenever jiri may
+    # have changed them.
+    self._manifests = {}
 
   def __call__(self, *args, **kwargs):
-    """Return a jiri command step."""
+    """Return a jiri command step.
+
+    Args:
+      jobs (int): How many jobs jiri may run in parallel; defaults to `jobs`.
+    """
+    name = kwargs.pop('name', 'jiri ' + args[0])
+    full_cmd = self._full_cmd(args, kwargs.pop('jobs', None))
+    return self.m.step(name, full_cmd, **kwargs)
+
+  def _full_cmd(self, args, jobs=None):
+    """Returns the command line of a jiri subcommand and its arguments."""
     subcommand = args[0]  # E.g., 'init' or 'update'
-    flags = COMMON_FLAGS + list(args[1:])
+    flags = COMMON_FLAGS + ['-j=%d' % (jobs or self.jobs)] + list(args[1:])
 
     assert self._jiri_executable
-    full_cmd = [self._jiri_executable, subcommand] + flags
-
-    name = kwargs.pop('name', 'jiri ' + subcommand)
-    return self.m.step(name, full_cmd, **kwargs)
+    return [self._jiri_executable, subcommand] + flags
 
   def ensure_jiri(self, version=None):
     with self.m.step.nest('ensure_jiri'):
@@ -47,6 +166,22 @@ class JiriApi(recipe_api.RecipeApi):
   def jiri(self):
     return self._jiri_executable
 
+  @property
+  def jobs(self):
+    """The number of jobs jiri runs in parallel unless told otherwise.
+
+    This scales with the number of CPUs of the bot, and more so once the git
+    cache is warm and fetches mostly hit it.
+    """
+    if self._jobs is None:
+      cpu_count = self.m.platform.cpu_count
+      if self.m.path.exists(self.m.path['cache'].join('git')):
+        self._jobs = min(cpu_count * 2, WARM_CACHE_MAX_JOBS)
+      else:
+        self._jobs = min(cpu_count, COLD_CACHE_MAX_JOBS)
+      self._jobs = max(self._jobs, MIN_JOBS)
+    return self._jobs
+
   def init(self, dir=None, **kwargs):
     cmd = [
         'init',
@@ -132,7 +267,31 @@ class JiriApi(recipe_api.RecipeApi):
     if snapshot is not None:
       cmd.append(snapshot)
 
-    return self(*cmd, **kwargs)
+    # Updating may change the manifests in the checkout.
+    self._manifests.clear()
+    name = kwargs.pop('name', 'jiri update')
+    full_cmd = self._full_cmd(cmd, kwargs.pop('jobs', None))
+    try:
+      # The timings which jiri prints to stderr are copied to a file, while
+      # its stderr still streams to the step's log.
+      return self.m.python(
+          name,
+          self.resource('tee_stderr.py'),
+          args=['--output', self.m.raw_io.output(name='timings'), '--'] +
+          full_cmd,
+          **kwargs)
+    finally:
+      # The timings are most useful when the update fails or times out.
+      self._summarize_timings(self.m.step.active_result)
+
+  def _summarize_timings(self, step):
+    """Lists the slowest operations of a jiri command in its step."""
+    timings = parse_timings(step.raw_io.outputs.get('timings'))
+    if timings:
+      step.presentation.logs['slowest operations'] = [
+          '%8.1fs %s' % (secs, label)
+          for label, secs in timings[:TIMING_SUMMARY_SIZE]
+      ]
 
   def run_hooks(self, local_manifest=False, attempts=3):
     cmd = [
@@ -249,6 +408,7 @@ class JiriApi(recipe_api.RecipeApi):
           projects=test_projects,
       )
 
+    self._manifests.pop(str(self._manifest_path(manifest)), None)
     step = self(
         *cmd,
         step_test_data=lambda: self.m.json.test_api.output(test_data),
@@ -398,6 +558,61 @@ class JiriApi(recipe_api.RecipeApi):
     self.update(run_hooks=True, snapshot=snapshot, timeout=timeout_secs)
     self.m.source_manifest.set_json_manifest('checkout', self.source_manifest())
 
+  def _manifest_path(self, manifest):
+    if isinstance(manifest, Path):
+      return manifest
+    # Like jiri, resolve relative paths against the current directory.
+    return (self.m.context.cwd or self.m.path['start_dir']).join(manifest)
+
+  def read_manifest(self, manifest, test_data=None):
+    """Reads a manifest or snapshot file and indexes its elements.
+
+    Unlike read_manifest_element, this does not run jiri, and any number of
+    elements can then be looked up in the manifest without running any further
+    steps. A manifest is only read once until it is edited or updated.
+
+    Args:
+      manifest (str|Path): Path to the manifest file.
+      test_data (str): The contents of the manifest to use in tests.
+
+    Returns:
+      A Manifest.
+    """
+    path = self._manifest_path(manifest)
+    if str(path) not in self._manifests:
+      xml = self.m.file.read_text(
+          'read manifest %s' % self.m.path.basename(path), path,
+          test_data=test_data or self.test_api.example_snapshot)
+      self._manifests[str(path)] = Manifest(xml)
+    return self._manifests[str(path)]
+
+  def diff_snapshots(self, old, new):
+    """Finds the projects which changed between two snapshots.
+
+    Args:
+      old (str|Path|Manifest): The earlier snapshot.
+      new (str|Path|Manifest): The later snapshot.
+
+    Returns:
+      A dict mapping the name of each project which was added, removed or moved
+      to another revision to a tuple of its old and new revisions. The old
+      revision of an added project and the new revision of a removed project
+      are None.
+    """
+    if not isinstance(old, Manifest):
+      old = self.read_manifest(old)
+    if not isinstance(new, Manifest):
+      new = self.read_manifest(new)
+
+    changes = {}
+    for name in set(old.projects) | set(new.projects):
+      old_revision = old.projects.get(name, {}).get('revision')
+      new_revision = new.projects.get(name, {}).get('revision')
+      if (name not in old.projects or name not in new.projects or
+          old_revision != new_revision):
+        changes[name] = (old_revision, new_revision)
+    return changes
+
   def read_manifest_element(self, manifest, element_type, element_name):
     """Reads information about a <project> or <import> from a manifest file.
 
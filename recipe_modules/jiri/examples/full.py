@@ -76,8 +76,30 @@ def RunSteps(api, tryjob, override, checkout_from_snapshot):
       overwrite=True
   )
 
-  # Download all projects.
-  api.jiri.update(gc=True, snapshot='snapshot', local_manifest=True)
+  # Download all projects, with more parallelism than the default.
+  api.jiri.update(gc=True, snapshot='snapshot', local_manifest=True, jobs=32)
+
+  # Read several elements of a manifest without running jiri.
+  manifest = api.jiri.read_manifest('minimal')
+  assert manifest.element('project', 'manifest')['path'] == 'manifest'
+  assert manifest.element('import', 'manifest') == {}
+
+  # Compare two snapshots.
+  changes = api.jiri.diff_snapshots(
+      manifest,
+      api.jiri.Manifest(
+          api.jiri.test_api.manifest(projects=[{
+              'name': 'manifest',
+              'revision': 'fc4dc762688d2263b254208f444f5c0a4b91bc07',
+          }, {
+              'name': 'zircon',
+              'revision': 'c22471f4e3f842ae18dd9adec82ed9eb78ed1127',
+          }])))
+  assert changes == {
+      'manifest': ('4c2b0da3c06341db5cebe4d02c78c93c3b2bd78b',
+                   'fc4dc762688d2263b254208f444f5c0a4b91bc07'),
+      'zircon': (None, 'c22471f4e3f842ae18dd9adec82ed9eb78ed1127'),
+  }, changes
 
   # Edit manifest.
   api.jiri.edit_manifest(
@@ -209,3 +231,25 @@ def GenTests(api):
           element_type='project',
           element_name='test/project',
           test_output={}))
+
+  yield (api.test('warm_cache') +
+      api.path.exists(api.path['cache'].join('git')) +
+      # The format of the timings which jiri prints with -time.
+      api.step_data('jiri update', api.raw_io.output(
+          '00:00:00.000 jiri               62.500s       00:01:02.500\n'
+          '00:00:00.000    *                0.100s       00:00:00.100\n'
+          '00:00:00.100    update          62.400s       00:01:02.500\n'
+          '00:00:00.100       *             1.000s       00:00:01.100\n'
+          '00:00:01.100       fetch zircon 12.300s       00:00:13.400\n'
+          '00:00:13.400       fetch garnet  0.350s       00:00:13.750\n',
+          name='timings')) +
+      api.jiri.read_manifest_element(api,
+          manifest='minimal',
+          element_type='import',
+          element_name='test/import',
+          test_output={}) +
+      api.jiri.read_manifest_element(api,
+          manifest='minimal',
+          element_type='project',
+          element_name='test/project',
+          test_output={}))
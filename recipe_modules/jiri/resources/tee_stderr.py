@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# Copyright 2018 The Fuchsia Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Runs a command and copies what it writes to stderr into a file.
+
+The stderr of the command is still written to stderr as it is produced, so it
+shows up in the log of the step as usual. Exits with the command's return code.
+"""
+
+import argparse
+import subprocess
+import sys
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--output', required=True,
+                      help='The file to copy the stderr of the command to')
+  parser.add_argument('cmd', nargs=argparse.REMAINDER,
+                      help='The command to run, after --')
+  args = parser.parse_args()
+  cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+
+  proc = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+  with open(args.output, 'w') as output:
+    for line in iter(proc.stderr.readline, ''):
+      sys.stderr.write(line)
+      sys.stderr.flush()
+      output.write(line)
+  return proc.wait()
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -4,7 +4,49 @@
 
 from recipe_engine import recipe_test_api
 
+from xml.etree import ElementTree
+
 class JiriTestApi(recipe_test_api.RecipeTestApi):
+  def manifest(self, projects=(), imports=(), localimports=(), hooks=()):
+    """Returns the XML of a jiri manifest.
+
+    Args:
+      projects (seq(dict)): The attributes of each <project> in the manifest.
+      imports (seq(dict)): The attributes of each <import> in the manifest.
+      localimports (seq(str)): The file of each <localimport> in the manifest.
+      hooks (seq(dict)): The attributes of each <hook> in the manifest.
+    """
+    root = ElementTree.Element('manifest')
+    for tag, elements in (('imports', imports), ('projects', projects),
+                          ('hooks', hooks)):
+      parent = ElementTree.SubElement(root, tag)
+      for attributes in elements:
+        ElementTree.SubElement(parent, tag[:-1], attributes)
+    for localimport in localimports:
+      ElementTree.SubElement(root.find('imports'), 'localimport',
+                             {'file': localimport})
+    return ElementTree.tostring(root)
+
+  def read_manifest(self, manifest_name, projects=(), imports=(),
+                    parent_step=None):
+    """Simulates a call to JiriApi.read_manifest.
+
+    Args:
+      manifest_name (str): The base name of the manifest file.
+      parent_step (str): The name of the step the manifest is read within, if
+        any.
+
+      (See manifest for docs on remaining args)
+
+    Returns:
+      recipe_test_api.TestData simulating the step reading the manifest.
+    """
+    step_name = 'read manifest %s' % manifest_name
+    if parent_step:
+      step_name = '%s.%s' % (parent_step, step_name)
+    return self.step_data(step_name,
+                          self.m.file.read_text(self.manifest(projects, imports)))
+
   @staticmethod
   def read_manifest_element(api, manifest, element_type, element_name, test_output):
     """Simulates a call to JiriApi.read_manifest_element.
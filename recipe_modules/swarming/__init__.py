@@ -1,6 +1,6 @@
 DEPS = [
+  'cipd',
   'isolated',
-  'recipe_engine/cipd',
   'recipe_engine/context',
   'recipe_engine/json',
   'recipe_engine/path',
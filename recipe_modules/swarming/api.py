@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 
 import base64
+import datetime
 
 from state import TaskState
 
@@ -34,11 +35,16 @@ class CollectResult(object):
       self._state = TaskState.CANCELED
     elif raw_results['results']['state'] == 'KILLED':
       self._state = TaskState.KILLED
+    elif raw_results['results']['state'] == 'RUNNING':
+      self._state = TaskState.RUNNING
+    elif raw_results['results']['state'] == 'PENDING':
+      self._state = TaskState.PENDING
 
     if self._state == TaskState.RPC_FAILURE:
       self._output = raw_results['error']
     else:
-      self._output = self._raw_results['output']
+      # Tasks which have not completed yet may not have any output.
+      self._output = self._raw_results.get('output', '')
       if self._raw_results.get('outputs'):
         self._outputs = {
             output: m.path.join(outdir, id, output)
@@ -67,13 +73,102 @@ class CollectResult(object):
   def outputs(self):
     return self._outputs
 
+  @property
+  def completed(self):
+    """Whether the task has reached a final state."""
+    return self._state not in (TaskState.RUNNING, TaskState.PENDING)
+
+  @property
+  def bot_id(self):
+    """The ID of the bot which picked up the task, if any."""
+    return self._raw_results.get('results', {}).get('bot_id')
+
+  @property
+  def created_ts(self):
+    """The datetime at which the task was created, according to Swarming."""
+    return self._timestamp('created_ts')
+
+  @property
+  def completed_ts(self):
+    """The datetime at which the task completed, or None if it has not."""
+    return self._timestamp('completed_ts')
+
+  def _timestamp(self, key):
+    ts = self._raw_results.get('results', {}).get(key)
+    # Swarming omits the fraction of a second when it is zero.
+    fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in (ts or '') else '%Y-%m-%dT%H:%M:%S'
+    return datetime.datetime.strptime(ts, fmt) if ts else None
+
+
+class BotCounts(object):
+  """Counts of the Swarming bots matching a set of dimensions, by status."""
+
+  def __init__(self, bots):
+    """Tallies a list of bots as returned by `swarming bots`.
+
+    Args:
+      bots (seq[dict]): JSON-compatible dicts describing each bot.
+    """
+    self.total = len(bots)
+    self.idle_ids = [
+        b['bot_id'] for b in bots
+        if not b.get('is_dead') and not b.get('quarantined') and
+        not b.get('task_id')
+    ]
+    self.dead = len([b for b in bots if b.get('is_dead')])
+    self.quarantined = len(
+        [b for b in bots if not b.get('is_dead') and b.get('quarantined')])
+    self.busy = len([
+        b for b in bots
+        if not b.get('is_dead') and not b.get('quarantined') and
+        b.get('task_id')
+    ])
+
+  @property
+  def idle(self):
+    """The number of bots which could pick up a new task right away."""
+    return len(self.idle_ids)
+
+
+class TaskSlice(object):
+  """An alternative set of dimensions on which a Swarming task may run.
+
+  A TaskRequest with fallback slices first waits for a bot matching its own
+  dimensions. If none picks the task up before the request's expiration, the
+  task falls back to the first slice, and so on, each slice overriding the
+  dimensions, command and timeouts of the request it falls back from.
+  """
+
+  def __init__(self, dimensions, expiration_secs=300, cmd=None,
+               io_timeout_secs=None, hard_timeout_secs=None):
+    """Creates a Swarming task slice object.
+
+    Args:
+      dimensions (dict[str]str): Dimensions to filter swarming bots on.
+      expiration_secs (int): Seconds to wait for a bot matching this slice's
+        dimensions before falling back to the next slice, if any, or expiring
+        the task.
+      cmd (list[str]): The command to execute in place of the request's.
+      io_timeout_secs (int): Seconds to allow the task to be silent, in place
+        of the request's.
+      hard_timeout_secs (int): Seconds before swarming should kill the task, in
+        place of the request's.
+    """
+    assert len(dimensions) >= 1 and dimensions['pool']
+    self.dimensions = dimensions
+    self.expiration_secs = expiration_secs
+    self.cmd = cmd
+    self.io_timeout_secs = io_timeout_secs
+    self.hard_timeout_secs = hard_timeout_secs
+
 
 class TaskRequest(object):
   """Wrapper object for constructing a Swarming task request."""
 
   def __init__(self, name, cmd, dimensions, isolated='', isolate_server='',
                expiration_secs=300, io_timeout_secs=60, hard_timeout_secs=1200,
-               idempotent=False, secret_bytes='', cipd_packages=(), outputs=()):
+               idempotent=False, secret_bytes='', cipd_packages=(), outputs=(),
+               fallback_slices=(), namespace='default-gzip'):
     """Creates a Swarming task request object.
 
     For more details on what goes into a Swarming task, see the user guide:
@@ -105,6 +200,10 @@ class TaskRequest(object):
             ref, or tag key/value pair.
       outputs (list[str]): List of paths to files which can be downloaded via
         collect().
+      fallback_slices (seq[TaskSlice]): Slices to fall back to, in order, if
+        no bot picks the task up within expiration_secs.
+      namespace (str): The namespace on the isolate server which the isolated
+        was archived to.
     """
     assert len(dimensions) >= 1 and dimensions['pool']
     self.name = name
@@ -119,24 +218,23 @@ class TaskRequest(object):
     self.secret_bytes = base64.b64encode(secret_bytes)
     self.cipd_packages = cipd_packages
     self.outputs = outputs
+    self.fallback_slices = fallback_slices
+    self.namespace = namespace
 
-  def render_to_json(self):
-    """Renders the task request as a JSON-serializable dict.
-
-    The format follows the Swarming task request API, which may be found here:
-    https://chromium.googlesource.com/infra/luci/luci-go/+/819bad947699d6a3168d476281528b73abfe32d0/common/api/swarming/swarming/v1/swarming-api.json#1313
-    """
+  def _render_properties(self, cmd, dimensions, io_timeout_secs,
+                         hard_timeout_secs):
+    """Renders the properties of one slice of the task request."""
     properties = {
-      'command': self.cmd,
+      'command': cmd,
       'dimensions': [
         {
           'key': k,
           'value': v,
         }
-        for k, v in self.dimensions.iteritems()
+        for k, v in dimensions.iteritems()
       ],
-      'execution_timeout_secs': str(self.hard_timeout_secs),
-      'io_timeout_secs': str(self.io_timeout_secs),
+      'execution_timeout_secs': str(hard_timeout_secs),
+      'io_timeout_secs': str(io_timeout_secs),
       # When a Swarming task is killed, the grace period is the amount of time
       # to wait before a SIGKILL is issued to the process, allowing it to
       # perform any clean-up operations.
@@ -147,7 +245,7 @@ class TaskRequest(object):
     if self.isolate_server and self.isolated:
       properties['inputs_ref'] = {
         'isolated': self.isolated,
-        'namespace': 'default-gzip',
+        'namespace': self.namespace,
         'isolatedserver': self.isolate_server,
       }
     if self.secret_bytes:
@@ -163,22 +261,64 @@ class TaskRequest(object):
           for path, name, version in self.cipd_packages
         ],
       }
-    return {
+    return properties
+
+  def render_to_json(self):
+    """Renders the task request as a JSON-serializable dict.
+
+    The format follows the Swarming task request API, which may be found here:
+    https://chromium.googlesource.com/infra/luci/luci-go/+/819bad947699d6a3168d476281528b73abfe32d0/common/api/swarming/swarming/v1/swarming-api.json#1313
+    """
+    properties = self._render_properties(
+        cmd=self.cmd,
+        dimensions=self.dimensions,
+        io_timeout_secs=self.io_timeout_secs,
+        hard_timeout_secs=self.hard_timeout_secs,
+    )
+    request = {
       'name': self.name,
-      'expiration_secs': str(self.expiration_secs),
       # Priority is a numerical priority between 0 and 255 where a higher
       # number corresponds to a lower priority. Tasks are scheduled by swarming
       # in order of their priority (e.g. if both a task of priority 1 and a task
       # of priority 2 are waiting for resources to free up for execution, the
       # task with priority 1 will take precedence).
       'priority': str(200),
-      'properties': properties,
     }
+    if not self.fallback_slices:
+      request['expiration_secs'] = str(self.expiration_secs)
+      request['properties'] = properties
+      return request
+
+    # Each slice's properties are complete, so a fallback slice inherits
+    # whatever it does not override from the slice it falls back from.
+    task_slices = [{
+      'expiration_secs': str(self.expiration_secs),
+      'properties': properties,
+    }]
+    cmd = self.cmd
+    io_timeout_secs = self.io_timeout_secs
+    hard_timeout_secs = self.hard_timeout_secs
+    for task_slice in self.fallback_slices:
+      cmd = task_slice.cmd or cmd
+      io_timeout_secs = task_slice.io_timeout_secs or io_timeout_secs
+      hard_timeout_secs = task_slice.hard_timeout_secs or hard_timeout_secs
+      task_slices.append({
+        'expiration_secs': str(task_slice.expiration_secs),
+        'properties': self._render_properties(
+            cmd=cmd,
+            dimensions=task_slice.dimensions,
+            io_timeout_secs=io_timeout_secs,
+            hard_timeout_secs=hard_timeout_secs,
+        ),
+      })
+    request['task_slices'] = task_slices
+    return request
 
 
 class SwarmingApi(recipe_api.RecipeApi):
   """APIs for interacting with swarming."""
   TaskState = TaskState
+  TaskSlice = TaskSlice
 
   def __init__(self, swarming_server, *args, **kwargs):
     super(SwarmingApi, self).__init__(*args, **kwargs)
@@ -199,9 +339,9 @@ class SwarmingApi(recipe_api.RecipeApi):
     with self.m.step.nest('ensure_swarming'):
       with self.m.context(infra_steps=True):
         cipd_dir = self.m.path['start_dir'].join('cipd', 'swarming')
-        pkgs = self.m.cipd.EnsureFile()
-        pkgs.add_package('infra/tools/luci/swarming/${platform}', version or 'release')
-        self.m.cipd.ensure(cipd_dir, pkgs)
+        self.m.cipd.ensure(cipd_dir, {
+            'infra/tools/luci/swarming/${platform}': version or 'release',
+        })
         self._swarming_client = cipd_dir.join('swarming')
         return self._swarming_client
 
@@ -222,7 +362,7 @@ class SwarmingApi(recipe_api.RecipeApi):
   def trigger(self, name, raw_cmd, isolated=None, dump_json=None,
               dimensions=None, expiration=None, io_timeout=None,
               hard_timeout=None, idempotent=False, cipd_packages=None,
-              outputs=None):
+              outputs=None, namespace='default-gzip'):
     """Triggers a Swarming task.
 
     Args:
@@ -244,6 +384,8 @@ class SwarmingApi(recipe_api.RecipeApi):
               version: Version of the package, either a package instance ID,
                   ref, or tag key/value pair.
       outputs: list of paths to files which can be downloaded via collect.
+      namespace: namespace on the isolate server which the isolated was
+          archived to.
     """
     assert self._swarming_client
     cmd = [
@@ -252,7 +394,7 @@ class SwarmingApi(recipe_api.RecipeApi):
       '-isolate-server', self.m.isolated.isolate_server,
       '-server', self.swarming_server,
       '-task-name', name,
-      '-namespace', 'default-gzip',
+      '-namespace', namespace,
       '-dump-json', self.m.json.output(leak_to=dump_json),
     ]
     if isolated:
@@ -332,7 +474,7 @@ class SwarmingApi(recipe_api.RecipeApi):
 
     return spawn_resp
 
-  def collect(self, timeout=None, tasks_json=None, tasks=[]):
+  def collect(self, timeout=None, tasks_json=None, tasks=[], eager=False):
     """Waits on a set of Swarming tasks.
 
     Returns both the step result as well as a set of neatly parsed results.
@@ -341,6 +483,9 @@ class SwarmingApi(recipe_api.RecipeApi):
       timeout: timeout to wait for result.
       tasks_json: load details about the task(s) from the json file.
       tasks: list of task ids to wait on.
+      eager: whether to return as soon as any one of the tasks completes,
+        rather than waiting on all of them. Results for the tasks which have
+        not completed yet will be in the RUNNING or PENDING states.
     """
     assert self._swarming_client
     assert (tasks_json and not tasks) or (not tasks_json and tasks)
@@ -357,9 +502,10 @@ class SwarmingApi(recipe_api.RecipeApi):
       cmd.extend(['-timeout', timeout])
     if tasks_json:
       cmd.extend(['-requests-json', tasks_json])
+    if eager:
+      cmd.append('-eager')
     if tasks:
       cmd.extend(tasks)
-    cmd.extend([])
     step_result = self.m.step(
         'collect',
         cmd,
@@ -373,9 +519,58 @@ class SwarmingApi(recipe_api.RecipeApi):
 
     # Fix presentation on collect to reflect bot results.
     for result in parsed_results:
-      if result.output:
+      if result.completed and result.output:
         step_result.presentation.logs['Swarming task output: %s' % result.name] = (
           result.output.split('\n')
         )
 
     return parsed_results
+
+  def cancel(self, task_id, kill_running=False):
+    """Cancels a Swarming task.
+
+    Args:
+      task_id (str): The ID of the task to cancel.
+      kill_running (bool): Whether to kill the task if it is already running,
+        rather than only cancelling it if it is still pending.
+    """
+    assert self._swarming_client
+    cmd = [
+      self._swarming_client,
+      'cancel',
+      '-server', self.swarming_server,
+    ]
+    if kill_running:
+      cmd.append('-kill-running')
+    cmd.append(task_id)
+    return self.m.step('cancel %s' % task_id, cmd, infra_step=True)
+
+  def bot_counts(self, dimensions):
+    """Counts the Swarming bots matching a set of dimensions.
+
+    Args:
+      dimensions (dict[str]str): Dimensions to filter swarming bots on.
+
+    Returns:
+      A BotCounts for the matching bots.
+    """
+    assert self._swarming_client
+    cmd = [
+      self._swarming_client,
+      'bots',
+      '-server', self.swarming_server,
+    ]
+    for k, v in sorted(dimensions.iteritems()):
+      cmd.extend(['-dimension', '%s=%s' % (k, v)])
+    cmd.extend(['-json', self.m.json.output()])
+    step_result = self.m.step(
+        'count bots %s' % ','.join(
+            '%s:%s' % (k, v) for k, v in sorted(dimensions.iteritems())),
+        cmd,
+        infra_step=True,
+        step_test_data=lambda: self.test_api.bots(),
+    )
+    counts = BotCounts(step_result.json.output or [])
+    step_result.presentation.step_text = '%d idle of %d' % (
+        counts.idle, counts.total)
+    return counts
@@ -48,6 +48,14 @@ def RunSteps(api, spawn_tasks):
         secret_bytes='shh, don\'t tell',
         outputs=['out/hello.txt'],
         cipd_packages=[('cipd_bin_packages', 'infra/git/${platform}', 'version:2.14.1.chromium10')],
+        namespace='default',
+        fallback_slices=[
+            api.swarming.TaskSlice(
+                dimensions={'pool': 'Fuchsia', 'os': 'Ubuntu'},
+                expiration_secs=1800,
+                hard_timeout_secs=7200,
+            ),
+        ],
     )
 
     # Spawn the task request. This is equivalent to trigger.
@@ -99,12 +107,32 @@ def RunSteps(api, spawn_tasks):
     results[0].output
     # You can also grab the outputs of the Swarming task as a map.
     results[0].outputs
+    # You can grab the bot the task ran on, and when it was created and
+    # completed according to Swarming.
+    results[0].bot_id
+    results[0].created_ts
+    results[0].completed_ts
   except:
     pass
 
   # You can also wait on arbitrary tasks.
   api.swarming.collect(tasks=['398db31cc90be910', 'a9123129aaaaaa'], timeout='30m')
 
+  # You can also return as soon as any one of the tasks completes, and then
+  # cancel the ones which are still pending or running.
+  results = api.swarming.collect(
+      tasks=['398db31cc90be910', 'a9123129aaaaaa'], eager=True)
+  for result in results:
+    if not result.completed:
+      api.swarming.cancel(result.id, kill_running=True)
+
+  # You can also count the bots which match a set of dimensions, e.g. to
+  # avoid requesting more tasks than there are bots to run them.
+  counts = api.swarming.bot_counts({'pool': 'Fuchsia', 'os': 'Debian'})
+  assert counts.idle <= counts.total
+  # You can also get the IDs of the idle bots, e.g. to pin a task to one.
+  assert len(counts.idle_ids) == counts.idle
+
   # You can also run an arbitrary command.
   api.swarming('version')
 
@@ -145,3 +173,14 @@ def GenTests(api):
       'collect', api.swarming.collect(task_data=[api.swarming.task_data(
           output='hello', outputs=['out/hello.txt'])])) + api.properties(
               spawn_tasks=False)
+  yield api.test('eager_collect') + api.step_data(
+      'collect (3)', api.swarming.collect(task_data=[
+          api.swarming.task_data(id='398db31cc90be910',
+                                 state=api.swarming.TaskState.SUCCESS),
+          api.swarming.task_data(id='a9123129aaaaaa',
+                                 state=api.swarming.TaskState.RUNNING),
+          api.swarming.task_data(id='a9123129bbbbbb',
+                                 state=api.swarming.TaskState.PENDING)]))
+  yield api.test('bot_counts') + api.step_data(
+      'count bots os:Debian,pool:Fuchsia',
+      api.swarming.bots(idle=2, busy=3, dead=1, quarantined=1))
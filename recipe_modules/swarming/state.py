@@ -31,3 +31,7 @@ class TaskState(Enum):
   CANCELED = 7
   # The task ran but was manually killed via the 'cancel' API
   KILLED = 8
+  # The task is currently running. Only reported by an eager collect.
+  RUNNING = 9
+  # The task has not started running yet. Only reported by an eager collect.
+  PENDING = 10
@@ -178,6 +178,10 @@ class SwarmingTestApi(recipe_test_api.RecipeTestApi):
       raw_results['results']['state'] = 'CANCELED'
     elif state == TaskState.KILLED:
       raw_results['results']['state'] = 'KILLED'
+    elif state == TaskState.RUNNING:
+      raw_results['results']['state'] = 'RUNNING'
+    elif state == TaskState.PENDING:
+      raw_results['results']['state'] = 'PENDING'
 
     return raw_results
 
@@ -195,3 +199,27 @@ class SwarmingTestApi(recipe_test_api.RecipeTestApi):
     task_data = task_data or [self.task_data()]
     id_to_data = {datum['results']['task_id'] : datum for datum in task_data}
     return self.m.json.output(id_to_data)
+
+  def bots(self, idle=10, busy=0, dead=0, quarantined=0):
+    """Generates test step data for the swarming API bot_counts method.
+
+    Args:
+      idle (int): The number of mock bots which are ready for a task.
+      busy (int): The number of mock bots which are running a task.
+      dead (int): The number of mock bots which stopped responding.
+      quarantined (int): The number of mock bots which are quarantined.
+
+    Returns:
+      Step test data in the form of JSON output intended to mock a swarming API
+      bot_counts method call.
+    """
+    bots = []
+    for i in range(idle):
+      bots.append({'bot_id': 'idle-%d' % i})
+    for i in range(busy):
+      bots.append({'bot_id': 'busy-%d' % i, 'task_id': '%x' % (0x100 + i)})
+    for i in range(dead):
+      bots.append({'bot_id': 'dead-%d' % i, 'is_dead': True})
+    for i in range(quarantined):
+      bots.append({'bot_id': 'quarantined-%d' % i, 'quarantined': True})
+    return self.m.json.output(bots)
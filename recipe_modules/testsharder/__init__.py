@@ -1,5 +1,5 @@
 DEPS = [
-    'recipe_engine/cipd',
+    'cipd',
     'recipe_engine/context',
     'recipe_engine/json',
     'recipe_engine/path',
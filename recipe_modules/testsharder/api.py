@@ -92,17 +92,22 @@ class TestsharderApi(recipe_api.RecipeApi):
   The testsharder tool accepts a set of test specifications and produces
   a file containing shards of execution.
   """
+  Shard = Shard
+  Test = Test
+
   def __init__(self, *args, **kwargs):
     super(TestsharderApi, self).__init__(*args, **kwargs)
     self._testsharder_path = None
 
   def ensure_testsharder(self, version='latest'):
+    if self._testsharder_path:
+      return self._testsharder_path
+
     with self.m.step.nest('ensure_testsharder'):
       with self.m.context(infra_steps=True):
-        pkgs = self.m.cipd.EnsureFile()
-        pkgs.add_package('fuchsia/infra/testsharder/${platform}', version)
         cipd_dir = self.m.path['start_dir'].join('cipd', 'testsharder')
-        self.m.cipd.ensure(cipd_dir, pkgs)
+        self.m.cipd.ensure(
+            cipd_dir, {'fuchsia/infra/testsharder/${platform}': version})
         self._testsharder_path = cipd_dir.join('testsharder')
         return self._testsharder_path
 
@@ -144,3 +149,42 @@ class TestsharderApi(recipe_api.RecipeApi):
       cmd.extend(['-shard-prefix', shard_prefix])
     result = self.m.step(step_name, cmd).json.output
     return [Shard.from_json(shard) for shard in result['shards']]
+
+  def merge_shards(self, shards, max_shards):
+    """Merges shards of the same device type into fewer shards.
+
+    Tests are spread so that each merged shard gets a similar number of them,
+    and keep their relative order. A merged shard is named after the shards
+    which it merges, joined with '+'.
+
+    Args:
+      shards (seq[Shard]): The shards to merge, all of one device type.
+      max_shards (int): The maximum number of shards to return.
+
+    Returns:
+      A list of at most max_shards Shards.
+    """
+    assert max_shards >= 1
+    assert len(set(shard.device_type for shard in shards)) <= 1
+    if len(shards) <= max_shards:
+      return list(shards)
+
+    # Assign the largest shards first, each to the group which has the fewest
+    # tests so far.
+    groups = [[] for _ in range(max_shards)]
+    sizes = [0] * max_shards
+    by_size = sorted(
+        range(len(shards)), key=lambda i: len(shards[i].tests), reverse=True)
+    for i in by_size:
+      group = sizes.index(min(sizes))
+      groups[group].append(i)
+      sizes[group] += len(shards[i].tests)
+
+    merged = []
+    for group in sorted(sorted(g) for g in groups):
+      merged.append(Shard(
+          name='+'.join(shards[i].name for i in group),
+          tests=[test for i in group for test in shards[i].tests],
+          device_type=shards[group[0]].device_type,
+      ))
+    return merged
@@ -39,6 +39,18 @@ def RunSteps(api):
       shard_prefix='garnet',
   )
 
+  # Shards of one device type may be merged to fit the available bots.
+  qemu_shards = [
+      api.testsharder.Shard(
+          name='%04d' % i,
+          tests=[api.testsharder.Test(name='test%d' % i,
+                                      location='/path/to/test%d' % i)],
+          device_type='QEMU',
+      ) for i in range(5)
+  ]
+  assert len(api.testsharder.merge_shards(qemu_shards, 2)) == 2
+  assert len(api.testsharder.merge_shards(qemu_shards, 8)) == 5
+
 
 def GenTests(api):
   step_data = lambda name: api.testsharder.execute(
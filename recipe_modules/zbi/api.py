@@ -51,7 +51,9 @@ class ZbiApi(recipe_api.RecipeApi):
         input_image,
     ]
 
-    for dest in manifest:
+    # Add the entries in a fixed order, so that the same manifest always
+    # produces the same image.
+    for dest in sorted(manifest):
       cmd.extend(['-e', "%s=%s" % (dest, manifest[dest])])
 
     return self.m.step(step_name, cmd)
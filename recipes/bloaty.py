@@ -7,12 +7,12 @@ from recipe_engine.recipe_api import Property
 from recipe_engine import config
 
 DEPS = [
+    'infra/cipd',
     'infra/git',
     'infra/gitiles',
     'infra/go',
     'infra/goma',
     'infra/gsutil',
-    'recipe_engine/cipd',
     'recipe_engine/context',
     'recipe_engine/file',
     'recipe_engine/json',
@@ -100,12 +100,7 @@ def upload_package(api, pkg_name, pkg_file, pkg_dir, repository, revision):
       output_package=cipd_pkg_file,
   )
 
-  cipd_pins = api.cipd.search(pkg_name, 'git_revision:' + revision)
-  if cipd_pins:
-    api.step('Package is up-to-date', cmd=None)
-    return
-
-  cipd_pin = api.cipd.register(
+  step_result = api.cipd.register(
       package_name=pkg_name,
       package_path=cipd_pkg_file,
       refs=['latest'],
@@ -114,18 +109,23 @@ def upload_package(api, pkg_name, pkg_file, pkg_dir, repository, revision):
           'git_revision': revision,
       },
   )
+  instance_id = step_result.json.output['result']['instance_id']
 
   api.gsutil.upload(
       'fuchsia',
       cipd_pkg_file,
-      api.gsutil.join(pkg_name, cipd_pin.instance_id),
+      api.gsutil.join(pkg_name, instance_id),
       unauthenticated_url=True)
 
 
 def RunSteps(api, repository, branch, revision, platform):
+  api.gitiles.ensure_gitiles()
   api.goma.ensure_goma()
   api.gsutil.ensure_gsutil()
 
+  if not revision:
+    revision = api.gitiles.refs(repository).get(branch, None)
+
   # TODO: factor this out into a host_build recipe module.
   host_platform = '%s-%s' % (api.platform.name.replace('win', 'windows'), {
       'intel': {
@@ -139,25 +139,32 @@ def RunSteps(api, repository, branch, revision, platform):
   }[api.platform.arch][api.platform.bits])
   target_platform = platform or host_platform
 
+  # Skip the checkout and build altogether if this revision is published.
+  cipd_pkg_name = 'fuchsia/third_party/bloaty/' + target_platform
+  if api.cipd.published({cipd_pkg_name: 'git_revision:' + revision}):
+    api.step('Package is up-to-date', cmd=None)
+    return
+
   src_dir = api.path['start_dir'].join('bloaty_src')
   with api.context(infra_steps=True):
-    revision = api.git.checkout(
-        repository, src_dir, ref=revision, submodules=True)
+    api.git.checkout(
+        repository, src_dir, ref=revision, submodules=True, cache=True)
 
   build_dir = api.path['start_dir'].join('bloaty_build')
   api.file.ensure_directory('ensure build dir', build_dir)
 
   cipd_dir = api.path['start_dir'].join('cipd')
   with api.step.nest('ensure_packages'):
-    with api.context(infra_steps=True):
-      pkgs = api.cipd.EnsureFile()
-      pkgs.add_package('infra/cmake/${platform}', 'version:3.9.2')
-      pkgs.add_package('infra/ninja/${platform}', 'version:1.8.2')
-      pkgs.add_package('fuchsia/clang/${platform}', 'goma')
+    with api.context(infra_steps=True), api.cipd.preload():
+      api.cipd.ensure(cipd_dir, {
+          'infra/cmake/${platform}': 'version:3.9.2',
+          'infra/ninja/${platform}': 'version:1.8.2',
+          'fuchsia/clang/${platform}': 'goma',
+      })
       if target_platform.startswith('linux'):
-        pkgs.add_package('fuchsia/sysroot/%s' % target_platform, 'latest',
-                         'sysroot')
-      api.cipd.ensure(cipd_dir, pkgs)
+        api.cipd.ensure(cipd_dir.join('sysroot'), {
+            'fuchsia/sysroot/%s' % target_platform: 'latest',
+        })
 
   target = PLATFORM_TO_TRIPLE[target_platform]
 
@@ -167,7 +174,7 @@ def RunSteps(api, repository, branch, revision, platform):
       api.step('build', [cipd_dir.join('ninja'), '-j%d' % api.goma.jobs])
       api.step('test', [cipd_dir.join('ninja'), 'test'])
 
-  upload_package(api, "fuchsia/third_party/bloaty/" + target_platform,
+  upload_package(api, cipd_pkg_name,
                  build_dir.join('bloaty'), build_dir, repository, revision)
 
 
@@ -175,12 +182,19 @@ def GenTests(api):
   revision = '75b05681239cb309a23fcb4f8864f177e5aa62da'
   for platform in ['linux', 'mac']:
     yield (api.test(platform) + api.platform.name(platform) +
-           api.properties(platform=platform + '-amd64'))
+           api.properties(platform=platform + '-amd64') +
+           api.gitiles.refs('refs', ('refs/heads/master', revision)))
     yield (api.test(platform + '_new') + api.platform.name(platform) +
-           api.properties(platform=platform + '-amd64') + api.step_data(
-               'cipd search fuchsia/third_party/bloaty/' + platform + '-amd64 '
-               + 'git_revision:deadbeef',
-               api.cipd.example_search(
-                   'fuchsia/third_party/bloaty/' + platform + '-amd64 ', [])))
+           api.properties(platform=platform + '-amd64') +
+           api.gitiles.refs('refs', ('refs/heads/master', revision)) +
+           api.step_data(
+               'check published packages',
+               api.cipd.example_error(
+                   'no instance tagged git_revision:' + revision)))
   yield (api.test('linux_arm64') + api.platform.name('linux') +
-         api.properties(platform='linux-arm64'))
+         api.properties(platform='linux-arm64') +
+         api.gitiles.refs('refs', ('refs/heads/master', revision)) +
+         api.step_data(
+             'check published packages',
+             api.cipd.example_error(
+                 'no instance tagged git_revision:' + revision)))
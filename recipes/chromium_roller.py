@@ -300,7 +300,7 @@ def GenTests(api):
   ) + api.step_data(
       'read cipd.ensure',
       api.raw_io.output_text(ENSURE_FILE_TEST),
-  ) + api.step_data('check if done (0)', api.auto_roller.dry_run())
+  ) + api.step_data('wait for CQ', api.auto_roller.dry_run())
 
   yield api.test('no latest version match') + api.step_data(
       'cipd describe chromium/fuchsia/fidl',
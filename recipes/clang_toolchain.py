@@ -11,11 +11,11 @@ import re
 
 
 DEPS = [
+  'infra/cipd',
   'infra/git',
   'infra/gitiles',
   'infra/goma',
   'infra/gsutil',
-  'recipe_engine/cipd',
   'recipe_engine/context',
   'recipe_engine/file',
   'recipe_engine/json',
@@ -80,17 +80,28 @@ def RunSteps(api, repository, branch, revision, platform):
   }[api.platform.arch][api.platform.bits])
   target_platform = platform or host_platform
 
+  # Skip the checkout and build altogether if this revision is published.
+  cipd_pkg_name = 'fuchsia/clang/' + target_platform
+  if api.cipd.published({cipd_pkg_name: 'git_revision:' + revision}):
+    api.step('Package is up-to-date', cmd=None)
+    return
+
   with api.step.nest('ensure_packages'):
     with api.context(infra_steps=True):
       cipd_dir = api.path['start_dir'].join('cipd')
-      pkgs = api.cipd.EnsureFile()
-      pkgs.add_package('infra/cmake/${platform}', 'version:3.9.2')
-      pkgs.add_package('infra/ninja/${platform}', 'version:1.8.2')
-      pkgs.add_package('fuchsia/clang/${platform}', 'goma')
-      pkgs.add_package('fuchsia/sysroot/linux-amd64', 'latest', 'linux-amd64')
-      pkgs.add_package('fuchsia/sysroot/linux-arm64', 'latest', 'linux-arm64')
-      pkgs.add_package('fuchsia/sdk/${platform}', 'latest', 'sdk')
-      api.cipd.ensure(cipd_dir, pkgs)
+      with api.cipd.preload():
+        api.cipd.ensure(cipd_dir, {
+          'infra/cmake/${platform}': 'version:3.9.2',
+          'infra/ninja/${platform}': 'version:1.8.2',
+          'fuchsia/clang/${platform}': 'goma',
+        })
+        for sysroot_platform in ('linux-amd64', 'linux-arm64'):
+          api.cipd.ensure(cipd_dir.join(sysroot_platform), {
+            'fuchsia/sysroot/' + sysroot_platform: 'latest',
+          })
+        api.cipd.ensure(cipd_dir.join('sdk'), {
+          'fuchsia/sdk/${platform}': 'latest',
+        })
 
   staging_dir = api.path.mkdtemp('clang')
   pkg_name = 'clang-%s' % api.platform.name.replace('mac', 'darwin')
@@ -99,7 +110,8 @@ def RunSteps(api, repository, branch, revision, platform):
 
   with api.context(infra_steps=True):
     llvm_dir = api.path['start_dir'].join('llvm-project')
-    api.git.checkout(repository, llvm_dir, ref=revision, submodules=True)
+    api.git.checkout(repository, llvm_dir, ref=revision, submodules=True,
+                     cache=True)
 
   lib_install_dir = staging_dir.join('lib_install')
   api.file.ensure_directory('create lib_install_dir', lib_install_dir)
@@ -280,7 +292,6 @@ def RunSteps(api, repository, branch, revision, platform):
                         pkg_dir.join('lib', manifest_file),
                         manifest_format.format(arch=arch, clang_version=clang_version))
 
-  cipd_pkg_name = 'fuchsia/clang/' + target_platform
   pkg_def = api.cipd.PackageDefinition(
       package_name=cipd_pkg_name,
       package_root=pkg_dir,
@@ -295,12 +306,7 @@ def RunSteps(api, repository, branch, revision, platform):
       output_package=cipd_pkg_file,
   )
 
-  cipd_pins = api.cipd.search(cipd_pkg_name, 'git_revision:' + revision)
-  if cipd_pins:
-    api.step('Package is up-to-date', cmd=None)
-    return
-
-  cipd_pin = api.cipd.register(
+  step_result = api.cipd.register(
       package_name=cipd_pkg_name,
       package_path=cipd_pkg_file,
       refs=['latest'],
@@ -310,11 +316,12 @@ def RunSteps(api, repository, branch, revision, platform):
         'git_revision': revision,
       },
   )
+  instance_id = step_result.json.output['result']['instance_id']
 
   api.gsutil.upload(
       'fuchsia',
       cipd_pkg_file,
-      api.gsutil.join('clang', target_platform, cipd_pin.instance_id),
+      api.gsutil.join('clang', target_platform, instance_id),
       unauthenticated_url=True
   )
 
@@ -330,6 +337,6 @@ def GenTests(api):
            api.platform.name(platform) +
            api.properties(platform='%s-amd64' % platform) +
            api.gitiles.refs('refs', ('refs/heads/master', revision)) +
-           api.step_data('cipd search fuchsia/clang/' + platform + '-amd64 ' +
-                         'git_revision:' + revision,
-                         api.cipd.example_search('fuchsia/clang/' + platform + '-amd64 ', [])))
+           api.step_data('check published packages',
+                         api.cipd.example_error(
+                             'no instance tagged git_revision:' + revision)))
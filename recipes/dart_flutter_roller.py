@@ -45,31 +45,34 @@ COMMIT_SUBJECT = """\
 Test: CQ
 """
 
+# The most commits to list in a roll's commit message; any more are only
+# mentioned.
+MAX_COMMITS_IN_MESSAGE = 100
+
 LOG_FORMAT = """\
 {project} {old}..{new} ({count} commits)
 {commits}
 """
 
 
-def UpdateManifestProject(api, manifest, project_name, revision):
-  """Updates the revision for a project in a manifest.
+def UpdateManifestProject(api, manifest, projects, project_name, revision,
+                          checkout_path):
+  """Updates the revision for a project in a manifest, and checks it out.
 
   Args:
     api (RecipeApi): Recipe API object.
     manifest (Path): Path to the Jiri manifest to update.
+    projects (dict): The projects in the manifest, as read before any edits.
     project_name (str): Name of the project in the Jiri manifest to update.
     revision (str): SHA-1 hash representing the updated revision for
       project_name in the manifest.
+    checkout_path (Path): Where to check out the project at revision.
 
   Returns:
-    A formatted log string summarizing the updates as well as the project's
-    remote property.
+    A formatted log string summarizing the updates, or None if the project is
+    up-to-date.
   """
-  remote = api.jiri.read_manifest_element(
-      manifest=manifest,
-      element_type='project',
-      element_name=project_name,
-  ).get('remote')
+  remote = projects.get(project_name, {}).get('remote')
   changes = api.jiri.edit_manifest(
       manifest=manifest,
       projects=[(project_name, revision)],
@@ -80,23 +83,39 @@ def UpdateManifestProject(api, manifest, project_name, revision):
   )
   if len(changes['projects']) == 0:
     api.step.active_result.presentation.step_text = 'manifest up-to-date, nothing to roll'
-    return None, None
+    return None
   old_rev = changes['projects'][0]['old_revision']
   new_rev = changes['projects'][0]['new_revision']
-  log = api.gitiles.log(remote, '%s..%s' % (old_rev, new_rev), step_name='log %s' % project_name)
+  api.git.checkout(url=remote, path=checkout_path, ref=revision)
+  # Only a bounded number of commits is listed, but all of them are counted
+  # in the checkout, which has the history of the range.
+  log, truncated = api.gitiles.bounded_log(
+      remote,
+      '%s..%s' % (old_rev, new_rev),
+      limit=MAX_COMMITS_IN_MESSAGE,
+      step_name='log %s' % project_name)
+  count = len(log)
+  if truncated:
+    with api.context(cwd=checkout_path):
+      count = api.git.count_commits(
+          '%s..%s' % (old_rev, new_rev),
+          name='count commits %s' % project_name)
+  commits = [
+      '{commit} {subject}'.format(
+          commit=commit['id'][:7],
+          subject=commit['message'].splitlines()[0],
+      ) for commit in log
+  ]
+  if truncated:
+    commits.append('... and more commits')
   formatted_log = LOG_FORMAT.format(
       project=project_name,
       old=old_rev[:7],
       new=new_rev[:7],
-      count=len(log),
-      commits='\n'.join([
-          '{commit} {subject}'.format(
-              commit=commit['id'][:7],
-              subject=commit['message'].splitlines()[0],
-          ) for commit in log
-      ]),
+      count=count,
+      commits='\n'.join(commits),
   )
-  return formatted_log, remote
+  return formatted_log
 
 
 def ExtractDartVersionFromDEPS(api, deps_path):
@@ -176,27 +195,27 @@ def RunSteps(api, revision):
 
     updated_deps = OrderedDict()
 
+    # Both flutter projects are read at once, before the manifest is edited.
+    flutter_projects = api.jiri.read_manifest(flutter_manifest).projects
+
     # Set up a temporary sandbox directory to do the required manipulations to
     # roll flutter, flutter engine, and dart.
     with api.tempfile.temp_dir('sandbox-flutter-dart') as sandbox_dir:
       # Attempt to update the manifest with a new flutter revision.
-      flutter_log, flutter_remote = UpdateManifestProject(
+      flutter_path = sandbox_dir.join('flutter')
+      flutter_log = UpdateManifestProject(
           api=api,
           manifest=flutter_manifest,
+          projects=flutter_projects,
           project_name=FLUTTER_NAME,
           revision=revision,
+          checkout_path=flutter_path,
       )
       if not flutter_log:
         return
       updated_deps[FLUTTER_NAME] = flutter_log
 
       # Get the flutter/flutter dependency on flutter/engine.
-      flutter_path = sandbox_dir.join('flutter')
-      api.git.checkout(
-          url=flutter_remote,
-          path=flutter_path,
-          ref=revision,
-      )
       engine_revision = api.file.read_text(
           name='read flutter engine version',
           source=flutter_path.join('bin', 'internal', 'engine.version'),
@@ -204,11 +223,14 @@ def RunSteps(api, revision):
       ).strip()
 
       # Attempt to update the manifest with a new engine revision.
-      engine_log, engine_remote = UpdateManifestProject(
+      engine_path = sandbox_dir.join('engine')
+      engine_log = UpdateManifestProject(
           api=api,
           manifest=flutter_manifest,
+          projects=flutter_projects,
           project_name=ENGINE_NAME,
           revision=engine_revision,
+          checkout_path=engine_path,
       )
       if not engine_log:
         RollChanges(api, manifest_repo, updated_deps)
@@ -216,33 +238,22 @@ def RunSteps(api, revision):
       updated_deps[ENGINE_NAME] = engine_log
 
       # Get the flutter/engine dependency on Dart.
-      engine_path = sandbox_dir.join('engine')
-      api.git.checkout(
-          url=engine_remote,
-          path=engine_path,
-          ref=engine_revision,
-      )
       dart_revision = ExtractDartVersionFromDEPS(api, engine_path.join('DEPS'))
 
-      dart_log, dart_remote = UpdateManifestProject(
+      dart_path = sandbox_dir.join('dart')
+      dart_log = UpdateManifestProject(
           api=api,
           manifest=dart_manifest,
+          projects=api.jiri.read_manifest(dart_manifest).projects,
           project_name=DART_SDK_NAME,
           revision=dart_revision,
+          checkout_path=dart_path,
       )
       if not dart_log:
         RollChanges(api, manifest_repo, updated_deps)
         return
       updated_deps[DART_SDK_NAME] = dart_log
 
-      # Get dart/sdk.
-      dart_path = sandbox_dir.join('dart')
-      api.git.checkout(
-          url=dart_remote,
-          path=dart_path,
-          ref=dart_revision,
-      )
-
       # Update the package manifests.
       UpdatePkgManifest(api,
         dart_path=dart_path,
@@ -260,35 +271,25 @@ def RunSteps(api, revision):
 def GenTests(api):
   noop_edit = lambda name: api.step_data(name, api.json.output({'projects': []}))
 
-  flutter_check_data = api.jiri.read_manifest_element(
-      api=api,
-      manifest='manifest/flutter',
-      element_name=FLUTTER_NAME,
-      element_type='project',
-      test_output={
+  flutter_check_data = api.jiri.read_manifest('flutter', projects=[
+      {
+        'name': FLUTTER_NAME,
         'remote': 'https://fuchsia.googlesource.com/third_party/flutter',
-      })
-  flutter_log_data = api.gitiles.log('log %s' % FLUTTER_NAME, 'A')
-
-  engine_check_data = api.jiri.read_manifest_element(
-      api=api,
-      manifest='manifest/flutter',
-      element_name=ENGINE_NAME,
-      element_type='project',
-      test_output={
+      },
+      {
+        'name': ENGINE_NAME,
         'remote': 'https://fuchsia.googlesource.com/third_party/flutter',
-      })
-  engine_log_data = api.gitiles.log('log %s' % ENGINE_NAME, 'A')
-
-  dart_sdk_check_data = api.jiri.read_manifest_element(
-      api=api,
-      manifest='manifest/dart',
-      element_name=DART_SDK_NAME,
-      element_type='project',
-      test_output={
-        'remote': 'https://fuchsia.googlesource.com/third_party/dart',
-      })
-  dart_sdk_log_data = api.gitiles.log('log %s' % DART_SDK_NAME, 'A')
+      },
+  ])
+  flutter_log_data = api.gitiles.bounded_log('log %s' % FLUTTER_NAME, 'A')
+
+  engine_log_data = api.gitiles.bounded_log('log %s' % ENGINE_NAME, 'A')
+
+  dart_sdk_check_data = api.jiri.read_manifest('dart', projects=[{
+      'name': DART_SDK_NAME,
+      'remote': 'https://fuchsia.googlesource.com/third_party/dart',
+  }])
+  dart_sdk_log_data = api.gitiles.bounded_log('log %s' % DART_SDK_NAME, 'A')
 
   yield (api.test('noop roll') +
          api.properties(revision='abc123') +
@@ -298,27 +299,36 @@ def GenTests(api):
   yield (api.test('flutter/flutter only') +
          api.properties(revision='abc123') +
          flutter_check_data + flutter_log_data +
-         engine_check_data +
          noop_edit('jiri edit %s' % ENGINE_NAME) +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
 
   yield (api.test('flutter/flutter and flutter/engine') +
          api.properties(revision='abc123') +
          flutter_check_data + flutter_log_data +
-         engine_check_data + engine_log_data +
+         engine_log_data +
          dart_sdk_check_data +
          noop_edit('jiri edit %s' % DART_SDK_NAME) +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
 
   yield (api.test('cannot find dart version') +
          api.properties(revision='abc123') +
          flutter_check_data + flutter_log_data +
-         engine_check_data + engine_log_data +
+         engine_log_data +
          api.step_data('read DEPS file', api.raw_io.output_text('stuff')))
 
   yield (api.test('flutter/flutter, flutter/engine, and dart') +
          api.properties(revision='abc123') +
          flutter_check_data + flutter_log_data +
-         engine_check_data + engine_log_data +
+         engine_log_data +
          dart_sdk_check_data + dart_sdk_log_data +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
+
+  yield (api.test('flutter/flutter long log') +
+         api.properties(revision='abc123') +
+         flutter_check_data +
+         api.gitiles.bounded_log('log %s' % FLUTTER_NAME, 'A',
+                                 n=MAX_COMMITS_IN_MESSAGE + 5) +
+         api.step_data('count commits %s' % FLUTTER_NAME,
+                       api.raw_io.stream_output('105')) +
+         noop_edit('jiri edit %s' % ENGINE_NAME) +
+         api.step_data('wait for CQ', api.auto_roller.success()))
@@ -94,4 +94,4 @@ def GenTests(api):
                  'path': 'third_party/dart-pkg/pub',
              },
          ) +
-         api.step_data('check if done (0)', api.auto_roller.success()))
+         api.step_data('wait for CQ', api.auto_roller.success()))
@@ -125,7 +125,7 @@ def RunSteps(api, project, manifest, remote, packages, run_gndoc):
 
 
 def GenTests(api):
-  roller_success = api.step_data('check if done (0)', api.auto_roller.success())
+  roller_success = api.step_data('wait for CQ', api.auto_roller.success())
 
   def properties(project):
     return api.properties(
@@ -19,6 +19,7 @@ DEVICES = [
 ]
 
 DEPS = [
+    'infra/cipd',
     'infra/fuchsia',
     'infra/gsutil',
     'infra/hash',
@@ -26,7 +27,6 @@ DEPS = [
     'infra/tar',
     'infra/testsharder',
     'recipe_engine/buildbucket',
-    'recipe_engine/cipd',
     'recipe_engine/context',
     'recipe_engine/file',
     'recipe_engine/path',
@@ -46,6 +46,12 @@ PROPERTIES = {
         Property(kind=str, help='Remote manifest repository', default=None),
     'repo':
         Property(kind=str, help='Repo to checkout, build, and test', default=None),
+    'checkout_projects':
+        Property(
+            kind=List(basestring),
+            help='If set, only these Jiri projects and those containing the'
+            ' packages to build are checked out, rather than all of them',
+            default=[]),
 
     # Properties for checking out code from a snapshot.
     'checkout_snapshot':
@@ -137,6 +143,32 @@ PROPERTIES = {
             kind=bool,
             help='Whether to run tests as shards',
             default=False),
+    'qemu_shards_per_task':
+        Property(
+            kind=int,
+            help='Maximum number of QEMU shards to run concurrently in a single'
+            ' Swarming task. (Ignored unless test_in_shards is True)',
+            default=1),
+    'fail_fast':
+        Property(
+            kind=bool,
+            help='Whether to cancel the remaining test shards as soon as one'
+            ' fails. (Only honored in tryjobs when test_in_shards is True)',
+            default=False),
+    'hedge_percentile':
+        Property(
+            kind=int,
+            help='If set, launch a duplicate of any test shard still running'
+            ' past this percentile of the completed shards\' durations.'
+            ' (Ignored unless test_in_shards is True)',
+            default=None),
+    'kvm_expiration_secs':
+        Property(
+            kind=int,
+            help='If set, the number of seconds QEMU test shards wait for a bot'
+            ' with KVM before falling back to one without it.'
+            ' (Ignored unless test_in_shards is True)',
+            default=None),
       'gcs_bucket':
           Property(
               kind=str,
@@ -150,11 +182,13 @@ PROPERTIES = {
 }
 
 
-def RunSteps(api, project, manifest, remote, repo, checkout_snapshot, target,
-             build_type, packages, variants, gn_args, test_pool, run_tests,
-             runtests_args, run_host_tests, device_type, networking_for_tests,
-             pave, ninja_targets, test_timeout_secs, requires_secrets,
-             test_in_shards, boards, products, zircon_args, gcs_bucket,
+def RunSteps(api, project, manifest, remote, repo, checkout_projects,
+             checkout_snapshot, target, build_type, packages, variants,
+             gn_args, test_pool, run_tests, runtests_args, run_host_tests,
+             device_type, networking_for_tests, pave, ninja_targets,
+             test_timeout_secs, requires_secrets, test_in_shards,
+             qemu_shards_per_task, fail_fast, hedge_percentile,
+             kvm_expiration_secs, boards, products, zircon_args, gcs_bucket,
              upload_breakpad_symbols):
   tryjob = api.properties.get('tryjob')
   upload_results = not tryjob and gcs_bucket
@@ -181,6 +215,20 @@ def RunSteps(api, project, manifest, remote, repo, checkout_snapshot, target,
   if api.properties.get('tryjob'):
     assert len(build.input.gerrit_changes) == 1
 
+  json_validator_dir = api.path['start_dir'].join('cipd', 'json_validator')
+  with api.cipd.preload():
+    api.jiri.ensure_jiri()
+    with api.step.nest('ensure json validator'):
+      with api.context(infra_steps=True):
+        api.cipd.ensure(json_validator_dir, {
+            'fuchsia/tools/json_validator/${platform}': 'latest',
+        })
+    api.fuchsia.ensure_tools(
+        upload_results=upload_results,
+        run_tests=run_tests,
+        test_in_shards=test_in_shards,
+    )
+
   if checkout_snapshot:
     if api.properties.get('tryjob'):
       checkout = api.fuchsia.checkout_patched_snapshot(
@@ -195,20 +243,15 @@ def RunSteps(api, project, manifest, remote, repo, checkout_snapshot, target,
         manifest=manifest,
         remote=remote,
         project=project,
+        projects=checkout_projects or None,
+        packages=packages if checkout_projects else None,
     )
 
   if upload_results:
     checkout.upload_results(gcs_bucket)
 
   with api.step.nest('validate checkout'):
-    with api.step.nest('ensure json validator'):
-      with api.context(infra_steps=True):
-        cipd_dir = api.path['start_dir'].join('cipd', 'json_validator')
-        pkgs = api.cipd.EnsureFile()
-        pkgs.add_package('fuchsia/tools/json_validator/${platform}', 'latest')
-        api.cipd.ensure(cipd_dir, pkgs)
-
-    validator = cipd_dir.join('json_validator')
+    validator = json_validator_dir.join('json_validator')
 
     if repo:
       if repo.startswith('vendor/'):
@@ -273,6 +316,10 @@ def RunSteps(api, project, manifest, remote, repo, checkout_snapshot, target,
           test_pool=test_pool,
           build=build,
           timeout_secs=test_timeout_secs,
+          qemu_shards_per_task=qemu_shards_per_task,
+          fail_fast=bool(tryjob and fail_fast),
+          hedge_percentile=hedge_percentile,
+          kvm_expiration_secs=kvm_expiration_secs,
       )
     else:
       all_results = [api.fuchsia.test(
@@ -301,6 +348,12 @@ def GenTests(api):
   # Tests using the defaults provided by fuchsia.test().
   yield api.fuchsia.test('default', properties={})
   yield api.fuchsia.test('cq', tryjob=True, properties={})
+  yield api.fuchsia.test(
+      'sparse_checkout',
+      properties=dict(
+          checkout_projects=['build', 'zircon'],
+          packages=['garnet/packages/default'],
+      ))
 
   # Test cases for running tests.
   yield api.fuchsia.test('isolated_tests', properties=dict(run_tests=True))
@@ -3,7 +3,7 @@
 # found in the LICENSE file.
 """Recipe for rolling Fuchsia layers into upper layers."""
 
-from recipe_engine.config import Enum, Single
+from recipe_engine.config import Enum, List, Single
 from recipe_engine.recipe_api import Property, StepFailure
 
 from urlparse import urlparse
@@ -15,12 +15,14 @@ ROLL_TYPES = ['import', 'project']
 
 DEPS = [
     'infra/auto_roller',
+    'infra/git',
     'infra/gitiles',
     'infra/jiri',
     'recipe_engine/context',
     'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/properties',
+    'recipe_engine/raw_io',
     'recipe_engine/step',
 ]
 
@@ -43,6 +45,13 @@ PROPERTIES = {
         Property(
             kind=str,
             help='Name of the <project> or <import> to edit in $import_in'),
+    'batch_with':
+        Property(
+            kind=List(basestring),
+            help='Names of further <project>s or <import>s in $import_in to '
+            'roll to their latest revision in the same change as '
+            '$import_from; if the change fails CQ, the rolls are bisected',
+            default=[]),
     'revision':
         Property(kind=str, help='Revision', default=None),
     'dry_run':
@@ -53,6 +62,10 @@ PROPERTIES = {
             'Whether to dry-run the auto-roller (CQ+1 and abandon the change)'),
 }
 
+# The most commits to list in a roll's commit message; any more are only
+# mentioned.
+MAX_COMMITS_IN_MESSAGE = 100
+
 COMMIT_MESSAGE = """[roll] Roll {project} {old}..{new} ({count} commits)
 
 {commits}
@@ -68,15 +81,106 @@ def SsoToHttps(remote):
   # Note that url.path contains a leading '/'.
   return 'https://%s.googlesource.com%s' % (url.netloc, url.path)
 
+def EditManifest(api, import_in, roll_type, name, revision):
+  """Rolls a <project> or <import> in a manifest.
+
+  Args:
+    api (RecipeApi): Recipe API object.
+    import_in (str): Path to the manifest to edit, relative to the repository.
+    roll_type (str): The type of element to roll, one of ROLL_TYPES.
+    name (str): The name of the element to roll.
+    revision (str): The revision to roll to, or None for the latest one.
+
+  Returns:
+    The remote of the element and its old and new revisions, or None if the
+    element is up-to-date.
+  """
+  # Read the remote URL of the repo we're rolling from.
+  roll_from_repo = SsoToHttps(api.jiri.read_manifest_element(
+      manifest=import_in,
+      element_type=roll_type,
+      element_name=name,
+  ).get('remote'))
+
+  if not revision:
+    revision = api.gitiles.refs(roll_from_repo).get('refs/heads/master', None)
+
+  # Determine whether to update manifest imports or projects.
+  if roll_type == 'import':
+    updated_section = 'imports'
+    imports = [(name, revision)]
+    projects = None
+  elif roll_type == 'project':
+    updated_section = 'projects'
+    imports = None
+    projects = [(name, revision)]
+
+  changes = api.jiri.edit_manifest(
+      import_in, projects=projects, imports=imports,
+      name='jiri edit %s' % name)
+
+  if len(changes[updated_section]) == 0:
+    api.step.active_result.presentation.step_text = (
+        'manifest up-to-date, nothing to roll')
+    return None
+
+  # Fail if the remote URL is missing
+  if not roll_from_repo:
+    raise api.step.StepFailure('%s missing remote= attribute' % name)
+
+  return (roll_from_repo, changes[updated_section][0]['old_revision'],
+          changes[updated_section][0]['new_revision'])
+
+
+def RollMessage(api, name, remote, old_rev, new_rev, path):
+  """Returns the commit message for a roll, listing the commits it rolls.
+
+  Args:
+    api (RecipeApi): Recipe API object.
+    name (str): The name of the rolled element.
+    remote (str): The remote of the rolled element.
+    old_rev (str): The revision rolled from.
+    new_rev (str): The revision rolled to.
+    path (Path): The checkout of the rolled element, updated to new_rev.
+  """
+  # Only a bounded number of commits is listed, but all of them are counted
+  # in the checkout, which already has the history of the range.
+  log, truncated = api.gitiles.bounded_log(
+      remote,
+      '%s..%s' % (old_rev, new_rev),
+      limit=MAX_COMMITS_IN_MESSAGE,
+      step_name='log %s' % name)
+  count = len(log)
+  if truncated:
+    with api.context(cwd=path):
+      count = api.git.count_commits(
+          '%s..%s' % (old_rev, new_rev), name='count commits %s' % name)
+  commits = [
+      '{commit} {subject}'.format(
+          commit=commit['id'][:7],
+          subject=commit['message'].splitlines()[0],
+      ) for commit in log
+  ]
+  if truncated:
+    commits.append('... and more commits')
+  return COMMIT_MESSAGE.format(
+      project=name,
+      old=old_rev[:7],
+      new=new_rev[:7],
+      count=count,
+      commits='\n'.join(commits),
+  )
+
+
 # This recipe has two 'modes' of operation: production and dry-run. Which mode
 # of execution should be used is dictated by the 'dry_run' property.
 #
 # The purpose of dry-run mode is to test the auto-roller end-to-end. This is
 # useful because now we can have an auto-roller in staging, and we can block
 # updates behind 'dry_run' as a sort of feature gate. It is passed to
-# api.auto_roller.attempt_roll() which handles committing changes.
+# api.auto_roller.attempt_manifest_rolls() which handles committing changes.
 def RunSteps(api, project, manifest, remote, roll_type, import_in, import_from,
-             revision, dry_run):
+             batch_with, revision, dry_run):
   api.jiri.ensure_jiri()
   api.gitiles.ensure_gitiles()
 
@@ -87,75 +191,53 @@ def RunSteps(api, project, manifest, remote, roll_type, import_in, import_from,
 
     project_dir = api.path['start_dir'].join(*project.split('/'))
     with api.context(cwd=project_dir):
-      # Read the remote URL of the repo we're rolling from.
-      roll_from_repo = SsoToHttps(api.jiri.read_manifest_element(
-          manifest=import_in,
-          element_type=roll_type,
-          element_name=import_from,
-      ).get('remote'))
-
-      if not revision:
-        revision = api.gitiles.refs(roll_from_repo).get('refs/heads/master', None)
-
-      # Determine whether to update manifest imports or projects.
-      if roll_type == 'import':
-        updated_section = 'imports'
-        imports = [(import_from, revision)]
-        projects = None
-      elif roll_type == 'project':
-        updated_section = 'projects'
-        imports = None
-        projects = [(import_from, revision)]
-
-      changes = api.jiri.edit_manifest(
-          import_in, projects=projects, imports=imports)
-
-      if len(changes[updated_section]) == 0:
-        api.step.active_result.presentation.step_text = 'manifest up-to-date, nothing to roll'
+      edits = []
+      for name in [import_from] + list(batch_with):
+        edit = EditManifest(
+            api, import_in, roll_type, name,
+            revision=revision if name == import_from else None)
+        if edit:
+          edits.append((name, edit))
+      if not edits:
         return
-      old_rev = changes[updated_section][0]['old_revision']
-      new_rev = changes[updated_section][0]['new_revision']
 
-      # Fail if the remote URL is missing
-      if not roll_from_repo:
-        raise api.step.StepFailure('%s missing remote= attribute' % import_from)
-
-      # After rolling the commit, re-update and emit a source manifest.
+      # After rolling the commits, re-update and emit a source manifest.
       # Emitting a source manifest is necessary for luci-notify to be able to
       # pick up on a checkout diff, allowing it to notify the blamelist across
       # the whole checkout. Note that we need to say "local_manifest=True"
-      # because otherwise jiri won't use the pin we just updated in the jiri
-      # update, so the emitted source manifest won't contain the updated pin.
+      # because otherwise jiri won't use the pins we just updated in the jiri
+      # update, so the emitted source manifest won't contain the updated pins.
       #
-      # Note that local_manifest=True only works in this way if the pin we're
-      # updating is for the same manifest that we originally pulled from (i.e.
+      # Note that local_manifest=True only works in this way if the pins we're
+      # updating are for the same manifest that we originally pulled from (i.e.
       # the manifest property) since otherwise the manifest update  will just
       # get ignored and jiri will error (it will never overwrite a dirty
       # repository).
       api.jiri.update(run_hooks=False, local_manifest=True)
       api.jiri.emit_source_manifest()
 
-      # Get the commit history and generate a commit message.
-      log = api.gitiles.log(
-          roll_from_repo, '%s..%s' % (old_rev, new_rev), step_name='log')
-      message = COMMIT_MESSAGE.format(
-          project=import_from,
-          old=old_rev[:7],
-          new=new_rev[:7],
-          count=len(log),
-          commits='\n'.join([
-              '{commit} {subject}'.format(
-                  commit=commit['id'][:7],
-                  subject=commit['message'].splitlines()[0],
-              ) for commit in log
-          ]),
-      )
-
-    # Land the changes.
-    api.auto_roller.attempt_roll(
+    # Jiri checks out the repository of an <import> as a project of the same
+    # name, so the rolled commits can be counted there.
+    paths = {
+        p['name']: api.path.abs_to_path(p['path'])
+        for p in api.jiri.project([name for name, _ in edits]).json.output
+    }
+    rolls = []
+    for name, (remote, old_rev, new_rev) in edits:
+      rolls.append(api.auto_roller.ManifestRoll(
+          name=name,
+          manifest=import_in,
+          projects=[(name, new_rev)] if roll_type == 'project' else None,
+          imports=[(name, new_rev)] if roll_type == 'import' else None,
+          message=RollMessage(api, name, remote, old_rev, new_rev,
+                              paths[name]),
+      ))
+
+    # Land the changes in a single change, bisecting the rolls if it fails.
+    api.auto_roller.attempt_manifest_rolls(
         gerrit_project=project,
         repo_dir=project_dir,
-        commit_message=message,
+        rolls=rolls,
         dry_run=dry_run,
     )
 
@@ -163,8 +245,11 @@ def RunSteps(api, project, manifest, remote, roll_type, import_in, import_from,
 # yapf: disable
 def GenTests(api):
   # Mock step data intended to be substituted as the result of the first check
-  # during polling. It indicates a success, and should end polling.
-  success_step_data = api.step_data('check if done (0)', api.auto_roller.success())
+  # during polling of the change rolling the given names. It indicates a
+  # success, and should end polling.
+  def success_step_data(*names):
+    return api.step_data('roll %s.wait for CQ' % ', '.join(names),
+                         api.auto_roller.success())
 
   # Test when the incoming revision is missing.
   yield (api.test('missing_revision') +
@@ -181,7 +266,7 @@ def GenTests(api):
           test_output={'remote': 'https://fuchsia.googlesource.com/zircon'}) +
       api.gitiles.refs('refs', (
           'refs/heads/master', 'fc4dc762688d2263b254208f444f5c0a4b91bc07')) +
-      api.gitiles.log('log', 'A') + success_step_data +
+      api.gitiles.bounded_log('log zircon', 'A') + success_step_data('zircon') +
       api.jiri.read_manifest_element(api,
           manifest='manifest/garnet',
           element_name='zircon',
@@ -229,7 +314,7 @@ def GenTests(api):
                      roll_type='project',
                      import_from='cobalt',
                      revision='fc4dc762688d2263b254208f444f5c0a4b91bc07') +
-      api.gitiles.log('log', 'A') + success_step_data +
+      api.gitiles.bounded_log('log cobalt', 'A') + success_step_data('cobalt') +
       api.jiri.read_manifest_element(api,
           manifest='manifest/garnet',
           element_name='cobalt',
@@ -246,7 +331,25 @@ def GenTests(api):
                      import_from='zircon',
                      remote='https://fuchsia.googlesource.com/garnet',
                      revision='fc4dc762688d2263b254208f444f5c0a4b91bc07') +
-      api.gitiles.log('log', 'A') + success_step_data +
+      api.gitiles.bounded_log('log zircon', 'A') + success_step_data('zircon') +
+      api.jiri.read_manifest_element(api,
+          manifest='manifest/garnet',
+          element_name='zircon',
+          element_type='import',
+          test_output={'remote': 'https://fuchsia.googlesource.com/zircon'}))
+
+  # Test a roll of more commits than the commit message lists.
+  yield (api.test('zircon_long_log') +
+      api.properties(project='garnet',
+                     manifest='manifest/garnet',
+                     import_in='manifest/garnet',
+                     import_from='zircon',
+                     remote='https://fuchsia.googlesource.com/garnet',
+                     revision='fc4dc762688d2263b254208f444f5c0a4b91bc07') +
+      api.gitiles.bounded_log('log zircon', 'A', n=MAX_COMMITS_IN_MESSAGE + 5) +
+      api.step_data('count commits zircon',
+                    api.raw_io.stream_output('105')) +
+      success_step_data('zircon') +
       api.jiri.read_manifest_element(api,
           manifest='manifest/garnet',
           element_name='zircon',
@@ -261,7 +364,8 @@ def GenTests(api):
                      import_from='third_party/foo',
                      remote='https://fuchsia.googlesource.com/garnet',
                      revision='fc4dc762688d2263b254208f444f5c0a4b91bc07') +
-      api.gitiles.log('log', 'A') + success_step_data +
+      api.gitiles.bounded_log('log third_party/foo', 'A') +
+      success_step_data('third_party/foo') +
       api.jiri.read_manifest_element(api,
           manifest='manifest/garnet',
           element_name='third_party/foo',
@@ -281,7 +385,7 @@ def GenTests(api):
           element_name='zircon',
           element_type='import',
           test_output={'remote': 'https://fuchsia.googlesource.com/zircon'}) +
-      api.step_data('jiri edit', api.json.output({'imports': []})))
+      api.step_data('jiri edit zircon', api.json.output({'imports': []})))
 
   # Test a successful roll of garnet into peridot.
   yield (api.test('garnet') +
@@ -291,7 +395,7 @@ def GenTests(api):
                      import_from='garnet',
                      remote='https://fuchsia.googlesource.com/peridot',
                      revision='fc4dc762688d2263b254208f444f5c0a4b91bc07') +
-      api.gitiles.log('log', 'A') + success_step_data +
+      api.gitiles.bounded_log('log garnet', 'A') + success_step_data('garnet') +
       api.jiri.read_manifest_element(api,
           manifest='manifest/garnet',
           element_name='garnet',
@@ -306,13 +410,55 @@ def GenTests(api):
                      import_from='peridot',
                      remote='https://fuchsia.googlesource.com/topaz',
                      revision='fc4dc762688d2263b254208f444f5c0a4b91bc07') +
-      api.gitiles.log('log', 'A') + success_step_data +
+      api.gitiles.bounded_log('log peridot', 'A') +
+      success_step_data('peridot') +
       api.jiri.read_manifest_element(api,
           manifest='manifest/garnet',
           element_name='peridot',
           element_type='import',
           test_output={'remote': 'https://fuchsia.googlesource.com/peridot'}))
 
+  # Mock step data for rolling garnet and peridot into topaz in one change.
+  batch_step_data = (
+      api.properties(project='topaz',
+                     manifest='manifest/topaz',
+                     import_in='manifest/topaz',
+                     import_from='peridot',
+                     batch_with=['garnet'],
+                     remote='https://fuchsia.googlesource.com/topaz',
+                     revision='fc4dc762688d2263b254208f444f5c0a4b91bc07') +
+      api.jiri.read_manifest_element(api,
+          manifest='manifest/topaz',
+          element_name='peridot',
+          element_type='import',
+          test_output={'remote': 'https://fuchsia.googlesource.com/peridot'}) +
+      api.jiri.read_manifest_element(api,
+          manifest='manifest/topaz',
+          element_name='garnet',
+          element_type='import',
+          test_output={'remote': 'https://fuchsia.googlesource.com/garnet'}) +
+      api.gitiles.refs('refs', (
+          'refs/heads/master', 'a7d3f2c9ab8e4c1a6d3b5e7f9012345678abcdef')) +
+      api.gitiles.bounded_log('log peridot', 'A') +
+      api.gitiles.bounded_log('log garnet', 'B'))
+
+  # Test a successful roll of peridot and garnet into topaz in one change.
+  yield (api.test('batch') + batch_step_data +
+      success_step_data('peridot', 'garnet'))
+
+  # Test a roll of peridot and garnet which fails CQ, and is bisected until
+  # the roll which fails on its own is found.
+  yield (api.test('batch_bisect') + batch_step_data +
+      api.step_data('roll peridot, garnet.wait for CQ',
+                    api.auto_roller.failure()) +
+      success_step_data('peridot') +
+      api.step_data('roll garnet.wait for CQ', api.auto_roller.failure()))
+
+  # Test a batch in which only one of the rolls changes the manifest.
+  yield (api.test('batch_partial_noop') + batch_step_data +
+      api.step_data('jiri edit garnet', api.json.output({'imports': []})) +
+      success_step_data('peridot'))
+
   # Test a dry-run of the auto-roller for rolling zircon into garnet. We
   # substitute in mock data for the first check that the CQ dry-run completed by
   # unsetting the CQ label to indicate that the CQ dry-run finished.
@@ -324,8 +470,8 @@ def GenTests(api):
                      remote='https://fuchsia.googlesource.com/garnet',
                      revision='fc4dc762688d2263b254208f444f5c0a4b91bc07',
                      dry_run=True) +
-      api.gitiles.log('log', 'A') +
-      api.step_data('check if done (0)', api.auto_roller.dry_run()) +
+      api.gitiles.bounded_log('log zircon', 'A') +
+      api.step_data('roll zircon.wait for CQ', api.auto_roller.dry_run()) +
       api.jiri.read_manifest_element(api,
           manifest='manifest/garnet',
           element_name='zircon',
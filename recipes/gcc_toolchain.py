@@ -47,7 +47,7 @@ PROPERTIES = {
 # just updates a date stamp.  If that's the only change since the last
 # revision we built, this new revision is not worth building.
 def DoCheckout(api, url, checkout_dir, revision, last_revision, useless_file):
-  api.git.checkout(url, checkout_dir, revision)
+  api.git.checkout(url, checkout_dir, revision, cache=True)
   with api.context(cwd=checkout_dir):
     try:
       step = api.git(
@@ -78,8 +78,7 @@ def RunSteps(api, binutils_revision, gcc_revision):
   cipd_pkg_name = 'fuchsia/gcc/' + api.cipd.platform_suffix()
   cipd_git_revision = ','.join([gcc_revision, binutils_revision])
 
-  step = api.cipd.search(cipd_pkg_name, 'git_revision:' + cipd_git_revision)
-  if step.json.output['result']:
+  if api.cipd.published({cipd_pkg_name: 'git_revision:' + cipd_git_revision}):
     api.step('Package is up-to-date', cmd=None)
     return
 
@@ -319,9 +318,10 @@ def GenTests(api):
                             (BINUTILS_REF, binutils_revision)) +
            api.gitiles.refs('gcc refs',
                             (GCC_REF, gcc_revision)) +
-           api.step_data('cipd search fuchsia/gcc/' + platform + '-amd64 ' +
-                         'git_revision:' + cipd_revision,
-                         api.json.output({'result': []})) +
+           api.step_data('check published packages',
+                         api.cipd.example_error(
+                             'no instance tagged git_revision:' +
+                             cipd_revision)) +
            api.step_data('check for changes other than bfd/version.h',
                          api.raw_io.stream_output('bfd/version.h\nothers\n',
                                                   name='changed files')) +
@@ -337,9 +337,10 @@ def GenTests(api):
                             (BINUTILS_REF, binutils_revision)) +
            api.gitiles.refs('gcc refs',
                             (GCC_REF, gcc_revision)) +
-           api.step_data('cipd search fuchsia/gcc/' + platform + '-amd64 ' +
-                         'git_revision:' + cipd_revision,
-                         api.json.output({'result': []})) +
+           api.step_data('check published packages',
+                         api.cipd.example_error(
+                             'no instance tagged git_revision:' +
+                             cipd_revision)) +
            api.step_data('check for changes other than bfd/version.h',
                          api.raw_io.stream_output('bfd/version.h\nothers\n',
                                                   name='changed files')) +
@@ -353,9 +354,10 @@ def GenTests(api):
                             (BINUTILS_REF, binutils_revision)) +
            api.gitiles.refs('gcc refs',
                             (GCC_REF, gcc_revision)) +
-           api.step_data('cipd search fuchsia/gcc/' + platform + '-amd64 ' +
-                         'git_revision:' + cipd_revision,
-                         api.json.output({'result': []})) +
+           api.step_data('check published packages',
+                         api.cipd.example_error(
+                             'no instance tagged git_revision:' +
+                             cipd_revision)) +
            api.step_data('check for changes other than bfd/version.h',
                          api.raw_io.stream_output('bfd/version.h\nothers\n',
                                                   name='changed files')) +
@@ -369,9 +371,10 @@ def GenTests(api):
                             (BINUTILS_REF, binutils_revision)) +
            api.gitiles.refs('gcc refs',
                             (GCC_REF, gcc_revision)) +
-           api.step_data('cipd search fuchsia/gcc/' + platform + '-amd64 ' +
-                         'git_revision:' + cipd_revision,
-                         api.json.output({'result': []})) +
+           api.step_data('check published packages',
+                         api.cipd.example_error(
+                             'no instance tagged git_revision:' +
+                             cipd_revision)) +
            api.step_data('check for changes other than bfd/version.h',
                          api.raw_io.stream_output('bfd/version.h\n',
                                                   name='changed files')) +
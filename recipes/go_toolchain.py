@@ -9,11 +9,11 @@ from recipe_engine.recipe_api import Property
 
 
 DEPS = [
+  'infra/cipd',
   'infra/git',
   'infra/gitiles',
   'infra/go',
   'infra/gsutil',
-  'recipe_engine/cipd',
   'recipe_engine/context',
   'recipe_engine/file',
   'recipe_engine/json',
@@ -58,9 +58,15 @@ def RunSteps(api, repository, branch, revision, platform):
   }[api.platform.arch][api.platform.bits])
   target_platform = platform or host_platform
 
+  # Skip the checkout and build altogether if this revision is published.
+  cipd_pkg_name = 'fuchsia/go/' + target_platform
+  if api.cipd.published({cipd_pkg_name: 'git_revision:' + revision}):
+    api.step('Package is up-to-date', cmd=None)
+    return
+
   with api.context(infra_steps=True):
     go_dir = api.path['start_dir'].join('go')
-    api.git.checkout(repository, go_dir, revision)
+    api.git.checkout(repository, go_dir, revision, cache=True)
 
   cipd_os, cipd_cpu = target_platform.split('-')
   goos = cipd_os.replace('mac', 'darwin')
@@ -75,7 +81,6 @@ def RunSteps(api, repository, branch, revision, platform):
                                   test_data='go1.8')
   assert go_version, 'Cannot determine Go version'
 
-  cipd_pkg_name = 'fuchsia/go/' + target_platform
   pkg_def = api.cipd.PackageDefinition(
       package_name=cipd_pkg_name,
       package_root=go_dir,
@@ -90,12 +95,7 @@ def RunSteps(api, repository, branch, revision, platform):
       output_package=cipd_pkg_file,
   )
 
-  cipd_pins = api.cipd.search(cipd_pkg_name, 'git_revision:' + revision)
-  if cipd_pins:
-    api.step('Package is up-to-date', cmd=None)
-    return
-
-  cipd_pin = api.cipd.register(
+  step_result = api.cipd.register(
       package_name=cipd_pkg_name,
       package_path=cipd_pkg_file,
       refs=['latest'],
@@ -105,11 +105,12 @@ def RunSteps(api, repository, branch, revision, platform):
         'git_revision': revision,
       },
   )
+  instance_id = step_result.json.output['result']['instance_id']
 
   api.gsutil.upload(
       'fuchsia',
       cipd_pkg_file,
-      api.gsutil.join('go', target_platform, cipd_pin.instance_id),
+      api.gsutil.join('go', target_platform, instance_id),
       unauthenticated_url=True
   )
 
@@ -123,6 +124,6 @@ def GenTests(api):
     yield (api.test(platform + '_new') +
            api.platform.name(platform) +
            api.gitiles.refs('refs', ('refs/heads/master', go_rev)) +
-           api.step_data('cipd search fuchsia/go/%s-amd64 git_revision:%s' %
-                         (platform, go_rev),
-                         api.cipd.example_search('fuchsia/go/%s-amd64' % platform, [])))
+           api.step_data('check published packages',
+                         api.cipd.example_error(
+                             'no instance tagged git_revision:' + go_rev)))
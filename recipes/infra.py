@@ -90,8 +90,9 @@ def UploadPackage(api, bin_name, bin_dir, revision, remote, platform):
 
 
 def RunSteps(api, project, manifest, remote, packages):
-  api.jiri.ensure_jiri()
-  api.go.ensure_go()
+  with api.cipd.preload():
+    api.jiri.ensure_jiri()
+    api.go.ensure_go()
 
   gopath = api.path['start_dir'].join('go')
 
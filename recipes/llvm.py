@@ -9,12 +9,12 @@ from recipe_engine.recipe_api import Property
 import re
 
 DEPS = [
+    'infra/cipd',
     'infra/git',
     'infra/gitiles',
     'infra/goma',
     'infra/gsutil',
     'infra/hash',
-    'recipe_engine/cipd',
     'recipe_engine/context',
     'recipe_engine/file',
     'recipe_engine/json',
@@ -75,19 +75,30 @@ def RunSteps(api, repository, branch, revision, platform):
   }[api.platform.arch][api.platform.bits])
   platform = platform or host_platform
 
+  # Skip the checkout and build altogether if this revision is published.
+  cipd_pkg_name = 'fuchsia/lib/llvm/%s' % platform
+  if api.cipd.published({cipd_pkg_name: 'git_revision:' + revision}):
+    api.step('Package is up-to-date', cmd=None)
+    return
+
   with api.step.nest('ensure_packages'):
     with api.context(infra_steps=True):
       cipd_dir = api.path['start_dir'].join('cipd')
       # TODO: deduplicate this and the clang toolchain recipe
-      pkgs = api.cipd.EnsureFile()
-      pkgs.add_package('infra/cmake/${platform}', 'version:3.9.2')
-      pkgs.add_package('infra/ninja/${platform}', 'version:1.8.2')
-      pkgs.add_package('fuchsia/clang/${platform}', 'goma')
-      if platform.startswith('linux'):
-        pkgs.add_package('fuchsia/sysroot/%s' % platform, 'latest', 'sysroot')
-      if platform.startswith('fuchsia'):
-        pkgs.add_package('fuchsia/sdk/${platform}', 'latest', 'sdk')
-      api.cipd.ensure(cipd_dir, pkgs)
+      with api.cipd.preload():
+        api.cipd.ensure(cipd_dir, {
+            'infra/cmake/${platform}': 'version:3.9.2',
+            'infra/ninja/${platform}': 'version:1.8.2',
+            'fuchsia/clang/${platform}': 'goma',
+        })
+        if platform.startswith('linux'):
+          api.cipd.ensure(cipd_dir.join('sysroot'), {
+              'fuchsia/sysroot/%s' % platform: 'latest',
+          })
+        if platform.startswith('fuchsia'):
+          api.cipd.ensure(cipd_dir.join('sdk'), {
+              'fuchsia/sdk/${platform}': 'latest',
+          })
 
   staging_dir = api.path.mkdtemp('llvm')
   pkg_dir = staging_dir.join('root')
@@ -95,7 +106,8 @@ def RunSteps(api, repository, branch, revision, platform):
 
   with api.context(infra_steps=True):
     llvm_dir = api.path['start_dir'].join('llvm-project')
-    api.git.checkout(repository, llvm_dir, ref=revision, submodules=True)
+    api.git.checkout(repository, llvm_dir, ref=revision, submodules=True,
+                     cache=True)
 
   # build llvm
   with api.goma.build_with_goma():
@@ -214,7 +226,6 @@ def RunSteps(api, repository, branch, revision, platform):
   assert m, 'Cannot determine LLVM version'
   llvm_version = m.group(1)
 
-  cipd_pkg_name = 'fuchsia/lib/llvm/%s' % platform
   pkg_def = api.cipd.PackageDefinition(
       package_name=cipd_pkg_name, package_root=pkg_dir, install_mode='copy')
   pkg_def.add_dir(pkg_dir)
@@ -227,12 +238,7 @@ def RunSteps(api, repository, branch, revision, platform):
       output_package=cipd_pkg_file,
   )
 
-  cipd_pins = api.cipd.search(cipd_pkg_name, 'git_revision:' + revision)
-  if cipd_pins:
-    api.step('Package is up-to-date', cmd=None)
-    return
-
-  cipd_pin = api.cipd.register(
+  step_result = api.cipd.register(
       package_name=cipd_pkg_name,
       package_path=cipd_pkg_file,
       refs=['latest'],
@@ -242,11 +248,12 @@ def RunSteps(api, repository, branch, revision, platform):
           'git_revision': revision,
       },
   )
+  instance_id = step_result.json.output['result']['instance_id']
 
   api.gsutil.upload(
       'fuchsia',
       cipd_pkg_file,
-      api.gsutil.join('lib', 'llvm', platform, cipd_pin.instance_id),
+      api.gsutil.join('lib', 'llvm', platform, instance_id),
       unauthenticated_url=True)
 
 
@@ -259,7 +266,6 @@ def GenTests(api):
     yield (api.test(platform.replace('-', '_') + '_new_revision') +
            api.properties(platform=platform) + api.gitiles.refs(
                'refs', ('refs/heads/master', revision)) + api.step_data(
-                   'cipd search fuchsia/lib/llvm/%s ' % platform +
-                   'git_revision:' + revision, api.json.output({
-                       'result': []
-                   })))
+                   'check published packages',
+                   api.cipd.example_error(
+                       'no instance tagged git_revision:' + revision)))
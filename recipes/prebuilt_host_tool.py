@@ -36,6 +36,12 @@ PROPERTIES = {
         Property(kind=str, help='Jiri remote manifest project', default=None),
     'remote':
         Property(kind=str, help='Remote manifest repository'),
+    'relevant_projects':
+        Property(
+            kind=List(basestring),
+            help='Jiri projects the tools depend on; if set, the build ends '
+            'early when none of them changed',
+            default=None),
 }
 
 
@@ -94,13 +100,13 @@ def GetBinPathComponents(build_dir, ninja_target):
 
 
 def RunSteps(api, cipd_pkg_prefix, manifest, ninja_targets, packages,
-             project, remote):
+             project, remote, relevant_projects):
 
   with api.context(infra_steps=True):
     assert manifest
     assert remote
     build = api.buildbucket.build
-    api.fuchsia.checkout(
+    checkout = api.fuchsia.checkout(
         manifest=manifest,
         remote=remote,
         project=project,
@@ -109,6 +115,10 @@ def RunSteps(api, cipd_pkg_prefix, manifest, ninja_targets, packages,
     revision = str(build.input.gitiles_commit.id)
     assert revision
 
+    if relevant_projects and not api.fuchsia.has_relevant_changes(
+        checkout, relevant_projects):
+      return
+
   # TODO(IN-580): Extract ninja build functionality into its own recipe_module
   build = api.fuchsia.build(
       target='x64',
@@ -164,3 +174,29 @@ def GenTests(api):
       project='build',
       remote='https://fuchsia.googlesource.com/build',
   )
+  yield api.test('relevant_change') + ci_build + api.properties(
+      cipd_pkg_prefix='fuchsia/tools',
+      manifest='manifest/build',
+      ninja_targets=['tools/json_validator'],
+      packages=['build/packages/json_validator'],
+      project='build',
+      remote='https://fuchsia.googlesource.com/build',
+      relevant_projects=['build', 'manifest'],
+  ) + api.jiri.read_manifest(
+      'previous.snapshot',
+      parent_step='check for relevant changes',
+  ) + api.step_data(
+      'cipd search fuchsia/tools/json_validator/${platform} git_revision:%s' % revision,
+      api.json.output({
+          'result': []
+      }),
+  )
+  yield api.test('nothing_relevant_changed') + ci_build + api.properties(
+      cipd_pkg_prefix='fuchsia/tools',
+      manifest='manifest/build',
+      ninja_targets=['tools/json_validator'],
+      packages=['build/packages/json_validator'],
+      project='build',
+      remote='https://fuchsia.googlesource.com/build',
+      relevant_projects=['build'],
+  )
@@ -9,11 +9,11 @@ from recipe_engine.recipe_api import Property
 
 
 DEPS = [
+  'infra/cipd',
   'infra/git',
   'infra/gitiles',
   'infra/goma',
   'infra/gsutil',
-  'recipe_engine/cipd',
   'recipe_engine/context',
   'recipe_engine/json',
   'recipe_engine/file',
@@ -128,12 +128,7 @@ def upload_package(api, pkg_name, pkg_dir, repository, revision):
       output_package=cipd_pkg_file,
   )
 
-  cipd_pins = api.cipd.search(cipd_pkg_name, 'git_revision:' + revision)
-  if cipd_pins:
-    api.step('Package is up-to-date', cmd=None)
-    return
-
-  cipd_pin = api.cipd.register(
+  step_result = api.cipd.register(
       package_name=cipd_pkg_name,
       package_path=cipd_pkg_file,
       refs=['latest'],
@@ -142,11 +137,12 @@ def upload_package(api, pkg_name, pkg_dir, repository, revision):
         'git_revision': revision,
       },
   )
+  instance_id = step_result.json.output['result']['instance_id']
 
   api.gsutil.upload(
       'fuchsia',
       cipd_pkg_file,
-      api.gsutil.join(pkg_name, cipd_pin.instance_id),
+      api.gsutil.join(pkg_name, instance_id),
       unauthenticated_url=True
   )
 
@@ -288,10 +284,10 @@ def build_glib(api, cipd_dir, pkg_dir, platform, host):
     api.step('install', ['make', 'install', 'DESTDIR=%s' % pkg_dir])
 
 
-def build_qemu(api, cipd_dir, pkg_dir, platform, host):
+def build_qemu(api, cipd_dir, pkg_dir, platform, host, repository, revision):
   src_dir = api.path.mkdtemp('qemu_src')
-  repository = 'https://fuchsia.googlesource.com/third_party/qemu'
-  revision = api.git.checkout(repository, src_dir, submodules=True)
+  api.git.checkout(repository, src_dir, ref=revision, submodules=True,
+                   cache=True)
   build_dir = api.path.mkdtemp('qemu_build')
   install_dir = api.path.mkdtemp('qemu_install')
 
@@ -401,16 +397,25 @@ def RunSteps(api, repository, branch, revision, platform):
   }[api.platform.arch][api.platform.bits])
   target_platform = platform or host_platform
 
+  # Skip the checkouts and builds altogether if this revision is published.
+  cipd_pkg_name = 'fuchsia/third_party/qemu/' + target_platform
+  if api.cipd.published({cipd_pkg_name: 'git_revision:' + revision}):
+    api.step('Package is up-to-date', cmd=None)
+    return
+
   with api.step.nest('ensure_packages'):
     with api.context(infra_steps=True):
       cipd_dir = api.path['start_dir'].join('cipd')
-      pkgs = api.cipd.EnsureFile()
-      pkgs.add_package('infra/cmake/${platform}', 'version:3.9.2')
-      pkgs.add_package('infra/ninja/${platform}', 'version:1.8.2')
-      pkgs.add_package('fuchsia/clang/${platform}', 'goma')
-      if target_platform.startswith('linux'):
-        pkgs.add_package('fuchsia/sysroot/%s' % target_platform, 'latest', 'sysroot')
-      api.cipd.ensure(cipd_dir, pkgs)
+      with api.cipd.preload():
+        api.cipd.ensure(cipd_dir, {
+          'infra/cmake/${platform}': 'version:3.9.2',
+          'infra/ninja/${platform}': 'version:1.8.2',
+          'fuchsia/clang/${platform}': 'goma',
+        })
+        if target_platform.startswith('linux'):
+          api.cipd.ensure(cipd_dir.join('sysroot'), {
+            'fuchsia/sysroot/%s' % target_platform: 'latest',
+          })
 
   pkg_dir = api.path['start_dir'].join('pkgconfig')
   api.file.ensure_directory('create pkg dir', pkg_dir)
@@ -446,7 +451,8 @@ def RunSteps(api, repository, branch, revision, platform):
       build_glib(api, cipd_dir, pkg_dir, target_platform, host_platform)
 
     with api.step.nest('qemu'):
-      build_qemu(api, cipd_dir, pkg_dir, target_platform, host_platform)
+      build_qemu(api, cipd_dir, pkg_dir, target_platform, host_platform,
+                 repository, revision)
 
 
 def GenTests(api):
@@ -458,8 +464,7 @@ def GenTests(api):
            api.gitiles.refs('refs', ('refs/heads/master', revision)) +
            api.properties(manifest='qemu',
                           remote='https://fuchsia.googlesource.com/manifest',
-                          platform=platform + '-amd64') +
-           api.step_data('qemu.version', api.raw_io.stream_output(version)))
+                          platform=platform + '-amd64'))
     yield (api.test(platform + '_new') +
            api.platform.name(platform) +
            api.gitiles.refs('refs', ('refs/heads/master', revision)) +
@@ -467,13 +472,16 @@ def GenTests(api):
                           remote='https://fuchsia.googlesource.com/manifest',
                           platform=platform + '-amd64') +
            api.step_data('qemu.version', api.raw_io.stream_output(version)) +
-           api.step_data('qemu.cipd search fuchsia/third_party/qemu/' + platform + '-amd64 ' +
-                         'git_revision:deadbeef',
-                         api.cipd.example_search('fuchsia/qemu/' + platform + '-amd64 ', [])))
+           api.step_data('check published packages',
+                         api.cipd.example_error(
+                             'no instance tagged git_revision:' + revision)))
   yield (api.test('linux_arm64') +
          api.platform.name('linux') +
          api.gitiles.refs('refs', ('refs/heads/master', revision)) +
          api.properties(manifest='qemu',
                         remote='https://fuchsia.googlesource.com/manifest',
                         platform='linux-arm64') +
-         api.step_data('qemu.version', api.raw_io.stream_output(version)))
+         api.step_data('qemu.version', api.raw_io.stream_output(version)) +
+         api.step_data('check published packages',
+                       api.cipd.example_error(
+                           'no instance tagged git_revision:' + revision)))
@@ -146,7 +146,7 @@ def GenTests(api):
       cherry_picks=['topaz/fc4dc762688d2263b254208f444f5c0a4b91bc07'],
       pins=[],
       remote="https://fuchsia.googlesource.com/releases",
-      project="releases") + api.step_data('check if done (0)',
+      project="releases") + api.step_data('wait for CQ',
                                           api.auto_roller.success())
 
   yield api.test('one roll') + api.properties(
@@ -155,7 +155,7 @@ def GenTests(api):
       cherry_picks=[],
       pins=['topaz/fc4dc762688d2263b254208f444f5c0a4b91bc07'],
       remote="https://fuchsia.googlesource.com/releases",
-      project="releases") + api.step_data('check if done (0)',
+      project="releases") + api.step_data('wait for CQ',
                                           api.auto_roller.success())
 
   yield api.test('no cherrypick') + api.properties(
@@ -173,5 +173,5 @@ def GenTests(api):
       pins=[],
       remote="https://fuchsia.googlesource.com/releases",
       project="releases") + api.step_data(
-          'check if done (0)', api.auto_roller.success()) + api.path.exists(
+          'wait for CQ', api.auto_roller.success()) + api.path.exists(
               api.path['start_dir'].join('releases', 'cherrypick.json'))
@@ -132,7 +132,7 @@ def RunSteps(api, url, ref, revision):
 
   with api.context(infra_steps=True):
     rust_dir = api.path['start_dir'].join('rust')
-    api.git.checkout(url, rust_dir, ref=revision, recursive=True)
+    api.git.checkout(url, rust_dir, ref=revision, recursive=True, cache=True)
 
   # build rust
   staging_dir = api.path.mkdtemp('rust')
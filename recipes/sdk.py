@@ -5,7 +5,7 @@
 
 from contextlib import contextmanager
 
-from recipe_engine.config import Enum
+from recipe_engine.config import Enum, List
 from recipe_engine.recipe_api import Property
 
 import collections
@@ -43,18 +43,26 @@ PROPERTIES = {
         Property(kind=str, help='Remote manifest repository'),
     'repo':
         Property(kind=Enum(*REPOS), help='Repo to checkout, build', default=None),
+    'relevant_projects':
+        Property(kind=List(basestring),
+                 help='Jiri projects the SDK depends on; if set, the build '
+                 'ends early when none of them changed',
+                 default=None),
 }
 
-def RunSteps(api, project, manifest, remote, repo):
+def RunSteps(api, project, manifest, remote, repo, relevant_projects):
   api.go.ensure_go()
   api.gsutil.ensure_gsutil()
 
   build = api.buildbucket.build
-  api.fuchsia.checkout(
+  checkout = api.fuchsia.checkout(
       build=build,
       manifest=manifest,
       remote=remote,
       project=project)
+  if relevant_projects and not api.fuchsia.has_relevant_changes(
+      checkout, relevant_projects):
+    return
 
   revision = build.input.gitiles_commit.id
   global_integration = 'global' in build.builder.bucket
@@ -307,6 +315,12 @@ def GenTests(api):
                    api.json.output({'result': []}))
 
   )
+  yield (api.test('topaz_no_previous_snapshot') +
+      topaz_local_ci +
+      api.properties(relevant_projects=['topaz']) +
+      api.step_data('check for relevant changes.fetch previous snapshot',
+                    retcode=1)
+  )
   yield (api.test('cq') +
       api.buildbucket.try_build(
         git_repo="https://fuchsia.googlesource.com/topaz",
@@ -45,12 +45,13 @@ GO_OS_ARCH = (
 )
 
 
-def upload_package(api, name, platform, staging_dir, revision, remote):
+def package_definition(api, name, platform, staging_dir, revision):
+  """Returns the definition of a tool's package unless it is up-to-date."""
   cipd_pkg_name = 'fuchsia/tools/%s/%s' % (name, platform)
-  api.cipd.search(cipd_pkg_name, 'git_revision:' + revision)
-  if api.step.active_result.json.output['result']:
+  step = api.cipd.search(cipd_pkg_name, 'git_revision:' + revision)
+  if step.json.output['result']:
     api.step('Package is up-to-date', cmd=None)
-    return
+    return None
 
   pkg_def = api.cipd.PackageDefinition(
       package_name=cipd_pkg_name,
@@ -59,37 +60,46 @@ def upload_package(api, name, platform, staging_dir, revision, remote):
   )
   pkg_def.add_file(staging_dir.join(name))
   pkg_def.add_version_file('.versions/%s.cipd_version' % name)
+  return pkg_def
 
-  cipd_pkg_file = api.path['cleanup'].join('%s.cipd' % name)
-  api.cipd.build_from_pkg(
-      pkg_def=pkg_def,
-      output_package=cipd_pkg_file,
-  )
-  step_result = api.cipd.register(
-      package_name=cipd_pkg_name,
-      package_path=cipd_pkg_file,
+
+def upload_packages(api, pkg_defs, revision, remote):
+  # Build and register all packages at once, and mirror them all to GCS at
+  # tools/<name>/<host platform>/<instance ID>, where they have always been.
+  mirror_dir = api.path.mkdtemp('mirror')
+  mirror_subdirs = [
+      'tools/%s/%s' % (pkg_def.package_name.split('/')[-2],
+                       api.cipd.platform_suffix())
+      for pkg_def in pkg_defs
+  ]
+  pins = api.cipd.publish_many(
+      'publish packages',
+      pkg_defs,
       refs=['latest'],
       tags={
           'git_repository': remote,
           'git_revision': revision,
       },
+      mirror_dir=mirror_dir,
+      mirror_subdirs=mirror_subdirs,
   )
-
-  api.gsutil.upload(
-      'fuchsia',
-      cipd_pkg_file,
-      api.gsutil.join('tools', name,
-                      api.cipd.platform_suffix(),
-                      step_result.json.output['result']['instance_id']),
-      unauthenticated_url=True,
+  step_result = api.gsutil(
+      'rsync', '-r', mirror_dir, 'gs://fuchsia',
+      name='mirror packages',
+      multithreaded=True,
       ok_ret=(0, 1),
   )
+  for pin, mirror_subdir in zip(pins, mirror_subdirs):
+    step_result.presentation.links[pin['package']] = (
+        'https://storage.googleapis.com/fuchsia/%s/%s' % (
+            mirror_subdir, pin['instance_id']))
 
 
 def RunSteps(api, project, manifest, remote, packages):
-  api.jiri.ensure_jiri()
-  api.go.ensure_go()
-  api.gsutil.ensure_gsutil()
+  with api.cipd.preload():
+    api.jiri.ensure_jiri()
+    api.go.ensure_go()
+    api.gsutil.ensure_gsutil()
 
   build_input = api.buildbucket.build.input
 
@@ -103,7 +113,7 @@ def RunSteps(api, project, manifest, remote, packages):
 
   gopath = api.path['start_dir'].join('go')
   path = api.jiri.project([project]).json.output[0]['path']
-  staging_dir = api.path.mkdtemp('tools')
+  pkg_defs = []
 
   with api.context(cwd=api.path.abs_to_path(path), env={'GOPATH': gopath}):
     # Run all the tests.
@@ -117,12 +127,18 @@ def RunSteps(api, project, manifest, remote, packages):
             output = pkg.split('/')[-1]
 
             # Build the package.
+            staging_dir = api.path.mkdtemp(output)
             api.go('build', '-o', staging_dir.join(output), pkg)
 
-            # Upload the package to CIPD.
+            # Stage the package for upload to CIPD.
             if not api.properties.get('tryjob', False):
-              upload_package(api, output, platform, staging_dir, revision,
-                             remote)
+              pkg_def = package_definition(api, output, platform, staging_dir,
+                                           revision)
+              if pkg_def:
+                pkg_defs.append(pkg_def)
+
+  if pkg_defs:
+    upload_packages(api, pkg_defs, revision, remote)
 
 
 def GenTests(api):
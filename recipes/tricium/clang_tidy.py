@@ -56,27 +56,21 @@ def RunSteps(api, project, manifest, checks):
   checkout_dir = api.path['start_dir'].join(project)
   compile_commands = api.clang_tidy.gen_compile_commands(checkout_dir)
 
-  errors = []
-  with api.step.nest('clang-tidy'):
-    for f in api.tricium.paths:
-      errors.append(api.clang_tidy.run(f, f, compile_commands, checks))
-
-  # We iterate through all produced error sets...
-  for path_errors in errors:
-    # ...and iterate through all checks that had errors...
-    for check in path_errors:
-      # ...and for each check, iterate through all the errors it produced...
-      for err in path_errors[check]:
-        # ...and extract the information from that error for a comment.
-        sline, schar = api.clang_tidy.get_line_from_offset(
-            err['FilePath'], err['FileOffset'])
-        api.tricium.add_comment(
-            'ClangTidy/%s' % err['DiagnosticName'],
-            '%s: %s' % (err['DiagnosticName'], err['Message']),
-            err['FilePath'],
-            start_line=sline,
-            start_char=schar,
-        )
+  errors = api.clang_tidy.run_many('clang-tidy', api.tricium.paths,
+                                   compile_commands, checks)
+
+  # We iterate through all checks that had errors...
+  for check in errors:
+    # ...and for each check, iterate through all the errors it produced...
+    for err in errors[check]:
+      # ...and extract the information from that error for a comment.
+      api.tricium.add_comment(
+          'ClangTidy/%s' % err['DiagnosticName'],
+          '%s: %s' % (err['DiagnosticName'], err['Message']),
+          err['FilePath'],
+          start_line=err['StartLine'],
+          start_char=err['StartChar'],
+      )
 
   api.tricium.write_comments()
 
@@ -95,6 +89,8 @@ newline output
 
   has_errors_json = [{
       'FileOffset': 1,
+      'StartLine': 1,
+      'StartChar': 1,
       'DiagnosticName': 'fuchsia-default',
       'Message': 'error',
       'FilePath': 'path/to/file'
@@ -107,7 +103,4 @@ newline output
           repository='https://fuchsia.googlesource.com/topaz',
           ref='HEAD',
           paths=['path/to/file', 'other/path/to/file']) + api.step_data(
-              'clang-tidy.path/to/file.load yaml', stdout=api.json.output('')) +
-         api.step_data(
-             'clang-tidy.other/path/to/file.load yaml',
-             stdout=api.json.output(has_errors_json)))
+              'clang-tidy.load yaml', stdout=api.json.output(has_errors_json)))
@@ -20,8 +20,17 @@ DEPS = [
 
 TARGETS = ['arm64', 'x64']
 
+PROPERTIES = {
+    'relevant_projects':
+        Property(
+            kind=List(basestring),
+            help='Jiri projects libwebkit.so depends on; if set, the build '
+            'ends early when none of them changed',
+            default=None),
+}
 
-def RunSteps(api):
+
+def RunSteps(api, relevant_projects):
   api.gitiles.ensure_gitiles()
 
   build = api.buildbucket.build
@@ -34,6 +43,9 @@ def RunSteps(api):
       manifest='webkit',
       remote='https://fuchsia.googlesource.com/manifest',
   )
+  if relevant_projects and not api.fuchsia.has_relevant_changes(
+      checkout, relevant_projects):
+    return
 
   # For historical reasons, webview prebuilts use a hash of the snapshot file
   # as a GCS path component: this ensured that the binaries are versioned by
@@ -97,3 +109,19 @@ def GenTests(api):
       clear_default_properties=True,
       tryjob=True,
   )
+  yield api.fuchsia.test(
+      'ci_nothing_relevant_changed',
+      clear_default_properties=True,
+      properties={
+          'relevant_projects': ['third_party/webkit'],
+          '$infra/fuchsia': {
+              'snapshot_gcs_bucket': '###fuchsia-snapshots###',
+          },
+      },
+  )
+  yield api.fuchsia.test(
+      'cq_relevant_projects',
+      clear_default_properties=True,
+      tryjob=True,
+      properties={'relevant_projects': ['third_party/webkit']},
+  )